@@ -2,29 +2,61 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from config import Config
 
 db = SQLAlchemy()
 jwt = JWTManager()
 
 def create_app():
+    # Import dopiero tutaj: skrypty z app/utils ustawiają zmienne środowiskowe
+    # (DATABASE_URL itp.) po imporcie pakietu app, ale przed create_app()
+    from config import Config
+
     app = Flask(__name__)
     app.config.from_object(Config)
 
+    # jsonify przez orjson, jeśli jest zainstalowany
+    from app.utils.json_provider import FastJSONProvider
+    app.json = FastJSONProvider(app)
+    # Wcięcia tylko na życzenie (JSON_PRETTY), nie automatycznie w trybie debug
+    app.json.compact = not app.config['JSON_PRETTY']
+
     db.init_app(app)
     jwt.init_app(app)
     CORS(app)
 
     with app.app_context():
-        from app.models import user, device, measurement
+        # PRAGMA profilu SQLite muszą być podpięte przed pierwszym połączeniem
+        from app.utils import storage
+        storage.init_app(app, db.engine)
+
+        from app.models import user, device, measurement, sensor_type, measurement_rollup, archive_chunk, trip, alert
         db.create_all()
 
+        from app.utils.migrations import run_migrations
+        run_migrations()
+
+        # Pamięci podręczne: urządzenia (ingest MQTT w procesie API), wyniki statystyk, typy czujników
+        from app.utils.device_registry import device_registry
+        from app.utils.stats_cache import stats_cache
+        from app.utils.live_hub import live_hub
+        from app.utils.sensor_types import sensor_types
+        device_registry.configure(app)
+        stats_cache.configure(app)
+        live_hub.configure(app)
+        sensor_types.configure(app)
+
+        # Metryki: czasy żądań wszystkich blueprintów i zapytań SQL
+        from app.utils import metrics
+        metrics.init_app(app, db.engine)
+
     from app.routes.auth_routes import auth_bp
     from app.routes.device_routes import device_bp
     from app.routes.stats_routes import stats_bp
+    from app.routes.metrics_routes import metrics_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(device_bp)
     app.register_blueprint(stats_bp)
+    app.register_blueprint(metrics_bp)
 
     return app
\ No newline at end of file
@@ -1,15 +1,25 @@
+import csv
+import io
+import json
 from sqlalchemy import func
 from app import db
 from app.models.device import Device
+from app.models.alert import Alert
 from app.utils.mqtt_helper import publish_config_update
-from app.models.measurement import Measurement
+from app.utils.device_registry import device_registry
+from app.utils.last_seen import last_seen_tracker
+from app.utils.sensor_types import sensor_types
+from app.utils import measurement_store
+from app.utils import rollups
+from app.utils import downsample
 from datetime import datetime
 
 def get_user_devices(user_id):
     devices = Device.query.filter_by(user_id=user_id).all()
     return [{
         "mac_address": d.mac_address,
-        "last_seen": d.last_seen,
+        # Worker MQTT w tym samym procesie może mieć świeższy czas niż baza
+        "last_seen": last_seen_tracker.merge(d.id, d.last_seen),
         "friendly_name": d.friendly_name,
         "config_interval": d.config_interval,
         "config_threshold": d.config_threshold
@@ -41,6 +51,7 @@ def update_device_friendly_name(mac_address, user_id, new_name):
 
     try:
         db.session.commit()
+        device_registry.invalidate(mac_address)
         return {
             "id": device.id,
             "mac_address": device.mac_address,
@@ -63,6 +74,7 @@ def claim_device_logic(user_id, mac_address):
             
             db.session.add(new_device)
             db.session.commit()
+            device_registry.invalidate(mac_address)
             
             return {
                 "message": "Utworzono nowe urządzenie i przypisano do konta.",
@@ -87,6 +99,7 @@ def claim_device_logic(user_id, mac_address):
     
     try:
         db.session.commit()
+        device_registry.invalidate(mac_address)
         return {
             "message": "Sukces! Przypisano istniejące urządzenie do Twojego konta.",
             "mac_address": mac_address,
@@ -108,44 +121,204 @@ def update_config_logic(user_id, mac_address, interval, threshold):
     if interval is not None: device.config_interval = interval
     if threshold is not None: device.config_threshold = threshold
     db.session.commit()
+    device_registry.invalidate(mac_address)
     
     # Wysłanie do ESP32
     publish_config_update(mac_address, device.config_interval, device.config_threshold)
     
     return {"message": "Konfiguracja zaktualizowana i wysłana"}
 
-def get_device_measurements(device_id, requesting_user_id, start_date=None, end_date=None):
+def build_measurements_query(device_id, user_id, start_ts=None, end_ts=None):
+    """
+    Zapytania o pomiary urządzenia - po jednym na tabelę/partycję w zakresie
+    (indeks ix_*_device_time). Używane też przez app/utils/check_query_plans.py.
+    """
+    return measurement_store.row_selects(device_id, user_id, start_ts, end_ts, limit=5000)
+
+def get_device_measurements(device_id, requesting_user_id, start_date=None, end_date=None, limit=5000):
     """
     Pobiera pomiary. 
     """
     
-    query = Measurement.query.filter_by(
-        device_id=device_id, 
-        user_id=requesting_user_id
-    )
-
-    if start_date:
-        start_ts = int(start_date.timestamp())
-        query = query.filter(Measurement.timestamp >= start_ts)
+    start_ts = int(start_date.timestamp()) if start_date else None
+    end_ts = int(end_date.timestamp()) if end_date else None
 
-    if end_date:
-        end_ts = int(end_date.timestamp())
-        query = query.filter(Measurement.timestamp <= end_ts)
-
-    measurements = query.order_by(Measurement.timestamp.asc()).limit(5000).all()
+    measurements = measurement_store.iter_rows(device_id, requesting_user_id, start_ts, end_ts, limit=limit)
     
     results = []
+    names = {}
     for m in measurements:
         ts_value = datetime.fromtimestamp(m.timestamp).isoformat()
+        name = names.get(m.sensor_type_id)
+        if name is None:
+            name = names[m.sensor_type_id] = sensor_types.get_name(m.sensor_type_id)
         
         results.append({
             "timestamp": ts_value,
             "value": m.value,
-            "sensor_type": m.sensor_type,
-            "received_at": m.received_at.isoformat() if m.received_at else None
+            "sensor_type": name,
+            "received_at": datetime.utcfromtimestamp(m.received_at).isoformat() if m.received_at else None
         })
 
     return results
+
+def get_device_measurements_columnar(device_id, requesting_user_id, start_date=None, end_date=None, limit=5000):
+    """
+    Te same pomiary co get_device_measurements w układzie kolumnowym:
+    {"ts": [epoch], "value": [...], "sensor": [...], "received_at": [epoch albo null]}.
+    Bez formatowania dat i słownika na każdy wiersz - przy dużych zakresach
+    to one dominowały czas odpowiedzi.
+    """
+    start_ts = int(start_date.timestamp()) if start_date else None
+    end_ts = int(end_date.timestamp()) if end_date else None
+
+    rows = measurement_store.iter_rows(device_id, requesting_user_id, start_ts, end_ts, limit=limit)
+    columns = list(zip(*rows)) or [(), (), (), ()]
+    timestamps, values, type_ids, received = columns
+    names = {type_id: sensor_types.get_name(type_id) for type_id in set(type_ids)}
+    return {
+        "ts": list(timestamps),
+        "value": list(values),
+        "sensor": [names[type_id] for type_id in type_ids],
+        "received_at": list(received),
+    }
+
+# lttb wybiera punkty z serii co najmniej tyle razy gęstszej niż max_points
+LTTB_OVERSAMPLING = 4
+
+def _chart_point(ts, value, type_id):
+    return {
+        "timestamp": datetime.fromtimestamp(ts).isoformat(),
+        "value": value,
+        "sensor_type": sensor_types.get_name(type_id),
+        "received_at": None,
+    }
+
+def _raw_series(rows_by_type, rows):
+    for m in rows:
+        series = rows_by_type.get(m.sensor_type_id)
+        if series is None:
+            series = rows_by_type[m.sensor_type_id] = downsample.new_series()
+        series[0].append(m.timestamp)
+        series[1].append(m.value)
+    return rows_by_type
+
+def _downsample_series(device_id, user_id, type_id, start_ts, end_ts, max_points, mode):
+    """Punkty jednej serii: z kubełków measurement_rollups, gdy okno jest długie, inaczej z surowych wierszy."""
+    span = end_ts - start_ts + 1
+    width = span // (max_points // 2) if mode == "minmax" else span // (max_points * LTTB_OVERSAMPLING)
+    resolution = max((s for s in rollups.ROLLUP_RESOLUTIONS if s <= width), default=None)
+
+    if resolution is None or rollups.aggregate_window(device_id, user_id, type_id, start_ts, end_ts).count <= max_points:
+        timestamps, values = measurement_store.fetch_series(device_id, user_id, type_id, start_ts, end_ts)
+        return downsample.downsample(timestamps, values, max_points, mode), "raw"
+
+    buckets, edges = rollups.bucket_rows(device_id, user_id, type_id, start_ts, end_ts, resolution)
+    raw = [m for lo, hi in edges
+           for m in measurement_store.iter_rows(device_id, user_id, lo, hi, sensor_type_id=type_id)]
+
+    if mode == "minmax":
+        result = downsample.MinMaxBuckets(start_ts, end_ts, max_points // 2)
+        for b in buckets:
+            result.add(b.bucket_start, b.value_min, b.value_max)
+        for m in raw:
+            result.add(m.timestamp, m.value, m.value)
+        return result.points(), f"rollup:{resolution}s"
+
+    # lttb na średnich kubełków (punkt w środku kubełka) i surowych brzegach
+    points = [(b.bucket_start + b.bucket_seconds // 2, (b.value_sum + b.value_sum_err) / b.value_count)
+              for b in buckets]
+    points += [(m.timestamp, m.value) for m in raw]
+    points.sort()
+    timestamps, values = downsample.new_series()
+    for ts, value in points:
+        timestamps.append(ts)
+        values.append(value)
+    return downsample.downsample(timestamps, values, max_points, mode), f"rollup:{resolution}s"
+
+def get_downsampled_measurements(device_id, requesting_user_id, start_date=None, end_date=None,
+                                 max_points=1000, mode="lttb", columnar=False):
+    """
+    Pomiary do wykresu: najwyżej max_points punktów na typ czujnika (lttb albo minmax).
+    Zwraca (lista pomiarów w formacie get_device_measurements albo kolumny jak
+    get_device_measurements_columnar, {typ: źródło i liczba punktów}).
+    """
+    start_ts = int(start_date.timestamp()) if start_date else None
+    end_ts = int(end_date.timestamp()) if end_date else None
+
+    per_type = {}
+    series = rollups.series_types(device_id, requesting_user_id, start_ts, end_ts)
+    if series:
+        for type_id, (first, last) in series.items():
+            lo = first if start_ts is None else max(start_ts, first)
+            hi = last if end_ts is None else min(end_ts, last)
+            per_type[type_id] = _downsample_series(device_id, requesting_user_id, type_id, lo, hi, max_points, mode)
+    else:
+        # Brak kubełków (np. baza sprzed measurement_rollups) - jeden przebieg po surowych wierszach
+        rows = measurement_store.iter_rows(device_id, requesting_user_id, start_ts, end_ts, batch_size=5000)
+        for type_id, (timestamps, values) in _raw_series({}, rows).items():
+            per_type[type_id] = (downsample.downsample(timestamps, values, max_points, mode), "raw")
+
+    merged = sorted(
+        (ts, type_id, value)
+        for type_id, (points, _) in per_type.items()
+        for ts, value in points
+    )
+    info = {
+        sensor_types.get_name(type_id): {"source": source, "points": len(points)}
+        for type_id, (points, source) in per_type.items()
+    }
+    if columnar:
+        return {
+            "ts": [ts for ts, _, _ in merged],
+            "value": [value for _, _, value in merged],
+            "sensor": [sensor_types.get_name(type_id) for _, type_id, _ in merged],
+            "received_at": [None] * len(merged),
+        }, info
+    return [_chart_point(ts, value, type_id) for ts, type_id, value in merged], info
+
+EXPORT_FIELDS = ("timestamp", "value", "sensor_type", "received_at")
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def _export_record(m):
+    return (
+        datetime.fromtimestamp(m.timestamp).isoformat(),
+        m.value,
+        sensor_types.get_name(m.sensor_type_id),
+        datetime.utcfromtimestamp(m.received_at).isoformat() if m.received_at else None,
+    )
+
+def export_device_measurements(device_id, requesting_user_id, start_date=None, end_date=None,
+                               fmt="ndjson", batch_size=5000):
+    """
+    Eksport pomiarów bez limitu wierszy: generator kolejnych fragmentów pliku
+    (NDJSON albo CSV), po batch_size wierszy. Wiersze są czytane kursorem
+    paczkami, więc pamięć nie zależy od długości zakresu.
+    """
+    start_ts = int(start_date.timestamp()) if start_date else None
+    end_ts = int(end_date.timestamp()) if end_date else None
+    rows = measurement_store.iter_rows(device_id, requesting_user_id, start_ts, end_ts, batch_size=batch_size)
+
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(EXPORT_FIELDS)
+        write = lambda m: writer.writerow(_export_record(m))
+    else:
+        encode = json.JSONEncoder(separators=(",", ":")).encode
+        write = lambda m: buffer.write(encode(dict(zip(EXPORT_FIELDS, _export_record(m)))) + "\n")
+
+    pending = 0
+    for m in rows:
+        write(m)
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
     
 def unbind_device_logic(user_id, mac_address):
     device = Device.query.filter_by(mac_address=mac_address).first()
@@ -160,5 +333,21 @@ def unbind_device_logic(user_id, mac_address):
     device.friendly_name = None 
     
     db.session.commit()
+    device_registry.invalidate(mac_address)
     
-    return {"message": "Urządzenie zostało odłączone. Teraz inny użytkownik może je dodać."}, 200
\ No newline at end of file
+    return {"message": "Urządzenie zostało odłączone. Teraz inny użytkownik może je dodać."}, 200
+
+def get_device_alerts(device_id, user_id, limit=100):
+    """Ostatnie alerty urządzenia wykryte przy ingeście (najnowsze najpierw)."""
+    alerts = (
+        Alert.query.filter_by(device_id=device_id, user_id=user_id)
+        .order_by(Alert.timestamp.desc()).limit(limit).all()
+    )
+    return [{
+        "rule": a.rule,
+        "sensor_type": sensor_types.get_name(a.sensor_type_id),
+        "value": a.value,
+        "threshold": a.threshold,
+        "timestamp": datetime.fromtimestamp(a.timestamp).isoformat(),
+        "latency_ms": round(a.latency_ms, 2) if a.latency_ms is not None else None,
+    } for a in alerts]
@@ -1,55 +1,78 @@
+from flask import current_app
 from app import db
-from app.models.measurement import Measurement
-from sqlalchemy import func, case
+from app.utils.sensor_types import sensor_types, ADXL345, MAX6675_NORMAL
+from app.utils import measurement_store
+from app.utils import rollups
+from app.utils import distribution
+from app.utils import fleet_report
+from app.utils.series_aggregate import SeriesAggregate
+from app.models.device import Device
+from app.models.trip import Trip
+from sqlalchemy import func, case, select
+from datetime import datetime
+import time
 
-def analyze_acceleration(device_id, user_id, start_date, end_date):
+def build_acceleration_query(device_id, user_id, start_ts, end_ts):
     """
-    Analizuje styl jazdy w zadanym przedziale czasowym.
+    Zapytanie agregujące surowe odczyty ADXL345 ze wszystkich partycji w zakresie
+    (indeks ix_*_series). analyze_acceleration korzysta z measurement_rollups;
+    to zapytanie jest wynikiem wzorcowym dla app/utils/check_rollups.py
+    i jest sprawdzane przez app/utils/check_query_plans.py.
     """
-    
-    # Walidacja danych wejściowych
-    if not start_date or not end_date:
-        raise ValueError("Daty start_date i end_date są wymagane!")
-    
-    if start_date > end_date:
-        raise ValueError("Data początkowa nie może być późniejsza niż końcowa")
-
-    # Obliczamy liczbę dni (min 1)
-    duration_days = (end_date - start_date).days
-    if duration_days < 1:
-        duration_days = 1
-
-    # 1. Filtry
-    filters = [
-        Measurement.device_id == device_id,
-        Measurement.user_id == user_id,
-        Measurement.sensor_type == 'ADXL345',
-        Measurement.timestamp >= int(start_date.timestamp()),
-        Measurement.timestamp <= int(end_date.timestamp())
-    ]
+    # 1. Filtry (w każdej gałęzi UNION-a po partycjach)
+    series = measurement_store.series_subquery(
+        device_id, user_id, start_ts, end_ts,
+        sensor_type_id=sensor_types.get_id(ADXL345)
+    )
 
     # 2. Zapytanie do bazy
     # POPRAWKA: Usuwamy [], ale zostawiamy dodatkowe nawiasy () wokół pary (WARUNEK, WARTOŚĆ)
     # case( (warunek, wartość), else_=0 )
     
-    stats = Measurement.query.with_entities(
-        func.count(Measurement.id).label('total'),
+    return select(
+        func.count().label('total'),
         
         # Ostre manewry (1.25g - 2.5g)
         func.sum(case(
-            ((Measurement.value > 12.26) & (Measurement.value <= 24.52), 1), 
+            ((series.c.value > rollups.HARSH_MIN) & (series.c.value <= rollups.CRASH_MIN), 1), 
             else_=0
         )).label('harsh'),
 
         # Zderzenia / Wypadki (> 2.5g)
         func.sum(case(
-            (Measurement.value > 24.52, 1), 
+            (series.c.value > rollups.CRASH_MIN, 1), 
             else_=0
         )).label('crash')
-    ).filter(*filters).first()
+    ).select_from(series)
+
+def analyze_acceleration(device_id, user_id, start_date, end_date):
+    """
+    Analizuje styl jazdy w zadanym przedziale czasowym.
+    """
+    
+    # Walidacja danych wejściowych
+    if not start_date or not end_date:
+        raise ValueError("Daty start_date i end_date są wymagane!")
+    
+    if start_date > end_date:
+        raise ValueError("Data początkowa nie może być późniejsza niż końcowa")
+
+    # 1-2. Pełne kubełki z measurement_rollups + surowe wiersze na brzegach okna
+    stats = rollups.aggregate_window(
+        device_id, user_id, sensor_types.get_id(ADXL345),
+        int(start_date.timestamp()), int(end_date.timestamp())
+    )
+    return _acceleration_result(stats, start_date, end_date)
+
+def _acceleration_result(stats, start_date, end_date):
+    """Ocena stylu jazdy z agregatu odczytów ADXL345 (SeriesAggregate) - wspólna dla wszystkich endpointów."""
+    # Obliczamy liczbę dni (min 1)
+    duration_days = (end_date - start_date).days
+    if duration_days < 1:
+        duration_days = 1
 
     # 3. Obsługa braku wyników
-    total_readings = stats.total if stats else 0
+    total_readings = stats.count
     if total_readings == 0:
         return {
             "score": 100,
@@ -63,9 +86,8 @@ def analyze_acceleration(device_id, user_id, start_date, end_date):
             }
         }
 
-    # Konwersja na int (SQLAlchemy może zwrócić Decimal lub None)
-    harsh_maneuvers = int(stats.harsh or 0)
-    crashes = int(stats.crash or 0)
+    harsh_maneuvers = stats.harsh
+    crashes = stats.crash
 
     # 4. Obliczanie statystyk DZIENNYCH
     avg_harsh_per_day = harsh_maneuvers / duration_days
@@ -97,6 +119,31 @@ def _get_interpretation(score):
 
 
 
+def build_engine_temperature_query(device_id, user_id, start_ts, end_ts, min_value=None):
+    """
+    Zapytanie agregujące surowe odczyty MAX6675_NORMAL ze wszystkich partycji w zakresie
+    (indeks ix_*_series). Wzorzec w app/utils/check_rollups.py i w check_query_plans.py.
+    """
+    # 1. Filtry podstawowe (+ próg temperatury w każdej gałęzi)
+    extra_filters = None
+    if min_value is not None:
+        extra_filters = lambda table: [table.c.value > float(min_value)]
+
+    series = measurement_store.series_subquery(
+        device_id, user_id, start_ts, end_ts,
+        sensor_type_id=sensor_types.get_id(MAX6675_NORMAL),
+        extra_filters=extra_filters
+    )
+
+    # 2. Zapytanie agregujące
+    return select(
+        func.count().label('total'),
+        func.avg(series.c.value).label('avg_temp'),
+        func.max(series.c.value).label('max_temp'),
+        func.min(series.c.value).label('min_temp'),
+        func.sum(series.c.value).label('sum_temp'),
+    ).select_from(series)
+
 def analyze_engine_temperature(device_id, user_id, start_date, end_date, min_value=None):
     """
     Analizuje temperaturę, biorąc pod uwagę tylko odczyty > min_value.
@@ -108,32 +155,30 @@ def analyze_engine_temperature(device_id, user_id, start_date, end_date, min_val
     if start_date > end_date:
         raise ValueError("Data początkowa nie może być późniejsza niż końcowa")
 
-    # 1. Filtry podstawowe
-    filters = [
-        Measurement.device_id == device_id,
-        Measurement.user_id == user_id,
-        Measurement.sensor_type == 'MAX6675_NORMAL',
-        Measurement.timestamp >= int(start_date.timestamp()),
-        Measurement.timestamp <= int(end_date.timestamp())
-    ]
+    start_ts, end_ts = int(start_date.timestamp()), int(end_date.timestamp())
 
-    if min_value is not None:
-        filters.append(Measurement.value > float(min_value))
+    if min_value is None:
+        # Pełne kubełki z measurement_rollups + surowe wiersze na brzegach okna
+        window = rollups.aggregate_window(
+            device_id, user_id, sensor_types.get_id(MAX6675_NORMAL), start_ts, end_ts
+        )
+    else:
+        # Próg: surowe odczyty > min_value z bazy i archiwum kolumnowego (kubełki progu nie znają)
+        temp_id = sensor_types.get_id(MAX6675_NORMAL)
+        window = rollups.aggregate_window_grouped(
+            [device_id], user_id, [temp_id], start_ts, end_ts, {temp_id: float(min_value)}
+        ).get((device_id, temp_id), SeriesAggregate())
+    return _engine_temperature_result(window, min_value)
 
-    # 3. Zapytanie agregujące
-    stats = Measurement.query.with_entities(
-        func.count(Measurement.id).label('total'),
-        func.avg(Measurement.value).label('avg_temp'),
-        func.max(Measurement.value).label('max_temp'),
-    ).filter(*filters).first()
+def _engine_temperature_result(window, min_value):
+    """Podsumowanie temperatury z agregatu odczytów MAX6675_NORMAL (None, gdy brak odczytów)."""
+    total_readings, avg_temp, max_temp = window.count, window.avg, window.maximum
 
-    total_readings = stats.total if stats else 0
-    
     if total_readings == 0:
         return None 
 
-    avg_temp = float(stats.avg_temp or 0)
-    max_temp = float(stats.max_temp or 0)
+    avg_temp = float(avg_temp or 0)
+    max_temp = float(max_temp or 0)
 
     return {
         "avg_temp": round(avg_temp, 1),
@@ -141,3 +186,168 @@ def analyze_engine_temperature(device_id, user_id, start_date, end_date, min_val
         "total_readings": total_readings,
         "threshold_used": min_value,
     }
+
+
+def analyze_dashboard(user_id, devices, start_date, end_date, min_value=None):
+    """
+    Ocena stylu jazdy i temperatura silnika dla wszystkich urządzeń użytkownika naraz.
+    Agregaty wszystkich urządzeń i obu typów czujników pochodzą z zapytań grupowanych
+    (GROUP BY device_id, sensor_type_id), a nie z 2 zapytań na każde urządzenie;
+    wynik dla urządzenia ma ten sam kształt co analyze_acceleration / analyze_engine_temperature.
+    """
+    if not start_date or not end_date:
+        raise ValueError("Daty start_date i end_date są wymagane!")
+    if start_date > end_date:
+        raise ValueError("Data początkowa nie może być późniejsza niż końcowa")
+
+    start_ts, end_ts = int(start_date.timestamp()), int(end_date.timestamp())
+    adxl_id, temp_id = sensor_types.get_id(ADXL345), sensor_types.get_id(MAX6675_NORMAL)
+    device_ids = [d.id for d in devices]
+
+    # Próg temperatury - kubełki go nie znają, jeden skan surowych wierszy wszystkich urządzeń
+    thresholds = {temp_id: float(min_value)} if min_value is not None else None
+    windows = rollups.aggregate_window_grouped(device_ids, user_id, [adxl_id, temp_id], start_ts, end_ts, thresholds)
+
+    return [{
+        "mac_address": d.mac_address,
+        "friendly_name": d.friendly_name,
+        "acceleration": _acceleration_result(windows.get((d.id, adxl_id), SeriesAggregate()), start_date, end_date),
+        "engine_temp": _engine_temperature_result(windows.get((d.id, temp_id), SeriesAggregate()), min_value),
+    } for d in devices]
+
+
+def analyze_distribution(device_id, user_id, sensor_type_name, start_date, end_date, bins, quantiles, max_gap):
+    """
+    Rozkład odczytów jednego typu czujnika w zadanym przedziale: kwantyle, histogram
+    i tempo zmian (jerk dla ADXL345) - do strojenia progów alertów. None, gdy brak odczytów.
+    """
+    if not start_date or not end_date:
+        raise ValueError("Daty start_date i end_date są wymagane!")
+    if start_date > end_date:
+        raise ValueError("Data początkowa nie może być późniejsza niż końcowa")
+
+    sensor_type_id = sensor_types.get_id(sensor_type_name)
+    if sensor_type_id is None:
+        raise ValueError(f"Nieznany typ czujnika: {sensor_type_name}")
+
+    timestamps, values = distribution.fetch_series(
+        device_id, user_id, sensor_type_id, int(start_date.timestamp()), int(end_date.timestamp())
+    )
+    result = distribution.describe(timestamps, values, bins, quantiles, max_gap)
+    if result is not None:
+        result["sensor_type"] = sensor_type_name
+        result["max_gap_seconds"] = max_gap
+    return result
+
+
+def get_device_trips(device_id, user_id, start_date, end_date, gap_seconds, limit=100):
+    """
+    Jazdy urządzenia nachodzące na zadany przedział (najnowsze najpierw) z podsumowaniem
+    i oceną stylu jazdy liczoną dla każdej jazdy osobno (kary jak w analyze_acceleration).
+    """
+    if not start_date or not end_date:
+        raise ValueError("Daty start_date i end_date są wymagane!")
+    if start_date > end_date:
+        raise ValueError("Data początkowa nie może być późniejsza niż końcowa")
+
+    trips = (
+        Trip.query.filter(
+            Trip.device_id == device_id, Trip.user_id == user_id,
+            Trip.start_ts <= int(end_date.timestamp()), Trip.end_ts >= int(start_date.timestamp()),
+        )
+        .order_by(Trip.start_ts.desc()).limit(limit).all()
+    )
+
+    now = time.time()
+    result = []
+    for trip in trips:
+        score = max(0, min(100, int(100 - (trip.harsh_count * 15 + trip.crash_count * 50))))
+        result.append({
+            "start": datetime.fromtimestamp(trip.start_ts).isoformat(),
+            "end": datetime.fromtimestamp(trip.end_ts).isoformat(),
+            "duration_seconds": trip.end_ts - trip.start_ts,
+            # Otwarta jazda bez odczytów dłużej niż przerwa kończąca jazdę już się nie toczy
+            "ongoing": not trip.closed and now - trip.end_ts <= gap_seconds,
+            "score": score,
+            "interpretation": _get_interpretation(score),
+            "acceleration": {
+                "total_readings": trip.accel_count,
+                "total_harsh": trip.harsh_count,
+                "total_crashes": trip.crash_count,
+                "max": trip.accel_max,
+            },
+            "engine_temp": {
+                "total_readings": trip.temp_count,
+                "avg_temp": round(trip.temp_sum / trip.temp_count, 1) if trip.temp_count else None,
+                "max_temp": trip.temp_max,
+            },
+        })
+    return result
+
+
+def analyze_fleet(start_date, end_date, min_value=None, workers=1, pool=None):
+    """
+    Ocena stylu jazdy i temperatura silnika wszystkich przypisanych urządzeń (raport
+    administracyjny). Urządzenia i okres są dzielone na części liczone równolegle
+    (app/utils/fleet_report.py), a ich agregaty łączone; wynik dla urządzenia ma
+    ten sam kształt co analyze_acceleration / analyze_engine_temperature.
+    pool: gotowa pula procesów (API), workers: jej rozmiar albo liczba procesów do uruchomienia.
+    """
+    if not start_date or not end_date:
+        raise ValueError("Daty start_date i end_date są wymagane!")
+    if start_date > end_date:
+        raise ValueError("Data początkowa nie może być późniejsza niż końcowa")
+
+    # Statystyki urządzenia liczą tylko odczyty obecnego właściciela
+    devices = Device.query.filter(Device.user_id.isnot(None)).order_by(Device.id).all()
+    owners = {}
+    for d in devices:
+        owners.setdefault(d.user_id, []).append(d.id)
+
+    windows, chunks = fleet_report.fleet_aggregates(
+        owners, int(start_date.timestamp()), int(end_date.timestamp()), min_value,
+        workers=workers, pool=pool,
+        device_chunk=current_app.config['FLEET_DEVICE_CHUNK'],
+        time_chunk_days=current_app.config['FLEET_TIME_CHUNK_DAYS'],
+    )
+
+    adxl_id, temp_id = sensor_types.get_id(ADXL345), sensor_types.get_id(MAX6675_NORMAL)
+    fleet_temp = SeriesAggregate()
+    entries, crashed, scores = [], [], []
+    total_harsh = total_crashes = 0
+    for d in devices:
+        accel = windows.get((d.id, adxl_id), SeriesAggregate())
+        temp = windows.get((d.id, temp_id), SeriesAggregate())
+        fleet_temp.merge(temp)
+        acceleration = _acceleration_result(accel, start_date, end_date)
+        if accel.count:
+            scores.append(acceleration["score"])
+        if accel.crash:
+            crashed.append(d.mac_address)
+        total_harsh += accel.harsh
+        total_crashes += accel.crash
+        entries.append({
+            "mac_address": d.mac_address,
+            "friendly_name": d.friendly_name,
+            "user_id": d.user_id,
+            "acceleration": acceleration,
+            "engine_temp": _engine_temperature_result(temp, min_value),
+        })
+
+    return {
+        "period": {"start": start_date.isoformat(), "end": end_date.isoformat()},
+        "chunks": chunks,
+        "workers": workers,
+        "fleet": {
+            "devices": len(devices),
+            "devices_with_data": sum(1 for e in entries
+                                     if e["acceleration"]["stats"]["total_readings"] or e["engine_temp"]),
+            "crashed_devices": crashed,
+            "total_harsh": total_harsh,
+            "total_crashes": total_crashes,
+            "avg_score": round(sum(scores) / len(scores), 1) if scores else None,
+            # Średnia ze wszystkich odczytów floty, nie średnia średnich urządzeń
+            "engine_temp": _engine_temperature_result(fleet_temp, min_value),
+        },
+        "devices": entries,
+    }
@@ -0,0 +1,27 @@
+from app import db
+import time
+
+class Alert(db.Model):
+    """
+    Alert wykryty przy ingeście (app/utils/alerts.py) i wysłany do urządzenia
+    na temat user/<mac>/alerts.
+    """
+    __tablename__ = 'alerts'
+    __table_args__ = (
+        # Lista alertów urządzenia od najnowszych
+        db.Index('ix_alerts_device_time', 'device_id', 'user_id', 'timestamp'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey('devices.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    rule = db.Column(db.String(32), nullable=False)  # crash | threshold | engine_temp
+    sensor_type_id = db.Column(db.SmallInteger, db.ForeignKey('sensor_types.id'), nullable=False)
+    value = db.Column(db.Float, nullable=False)
+    threshold = db.Column(db.Float, nullable=False)
+    timestamp = db.Column(db.Integer, nullable=False)  # czas odczytu (z urządzenia)
+
+    # Od odebrania wiadomości MQTT do wysłania alertu [ms]; NULL, gdy publikacja się nie udała
+    latency_ms = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.Integer, default=lambda: int(time.time()))
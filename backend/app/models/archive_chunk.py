@@ -0,0 +1,28 @@
+from app import db
+import time
+
+class ArchiveChunk(db.Model):
+    """
+    Manifest archiwum: jeden plik kolumnowy z pomiarami jednej serii
+    (urządzenie/właściciel/typ czujnika) z zakresu [start_ts, end_ts).
+    Pliki zapisuje i czyta app/utils/archive.py.
+    """
+    __tablename__ = 'archive_chunks'
+    __table_args__ = (
+        # Odczyt: pliki serii nachodzące na zakres dat
+        db.Index('ix_archive_chunks_series', 'device_id', 'user_id', 'sensor_type_id', 'start_ts'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    sensor_type_id = db.Column(db.SmallInteger, nullable=False)
+
+    start_ts = db.Column(db.Integer, nullable=False)
+    end_ts = db.Column(db.Integer, nullable=False)  # wyłącznie
+    row_count = db.Column(db.Integer, nullable=False)
+
+    # Ścieżka względem ARCHIVE_DIR
+    path = db.Column(db.String(255), nullable=False, unique=True)
+    file_bytes = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.Integer, default=lambda: int(time.time()))
@@ -1,15 +1,25 @@
 from app import db
-from datetime import datetime
+import time
 
 class Measurement(db.Model):
     __tablename__ = 'measurements'
+    __table_args__ = (
+        # Statystyki (stats_controller): równości po urządzeniu/właścicielu/typie,
+        # zakres po czasie; value w indeksie = agregaty bez sięgania do tabeli
+        db.Index('ix_measurements_series', 'device_id', 'user_id', 'sensor_type_id', 'timestamp', 'value'),
+        # Lista pomiarów (get_device_measurements): wszystkie typy, sortowanie po czasie
+        db.Index('ix_measurements_device_time', 'device_id', 'user_id', 'timestamp'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     device_id = db.Column(db.Integer, db.ForeignKey('devices.id'), nullable=False)
     
+    # Właściciel w chwili pomiaru - nowy właściciel urządzenia nie widzi historii poprzedniego
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     
-    sensor_type = db.Column(db.String(50), nullable=False)
+    # Słownik sensor_types zamiast powtarzanego w każdym wierszu napisu
+    sensor_type_id = db.Column(db.SmallInteger, db.ForeignKey('sensor_types.id'), nullable=False)
     value = db.Column(db.Float, nullable=False)
     timestamp = db.Column(db.Integer, nullable=False)
-    received_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    # Czas odebrania przez serwer (epoch, UTC)
+    received_at = db.Column(db.Integer, default=lambda: int(time.time()))
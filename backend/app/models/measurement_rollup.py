@@ -0,0 +1,28 @@
+from app import db
+
+class MeasurementRollup(db.Model):
+    """
+    Agregat pomiarów jednego urządzenia/właściciela/typu czujnika w kubełku czasu
+    (bucket_seconds = 60, 3600 lub 86400). Aktualizowany przez writer razem
+    z zapisem surowych wierszy - patrz app/utils/rollups.py.
+    """
+    __tablename__ = 'measurement_rollups'
+
+    # Klucz główny w kolejności zapytań: równości po serii i rozdzielczości, zakres po bucket_start
+    device_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    sensor_type_id = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    bucket_seconds = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    bucket_start = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    value_count = db.Column(db.Integer, nullable=False)
+    value_sum = db.Column(db.Float, nullable=False)
+    # Reszta sumy, której nie mieści value_sum (suma = value_sum + value_sum_err) - dokładna
+    # suma niezależnie od kolejności dopisywania odczytów, patrz SeriesAggregate
+    value_sum_err = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    value_min = db.Column(db.Float, nullable=False)
+    value_max = db.Column(db.Float, nullable=False)
+
+    # Progi z analyze_acceleration (ostre manewry / zderzenia)
+    harsh_count = db.Column(db.Integer, nullable=False)
+    crash_count = db.Column(db.Integer, nullable=False)
@@ -0,0 +1,7 @@
+from app import db
+
+class SensorType(db.Model):
+    __tablename__ = 'sensor_types'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
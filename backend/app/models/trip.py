@@ -0,0 +1,44 @@
+from app import db
+
+class Trip(db.Model):
+    """
+    Jedna jazda urządzenia: odczyty od pierwszego po przerwie (albo po ponownym
+    rozruchu silnika) do ostatniego przed przerwą / zgaszeniem silnika.
+    Wyznaczana przyrostowo przez writer - patrz app/utils/trips.py.
+    """
+    __tablename__ = 'trips'
+
+    # Klucz jak w measurement_rollups: seria + początek jazdy (zapytania po zakresie dat)
+    device_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    start_ts = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    end_ts = db.Column(db.Integer, nullable=False)  # ostatni odczyt jazdy
+    closed = db.Column(db.Boolean, nullable=False, default=False)
+
+    # ADXL345 - progi jak w analyze_acceleration
+    accel_count = db.Column(db.Integer, nullable=False, default=0)
+    accel_max = db.Column(db.Float, nullable=True)
+    harsh_count = db.Column(db.Integer, nullable=False, default=0)
+    crash_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # MAX6675_NORMAL
+    temp_count = db.Column(db.Integer, nullable=False, default=0)
+    temp_sum = db.Column(db.Float, nullable=False, default=0.0)
+    temp_max = db.Column(db.Float, nullable=True)
+
+
+class TripState(db.Model):
+    """
+    Stan wykrywania jazd jednej serii (urządzenie/właściciel) między paczkami writera:
+    ostatni odczyt, otwarta jazda, nagrzany silnik, postój ze zgaszonym silnikiem.
+    """
+    __tablename__ = 'trip_states'
+
+    device_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    last_ts = db.Column(db.Integer, nullable=False)
+    trip_start_ts = db.Column(db.Integer, nullable=True)  # otwarta jazda (trips.start_ts)
+    engine_hot = db.Column(db.Boolean, nullable=False, default=False)
+    parked_min_temp = db.Column(db.Float, nullable=True)  # postój: najniższa temperatura od zgaszenia
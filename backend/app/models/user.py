@@ -8,6 +8,8 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Dostęp do raportu floty (/api/stats/fleet) - ustawia tylko operator: python -m app.utils.admins
+    is_admin = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     
     # Relacja
     devices = db.relationship('Device', backref='owner', lazy=True)
\ No newline at end of file
@@ -1,7 +1,13 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from app.controllers.device_controller import get_user_devices, claim_device_logic, update_config_logic, unbind_device_logic
 from app.controllers.device_controller import get_device_measurements, update_device_friendly_name
+from app.controllers.device_controller import export_device_measurements, EXPORT_FORMATS
+from app.controllers.device_controller import get_downsampled_measurements, get_device_measurements_columnar
+from app.controllers.device_controller import get_device_alerts
+from app.utils.downsample import MODES as DOWNSAMPLE_MODES
+from app.utils.live_hub import live_hub
+from app.utils.sensor_types import sensor_types
 from app.models.device import Device
 from datetime import datetime
 import logging
@@ -120,10 +126,135 @@ def get_measurements(mac_address):
     except ValueError:
         return jsonify({"error": "Nieprawidłowy format daty. Użyj formatu ISO (YYYY-MM-DD)"}), 400
 
-    data = get_device_measurements(device.id, current_user_id, start_date, end_date)
+    # format=columnar: {"ts": [...], "value": [...], "sensor": [...]} zamiast obiektu na pomiar
+    response_format = request.args.get('format', 'rows')
+    if response_format not in ('rows', 'columnar'):
+        return jsonify({"error": "Nieobsługiwany format. Dostępne: rows, columnar"}), 400
+    columnar = response_format == 'columnar'
+
+    # Wykresy: max_points punktów na typ czujnika zamiast surowych wierszy
+    max_points = request.args.get('max_points')
+    if max_points is not None:
+        mode = request.args.get('mode', 'lttb')
+        limit = current_app.config['DOWNSAMPLE_MAX_POINTS']
+        if not max_points.isdigit() or not 4 <= int(max_points) <= limit:
+            return jsonify({"error": f"max_points musi być liczbą z zakresu 4-{limit}"}), 400
+        if mode not in DOWNSAMPLE_MODES:
+            return jsonify({"error": f"Nieobsługiwany tryb. Dostępne: {', '.join(DOWNSAMPLE_MODES)}"}), 400
+
+        data, info = get_downsampled_measurements(
+            device.id, current_user_id, start_date, end_date, int(max_points), mode, columnar
+        )
+        return jsonify({"success": True, "measurements": data, "downsampling": info}), 200
+
+    if columnar:
+        data = get_device_measurements_columnar(device.id, current_user_id, start_date, end_date)
+    else:
+        data = get_device_measurements(device.id, current_user_id, start_date, end_date)
     
     return jsonify({"success": True, "measurements": data}), 200
 
+@device_bp.route('/<string:mac_address>/measurements/export', methods=['GET'])
+@jwt_required()
+def export_measurements(mac_address):
+    """
+    Endpoint API: GET /api/devices/<MAC>/measurements/export?format=ndjson|csv
+    Cały zakres (start_date/end_date jak w /measurements) bez limitu 5000 wierszy,
+    wysyłany strumieniowo.
+    """
+    current_user_id = get_jwt_identity()
+
+    device = Device.query.filter_by(mac_address=mac_address).first()
+    if not device:
+        return jsonify({"error": "Device not found"}), 404
+
+    if str(device.user_id) != str(current_user_id):
+         return jsonify({"error": "Unauthorized"}), 403
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Nieobsługiwany format. Dostępne: {', '.join(EXPORT_FORMATS)}"}), 400
+
+    try:
+        start_str = request.args.get('start_date')
+        end_str = request.args.get('end_date')
+        start_date = datetime.fromisoformat(start_str) if start_str else None
+        end_date = datetime.fromisoformat(end_str) if end_str else None
+    except ValueError:
+        return jsonify({"error": "Nieprawidłowy format daty. Użyj formatu ISO (YYYY-MM-DD)"}), 400
+
+    chunks = export_device_measurements(
+        device.id, current_user_id, start_date, end_date,
+        fmt=fmt, batch_size=current_app.config['EXPORT_BATCH_SIZE'],
+    )
+    # stream_with_context: sesja bazy żyje do końca wysyłania
+    response = Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{mac_address}_measurements.{fmt}"'
+    return response
+
+@device_bp.route('/<string:mac_address>/alerts', methods=['GET'])
+@jwt_required()
+def list_alerts(mac_address):
+    """
+    Endpoint API: GET /api/devices/<MAC>/alerts?limit=100
+    Alerty (zderzenie, próg urządzenia, temperatura) wysłane na user/<MAC>/alerts.
+    """
+    current_user_id = get_jwt_identity()
+
+    device = Device.query.filter_by(mac_address=mac_address).first()
+    if not device:
+        return jsonify({"error": "Device not found"}), 404
+
+    if str(device.user_id) != str(current_user_id):
+         return jsonify({"error": "Unauthorized"}), 403
+
+    limit = request.args.get('limit', '100')
+    if not limit.isdigit() or not 1 <= int(limit) <= 1000:
+        return jsonify({"error": "limit musi być liczbą z zakresu 1-1000"}), 400
+
+    return jsonify({"success": True, "alerts": get_device_alerts(device.id, current_user_id, int(limit))}), 200
+
+@device_bp.route('/<string:mac_address>/live', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def live_measurements(mac_address):
+    """
+    Endpoint API: GET /api/devices/<MAC>/live?sensor=ADXL345,MAX6675_NORMAL&jwt=<token>
+    Strumień SSE nowych pomiarów (zdarzenia "measurements" w układzie kolumnowym
+    {"ts", "value", "sensor", "skipped"}). Token także w ?jwt=, bo EventSource
+    nie wysyła nagłówków; strumień kończy się zdarzeniem "expired" razem z tokenem.
+    """
+    current_user_id = get_jwt_identity()
+
+    device = Device.query.filter_by(mac_address=mac_address).first()
+    if not device:
+        return jsonify({"error": "Device not found"}), 404
+
+    if str(device.user_id) != str(current_user_id):
+         return jsonify({"error": "Unauthorized"}), 403
+
+    sensor_type_ids = None
+    sensor_param = request.args.get('sensor')
+    if sensor_param:
+        sensor_type_ids = set()
+        for name in sensor_param.split(','):
+            type_id = sensor_types.get_id(name.strip())
+            if type_id is None:
+                return jsonify({"error": f"Nieznany typ czujnika: {name.strip()}"}), 400
+            sensor_type_ids.add(type_id)
+
+    subscription = live_hub.subscribe(device.id, current_user_id, sensor_type_ids)
+    if subscription is None:
+        return jsonify({"error": "Za dużo połączeń na żywo, spróbuj później"}), 503
+
+    # Bez stream_with_context: połączenie z bazą wraca do puli przed wysyłaniem strumienia
+    events = live_hub.stream(subscription, current_app.json.dumps, expires_at=get_jwt().get('exp'))
+    response = Response(events, mimetype='text/event-stream')
+    # Także gdy klient rozłączy się przed pierwszym zdarzeniem (generator nie ruszył)
+    response.call_on_close(lambda: live_hub.unsubscribe(subscription))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: bez buforowania strumienia
+    return response
+
 @device_bp.route('/<string:mac_address>', methods=['DELETE'])
 @jwt_required()
 def delete_device(mac_address):
@@ -0,0 +1,12 @@
+from flask import Blueprint, Response, current_app
+
+from app.utils.metrics import render
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Metryki w formacie tekstowym Prometheusa (scrape: GET /metrics).
+    """
+    return Response(render(current_app), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -1,13 +1,78 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
 import logging
 
+from app import db
 from app.models.device import Device
-from app.controllers.stats_controller import analyze_acceleration, analyze_engine_temperature
+from app.models.user import User
+from app.controllers.stats_controller import (
+    analyze_acceleration, analyze_engine_temperature, analyze_dashboard, analyze_distribution, get_device_trips,
+    analyze_fleet,
+)
+from app.utils import fleet_report
+from app.utils.rollups import ROLLUP_RESOLUTIONS
+from app.utils.sensor_types import sensor_types, ADXL345, MAX6675_NORMAL
+from app.utils.stats_cache import stats_cache
 
 stats_bp = Blueprint('stats', __name__, url_prefix='/api/stats')
 
+def _parse_period():
+    """
+    Okno (start_date, end_date) z parametrów URL w formacie ISO. Koniec podany
+    samą datą obejmuje cały dzień; domyślnie ostatnie 7 dni. ValueError przy złym formacie.
+    """
+    start_str = request.args.get('start_date')
+    end_str = request.args.get('end_date')
+
+    if end_str:
+        end_date = datetime.fromisoformat(end_str)
+        if end_date.hour == 0 and end_date.minute == 0:
+            end_date = end_date.replace(hour=23, minute=59, second=59)
+    else:
+        end_date = datetime.now()
+
+    if start_str:
+        start_date = datetime.fromisoformat(start_str)
+    else:
+        start_date = end_date - timedelta(days=7)
+
+    return start_date, end_date
+
+def _cache_window(start_date, end_date):
+    """
+    (start_ts, end_ts) okna do klucza stats_cache. Okno domyślne (bez end_date, więc
+    zależne od chwili żądania) jest poszerzane do pełnych minut, żeby kolejne takie
+    żądania w tej samej minucie miały jeden wpis i ETag. Samo liczenie i odpowiedź
+    używają prawdziwego okna; poszerzony klucz tylko szerzej łapie unieważnienia writera.
+    """
+    start_ts, end_ts = int(start_date.timestamp()), int(end_date.timestamp())
+    if request.args.get('end_date'):
+        return start_ts, end_ts
+    step = min(ROLLUP_RESOLUTIONS)
+    if not request.args.get('start_date'):
+        start_ts -= start_ts % step
+    return start_ts, end_ts - end_ts % step + step - 1
+
+def _cached_response(key, sensor_type_name, compute, build_body):
+    """
+    Wynik z pamięci podręcznej statystyk (albo policzony i zapamiętany) z nagłówkiem ETag.
+    Przy zgodnym If-None-Match zwraca 304 - dla trafienia w pamięć bez liczenia statystyk
+    (zostaje tylko zapytanie trasy o urządzenie i jego właściciela).
+    """
+    cached = stats_cache.get(key)
+    if cached is None:
+        # Generacja przed liczeniem: zapis writera w trakcie compute() nie zostanie przykryty starym wynikiem
+        generation = stats_cache.generation(key[1])
+        result = compute()
+        etag = stats_cache.put(key, sensor_types.get_id(sensor_type_name), result, generation)
+    else:
+        result, etag = cached
+
+    response = jsonify(build_body(result))
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
 @stats_bp.route('/<string:mac_address>/acceleration', methods=['GET'])
 @jwt_required()
 def get_driving_stats(mac_address):
@@ -25,35 +90,25 @@ def get_driving_stats(mac_address):
     if str(device.user_id) != str(current_user_id):
         return jsonify({"error": "Brak uprawnień do tego urządzenia"}), 403
 
-    start_str = request.args.get('start_date')
-    end_str = request.args.get('end_date')
-    
     try:
-        if end_str:
-            end_date = datetime.fromisoformat(end_str)
-            if end_date.hour == 0 and end_date.minute == 0:
-                end_date = end_date.replace(hour=23, minute=59, second=59)
-        else:
-            end_date = datetime.now()
-
-        if start_str:
-            start_date = datetime.fromisoformat(start_str)
-        else:
-            start_date = end_date - timedelta(days=7)
-
+        start_date, end_date = _parse_period()
     except ValueError:
         return jsonify({"error": "Nieprawidłowy format daty. Oczekiwany format ISO (YYYY-MM-DD)."}), 400
 
-    # 3. Wywołanie Twojego kontrolera
+    # 3. Wywołanie Twojego kontrolera (wynik z pamięci podręcznej, jeśli okno się nie zmieniło)
     try:
-        result = analyze_acceleration(
-            device_id=device.id, 
-            user_id=current_user_id, 
-            start_date=start_date, 
-            end_date=end_date
+        key = ("acceleration", device.id, device.user_id,
+               *_cache_window(start_date, end_date), None)
+        return _cached_response(
+            key, ADXL345,
+            lambda: analyze_acceleration(
+                device_id=device.id, 
+                user_id=current_user_id, 
+                start_date=start_date, 
+                end_date=end_date
+            ),
+            lambda result: {"success": True, "data": result},
         )
-        
-        return jsonify({"success": True, "data": result}), 200
 
     except ValueError as ve:
         # Obsługa błędów walidacji z kontrolera (np. start > end)
@@ -84,23 +139,10 @@ def get_engine_temp_stats(mac_address):
         return jsonify({"error": "Brak uprawnień do tego urządzenia"}), 403
 
     # 2. Pobieranie i parsowanie parametrów URL
-    start_str = request.args.get('start_date')
-    end_str = request.args.get('end_date')
     min_temp_str = request.args.get('min_temp')
     
     try:
-        if end_str:
-            end_date = datetime.fromisoformat(end_str)
-            if end_date.hour == 0 and end_date.minute == 0:
-                end_date = end_date.replace(hour=23, minute=59, second=59)
-        else:
-            end_date = datetime.now()
-
-        if start_str:
-            start_date = datetime.fromisoformat(start_str)
-        else:
-            start_date = end_date - timedelta(days=7)
-
+        start_date, end_date = _parse_period()
     except ValueError:
         return jsonify({"error": "Nieprawidłowy format daty. Oczekiwany format ISO (YYYY-MM-DD)."}), 400
 
@@ -111,27 +153,237 @@ def get_engine_temp_stats(mac_address):
         except ValueError:
             return jsonify({"error": "Parametr min_temp musi być liczbą"}), 400
 
-    try:
-        result = analyze_engine_temperature(
-            device_id=device.id,
-            user_id=current_user_id,
-            start_date=start_date,
-            end_date=end_date,
-            min_value=min_value
-        )
-        
+    def build_body(result):
         if result is None:
-             return jsonify({
+            return {
                 "success": True, 
                 "message": "Brak danych spełniających kryteria w wybranym okresie.",
                 "data": None
-            }), 200
+            }
+        return {"success": True, "data": result}
 
-        return jsonify({"success": True, "data": result}), 200
+    try:
+        key = ("engine_temp", device.id, device.user_id,
+               *_cache_window(start_date, end_date), min_value)
+        return _cached_response(
+            key, MAX6675_NORMAL,
+            lambda: analyze_engine_temperature(
+                device_id=device.id,
+                user_id=current_user_id,
+                start_date=start_date,
+                end_date=end_date,
+                min_value=min_value
+            ),
+            build_body,
+        )
 
     except ValueError as ve:
         return jsonify({"error": str(ve)}), 400
         
     except Exception as e:
         logging.error(f"Error in engine-temp API for {mac_address}: {str(e)}")
-        return jsonify({"error": "Wystąpił błąd wewnętrzny serwera."}), 500
\ No newline at end of file
+        return jsonify({"error": "Wystąpił błąd wewnętrzny serwera."}), 500
+
+
+@stats_bp.route('/dashboard', methods=['GET'])
+@jwt_required()
+def get_dashboard_stats():
+    """
+    Ocena stylu jazdy i temperatura silnika wszystkich urządzeń użytkownika w jednym żądaniu.
+    URL: /api/stats/dashboard?start_date=...&end_date=...&min_temp=50
+    """
+    current_user_id = get_jwt_identity()
+    devices = Device.query.filter_by(user_id=current_user_id).all()
+
+    min_temp_str = request.args.get('min_temp')
+
+    try:
+        start_date, end_date = _parse_period()
+    except ValueError:
+        return jsonify({"error": "Nieprawidłowy format daty. Oczekiwany format ISO (YYYY-MM-DD)."}), 400
+
+    min_value = None
+    if min_temp_str:
+        try:
+            min_value = float(min_temp_str)
+        except ValueError:
+            return jsonify({"error": "Parametr min_temp musi być liczbą"}), 400
+
+    try:
+        result = analyze_dashboard(current_user_id, devices, start_date, end_date, min_value)
+        return jsonify({"success": True, "data": result}), 200
+
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    except Exception as e:
+        logging.error(f"Error in dashboard API for user {current_user_id}: {str(e)}")
+        return jsonify({"error": "Wystąpił błąd wewnętrzny serwera."}), 500
+
+
+@stats_bp.route('/fleet', methods=['GET'])
+@jwt_required()
+def get_fleet_stats():
+    """
+    Raport floty (tylko dla użytkowników z is_admin): ocena stylu jazdy i temperatura
+    silnika wszystkich przypisanych urządzeń, liczone równolegle w puli procesów.
+    URL: /api/stats/fleet?start_date=...&end_date=...&min_temp=50
+    """
+    current_user_id = get_jwt_identity()
+    user = db.session.get(User, int(current_user_id))
+    if user is None or not user.is_admin:
+        return jsonify({"error": "Brak uprawnień do raportu floty"}), 403
+
+    min_temp_str = request.args.get('min_temp')
+
+    try:
+        start_date, end_date = _parse_period()
+    except ValueError:
+        return jsonify({"error": "Nieprawidłowy format daty. Oczekiwany format ISO (YYYY-MM-DD)."}), 400
+
+    min_value = None
+    if min_temp_str:
+        try:
+            min_value = float(min_temp_str)
+        except ValueError:
+            return jsonify({"error": "Parametr min_temp musi być liczbą"}), 400
+
+    try:
+        # Pula procesów API startuje przy pierwszym raporcie i zostaje na kolejne
+        workers = fleet_report.resolve_workers(current_app.config['FLEET_REPORT_WORKERS'])
+        pool = fleet_report.get_pool(current_app) if workers > 1 else None
+        result = analyze_fleet(start_date, end_date, min_value, workers=workers, pool=pool)
+        return jsonify({"success": True, "data": result}), 200
+
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    except Exception as e:
+        logging.error(f"Error in fleet API for user {current_user_id}: {str(e)}")
+        return jsonify({"error": "Wystąpił błąd wewnętrzny serwera."}), 500
+
+
+@stats_bp.route('/<string:mac_address>/distribution', methods=['GET'])
+@jwt_required()
+def get_distribution_stats(mac_address):
+    """
+    Rozkład odczytów czujnika: kwantyle, histogram i tempo zmian (jerk dla ADXL345).
+    URL: /api/stats/<MAC>/distribution?sensor=ADXL345&bins=50&quantiles=0.5,0.9,0.99&start_date=...&end_date=...
+    """
+    current_user_id = get_jwt_identity()
+
+    device = Device.query.filter_by(mac_address=mac_address).first()
+
+    if not device:
+        return jsonify({"error": "Urządzenie nie zostało znalezione"}), 404
+
+    if str(device.user_id) != str(current_user_id):
+        return jsonify({"error": "Brak uprawnień do tego urządzenia"}), 403
+
+    sensor = request.args.get('sensor', ADXL345)
+    bins_str = request.args.get('bins')
+    quantiles_str = request.args.get('quantiles')
+
+    try:
+        start_date, end_date = _parse_period()
+    except ValueError:
+        return jsonify({"error": "Nieprawidłowy format daty. Oczekiwany format ISO (YYYY-MM-DD)."}), 400
+
+    max_bins = current_app.config['DISTRIBUTION_MAX_BINS']
+    bins = current_app.config['DISTRIBUTION_BINS']
+    if bins_str is not None:
+        if not bins_str.isdigit() or not 1 <= int(bins_str) <= max_bins:
+            return jsonify({"error": f"Parametr bins musi być liczbą z zakresu 1-{max_bins}"}), 400
+        bins = int(bins_str)
+
+    quantiles = current_app.config['DISTRIBUTION_QUANTILES']
+    if quantiles_str:
+        try:
+            quantiles = [float(q) for q in quantiles_str.split(',')]
+        except ValueError:
+            return jsonify({"error": "Parametr quantiles musi być listą liczb po przecinku"}), 400
+        if not all(0 <= q <= 1 for q in quantiles):
+            return jsonify({"error": "Kwantyle muszą należeć do przedziału 0-1"}), 400
+
+    max_gap = current_app.config['DISTRIBUTION_MAX_GAP']
+
+    def build_body(result):
+        if result is None:
+            return {
+                "success": True,
+                "message": "Brak danych spełniających kryteria w wybranym okresie.",
+                "data": None
+            }
+        return {"success": True, "data": result}
+
+    try:
+        key = ("distribution", device.id, device.user_id,
+               *_cache_window(start_date, end_date),
+               (sensor, bins, tuple(quantiles), max_gap))
+        return _cached_response(
+            key, sensor,
+            lambda: analyze_distribution(
+                device_id=device.id,
+                user_id=current_user_id,
+                sensor_type_name=sensor,
+                start_date=start_date,
+                end_date=end_date,
+                bins=bins,
+                quantiles=quantiles,
+                max_gap=max_gap
+            ),
+            build_body,
+        )
+
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    except Exception as e:
+        logging.error(f"Error in distribution API for {mac_address}: {str(e)}")
+        return jsonify({"error": "Wystąpił błąd wewnętrzny serwera."}), 500
+
+
+@stats_bp.route('/<string:mac_address>/trips', methods=['GET'])
+@jwt_required()
+def get_trips(mac_address):
+    """
+    Jazdy urządzenia (wykrywane przy zapisie pomiarów) z oceną każdej jazdy.
+    URL: /api/stats/<MAC>/trips?start_date=...&end_date=...&limit=100
+    """
+    current_user_id = get_jwt_identity()
+
+    device = Device.query.filter_by(mac_address=mac_address).first()
+
+    if not device:
+        return jsonify({"error": "Urządzenie nie zostało znalezione"}), 404
+
+    if str(device.user_id) != str(current_user_id):
+        return jsonify({"error": "Brak uprawnień do tego urządzenia"}), 403
+
+    limit_str = request.args.get('limit', '100')
+
+    try:
+        start_date, end_date = _parse_period()
+    except ValueError:
+        return jsonify({"error": "Nieprawidłowy format daty. Oczekiwany format ISO (YYYY-MM-DD)."}), 400
+
+    if not limit_str.isdigit() or not 1 <= int(limit_str) <= 1000:
+        return jsonify({"error": "Parametr limit musi być liczbą z zakresu 1-1000"}), 400
+
+    try:
+        trips = get_device_trips(
+            device_id=device.id,
+            user_id=device.user_id,
+            start_date=start_date,
+            end_date=end_date,
+            gap_seconds=current_app.config['TRIP_GAP_SECONDS'],
+            limit=int(limit_str)
+        )
+        return jsonify({"success": True, "data": trips}), 200
+
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    except Exception as e:
+        logging.error(f"Error in trips API for {mac_address}: {str(e)}")
+        return jsonify({"error": "Wystąpił błąd wewnętrzny serwera."}), 500
@@ -0,0 +1,43 @@
+"""
+Dostęp do raportu floty (/api/stats/fleet): flaga users.is_admin.
+
+Rejestracja przez API zakłada zwykłych użytkowników, więc flagę nadaje
+i odbiera tylko operator z dostępem do bazy:
+  python -m app.utils.admins --grant admin
+  python -m app.utils.admins --revoke admin
+  python -m app.utils.admins            (lista administratorów)
+"""
+import argparse
+
+from app import db
+from app.models.user import User
+
+def set_admin(username, is_admin):
+    """Ustawia flagę użytkownika; zwraca False, jeśli użytkownik nie istnieje. Wymaga app_context."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        return False
+    user.is_admin = is_admin
+    db.session.commit()
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Administratorzy raportu floty (users.is_admin)")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--grant", metavar="USER", help="nadaj dostęp do /api/stats/fleet")
+    group.add_argument("--revoke", metavar="USER", help="odbierz dostęp do /api/stats/fleet")
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        username = args.grant or args.revoke
+        if username:
+            if not set_admin(username, args.grant is not None):
+                parser.error(f"Nie znaleziono użytkownika {username}")
+            print(f"✅ {username}: {'nadano' if args.grant else 'odebrano'} dostęp do raportu floty")
+        admins = [u.username for u in User.query.filter(User.is_admin.is_(True)).order_by(User.username)]
+        print(f"👑 Administratorzy: {', '.join(admins) if admins else '(brak)'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Alerty wykrywane przy ingeście - w workerze MQTT, zanim odczyty trafią do kolejki writera.
+
+Reguły (dla każdej wiadomości sprawdzany jest jej najwyższy odczyt):
+  crash       - ADXL345 > CRASH_MIN (24.52 m/s^2 - próg zderzenia z analyze_acceleration),
+  threshold   - ADXL345 > Device.config_threshold (ten sam próg, który dostaje ESP32),
+  engine_temp - MAX6675_NORMAL > ALERT_ENGINE_TEMP_MAX.
+Sprawdzenie to jedno max() po odczytach i porównania z progami z rejestru urządzeń,
+bez zapytań do bazy, więc nie spowalnia on_message. Reguły są niezależne - odczyt
+ponad oba progi ADXL345 daje alert crash i threshold (domyślny config_threshold 25.0
+jest powyżej CRASH_MIN). Ta sama reguła dla urządzenia odzywa się najwyżej raz na
+ALERT_COOLDOWN_SECONDS.
+
+Wykryty alert trafia do ograniczonej kolejki wątku AlertDispatcher (przy pełnej
+jest odrzucany - ingest nigdy nie czeka), który publikuje go na temat
+user/<mac>/alerts (JSON, QoS 1) i zapisuje paczkami do tabeli alerts.
+Opóźnienie - od odebrania wiadomości MQTT do publikacji alertu - jest w /metrics
+(alert_latency_seconds) i w kolumnie alerts.latency_ms.
+"""
+import json
+import queue
+import threading
+import time
+from operator import itemgetter
+
+from sqlalchemy import insert
+
+from app import db
+from app.models.alert import Alert
+from app.utils import metrics
+from app.utils.sensor_types import sensor_types, ADXL345, MAX6675_NORMAL
+from app.utils.series_aggregate import CRASH_MIN
+
+RULE_CRASH = "crash"
+RULE_THRESHOLD = "threshold"
+RULE_ENGINE_TEMP = "engine_temp"
+
+ALERT_TOPIC = "user/{mac}/alerts"
+
+
+def evaluate(device, sensor_type, readings, engine_temp_max):
+    """Lista (reguła, timestamp, wartość, próg) spełnionych reguł dla najwyższego odczytu wiadomości."""
+    alerts = []
+    if sensor_type == ADXL345:
+        ts, value = max(readings, key=itemgetter(1))
+        if value > CRASH_MIN:
+            alerts.append((RULE_CRASH, ts, value, CRASH_MIN))
+        threshold = device.config_threshold
+        if threshold is not None and value > threshold:
+            alerts.append((RULE_THRESHOLD, ts, value, threshold))
+    elif sensor_type == MAX6675_NORMAL:
+        ts, value = max(readings, key=itemgetter(1))
+        if value > engine_temp_max:
+            alerts.append((RULE_ENGINE_TEMP, ts, value, engine_temp_max))
+    return alerts
+
+
+class AlertDispatcher(threading.Thread):
+    """
+    Wątek publikujący alerty na MQTT i zapisujący je do bazy.
+    check() jest wołane z on_message (wątek paho) i nie blokuje.
+    """
+
+    def __init__(self, app, client=None):
+        super().__init__(name="alert-dispatcher", daemon=True)
+        self.app = app
+        self.client = client  # klient MQTT workera - ustawiany w start_worker
+        self.engine_temp_max = app.config['ALERT_ENGINE_TEMP_MAX']
+        self.cooldown = app.config['ALERT_COOLDOWN_SECONDS']
+        self.flush_interval = app.config['ALERT_FLUSH_INTERVAL']
+        self.queue = queue.Queue(maxsize=app.config['ALERT_QUEUE_SIZE'])
+        self.running = True
+
+        # (device_id, reguła) -> time.monotonic() ostatniego alertu; tylko wątek paho
+        self._last_alert = {}
+
+        self._stats_lock = threading.Lock()
+        self.raised = 0
+        self.suppressed = 0
+        self.dropped = 0
+        self.published = 0
+        self.publish_errors = 0
+        self.recorded = 0
+        self.record_errors = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+
+    def check(self, mac_address, device, sensor_type, readings, received):
+        """
+        Sprawdza reguły dla odczytów jednej wiadomości (received: time.monotonic()
+        odebrania). Zwraca listę zgłoszonych alertów (każda reguła ma własny cooldown).
+        """
+        if device.user_id is None:
+            return []  # urządzenie bez właściciela - nie ma kogo powiadomić
+
+        raised = []
+        for alert in evaluate(device, sensor_type, readings, self.engine_temp_max):
+            key = (device.device_id, alert[0])
+            last = self._last_alert.get(key)
+            if last is not None and received - last < self.cooldown:
+                with self._stats_lock:
+                    self.suppressed += 1
+                continue
+
+            try:
+                self.queue.put_nowait((mac_address, device.device_id, device.user_id, sensor_type, alert, received))
+            except queue.Full:
+                with self._stats_lock:
+                    self.dropped += 1
+                continue
+
+            self._last_alert[key] = received
+            with self._stats_lock:
+                self.raised += 1
+            raised.append(alert)
+        return raised
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "raised": self.raised,
+                "suppressed": self.suppressed,
+                "dropped": self.dropped,
+                "published": self.published,
+                "publish_errors": self.publish_errors,
+                "recorded": self.recorded,
+                "record_errors": self.record_errors,
+                "last_latency": round(self.last_latency, 4),
+                "max_latency": round(self.max_latency, 4),
+            }
+
+    def run(self):
+        print(f"🚨 Alerty: zderzenie > {CRASH_MIN} m/s^2, próg urządzenia, "
+              f"temperatura > {self.engine_temp_max}°C, cooldown {self.cooldown:.0f}s")
+        pending = []
+        deadline = 0.0
+        while self.running or not self.queue.empty():
+            timeout = max(0.0, deadline - time.monotonic()) if pending else self.flush_interval
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None:
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append(self._publish(item))
+
+            # Zapis do bazy paczkami - publikacja nie czeka na commit
+            if pending and time.monotonic() >= deadline:
+                self._record(pending)
+                pending = []
+
+        if pending:
+            self._record(pending)
+
+    def _publish(self, item):
+        mac_address, device_id, user_id, sensor_type, (rule, ts, value, threshold), received = item
+        payload = json.dumps({
+            "rule": rule, "sensor_type": sensor_type,
+            "value": value, "threshold": threshold, "timestamp": ts,
+        })
+
+        latency = None
+        try:
+            if self.client is None:
+                raise RuntimeError("brak połączenia MQTT")
+            info = self.client.publish(ALERT_TOPIC.format(mac=mac_address), payload, qos=1)
+            if info.rc != 0:
+                raise RuntimeError(f"kod {info.rc}")
+            latency = time.monotonic() - received
+            metrics.ALERTS.inc(rule)
+            metrics.ALERT_LATENCY_SECONDS.observe(latency, rule)
+            with self._stats_lock:
+                self.published += 1
+                self.last_latency = latency
+                self.max_latency = max(self.max_latency, latency)
+        except Exception as e:
+            with self._stats_lock:
+                self.publish_errors += 1
+            print(f"❌ Alerty: nie wysłano alertu {rule} dla {mac_address}: {e}")
+
+        return {
+            "device_id": device_id, "user_id": user_id, "rule": rule,
+            "sensor_type": sensor_type, "value": value, "threshold": threshold, "timestamp": ts,
+            "latency_ms": latency * 1000 if latency is not None else None,
+        }
+
+    def _record(self, rows):
+        with self.app.app_context():
+            try:
+                for row in rows:
+                    row["sensor_type_id"] = sensor_types.get_id(row.pop("sensor_type"))
+                db.session.execute(insert(Alert), rows)
+                db.session.commit()
+                with self._stats_lock:
+                    self.recorded += len(rows)
+            except Exception as e:
+                db.session.rollback()
+                with self._stats_lock:
+                    self.record_errors += len(rows)
+                print(f"❌ Alerty: błąd zapisu {len(rows)} alertów: {e}")
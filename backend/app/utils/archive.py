@@ -0,0 +1,435 @@
+"""
+Archiwum kolumnowe starych pomiarów (zimne dane).
+
+Pomiary starsze niż ARCHIVE_AFTER_DAYS (granica wyrównana do doby UTC) są
+przenoszone z tabel measurements/partycji do plików w ARCHIVE_DIR - jeden
+plik na serię (urządzenie/właściciel/typ czujnika), miesiąc i najwyżej
+ARCHIVE_CHUNK_ROWS wierszy. Manifest plików to tabela archive_chunks.
+
+Odczyty są przezroczyste: measurement_store.iter_rows (lista pomiarów)
+i rollups.aggregate_window (brzegi okna statystyk) dokładają wiersze
+z archiwum do wierszy z bazy. Pełne kubełki statystyk i tak pochodzą
+z measurement_rollups, których archiwizacja nie zmienia. Przy
+ARCHIVE_AFTER_DAYS=0 odczyty nie sięgają do manifestu (archiwum jest pomijane).
+Agregaty i rozkłady liczą bloki jako całe tablice (iter_blocks), bez obiektu
+na wiersz; wiersze (iter_rows) powstają z tablic dopiero przy liście pomiarów.
+
+Format pliku (.col, little-endian):
+  nagłówek  <4sBBxxIqqI  magic b"IOTC", wersja, kodek, liczba wierszy, start_ts, end_ts, liczba bloków
+  indeks    <qqI6I       na blok: pierwszy i ostatni timestamp, liczba wierszy,
+                         (offset, długość) dla każdej z 3 kolumn
+  bloki     kolumny timestamp, value, received_at (0 = brak), zależnie od kodeka:
+              zlib    - zlib(int64 delty / float64 / int64)
+              gorilla - delta-of-delta dla timestampów i XOR dla wartości (app/utils/gorilla.py)
+Plik jest otwierany przez mmap, a dekodowane są tylko bloki nachodzące
+na czytany zakres (indeks bloków zawiera ich pierwszy/ostatni timestamp).
+Kodek nowych plików wybiera ARCHIVE_CODEC; pliki w obu formatach czytają się tak samo.
+
+Narzędzie (z katalogu backend):
+  python -m app.utils.archive --stats
+  python -m app.utils.archive --run
+"""
+import argparse
+import heapq
+import mmap
+import os
+import struct
+import sys
+import time
+import uuid
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime, timezone
+from functools import partial
+from itertools import accumulate, repeat
+
+import numpy as np
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from app import db
+from app.models.archive_chunk import ArchiveChunk
+from app.models.sensor_type import SensorType
+from app.utils import gorilla
+from app.utils import partitions
+from app.utils.series_aggregate import SeriesAggregate
+
+MAGIC = b"IOTC"
+VERSION = 1
+DAY = 86400
+
+# Bajt kodeka w nagłówku (w starszych plikach to był zerowy bajt wyrównania = zlib)
+CODECS = {"zlib": 0, "gorilla": 1}
+
+_HEADER = struct.Struct("<4sBBxxIqqI")
+_BLOCK = struct.Struct("<qqI6I")
+
+# Te same pola co measurement_store.ROW_COLUMNS - wiersze z archiwum i z bazy scala heapq.merge
+ArchivedRow = namedtuple("ArchivedRow", ["timestamp", "value", "sensor_type_id", "received_at"])
+# Konstruktor bez wywołania funkcji Pythona na wiersz (jak ArchivedRow._make)
+_new_row = partial(tuple.__new__, ArchivedRow)
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+def _encode_zlib(ts, values, received):
+    deltas = [ts[0]] + [b - a for a, b in zip(ts, ts[1:])]
+    return [
+        zlib.compress(_little_endian(array("q", deltas)).tobytes(), 6),
+        zlib.compress(_little_endian(array("d", values)).tobytes(), 6),
+        zlib.compress(_little_endian(array("q", received)).tobytes(), 6),
+    ]
+
+def _encode_gorilla(ts, values, received):
+    return [gorilla.encode_timestamps(ts), gorilla.encode_values(values), gorilla.encode_timestamps(received)]
+
+def encode_chunk(timestamps, values, received, start_ts, end_ts, block_rows=4096, codec="zlib"):
+    """Plik archiwum z kolumn (posortowanych po timestamp) jako bytes."""
+    if codec not in CODECS:
+        raise ValueError(f"Nieznany kodek archiwum: {codec} (dostępne: {', '.join(CODECS)})")
+    encode = _encode_gorilla if codec == "gorilla" else _encode_zlib
+    count = len(timestamps)
+    block_count = -(-count // block_rows)
+    offset = _HEADER.size + block_count * _BLOCK.size
+
+    index, payload = [], []
+    for i in range(0, count, block_rows):
+        ts = timestamps[i:i + block_rows]
+        columns = encode(ts, values[i:i + block_rows], [r or 0 for r in received[i:i + block_rows]])
+        entry = [ts[0], ts[-1], len(ts)]
+        for column in columns:
+            entry += [offset, len(column)]
+            offset += len(column)
+            payload.append(column)
+        index.append(_BLOCK.pack(*entry))
+
+    header = _HEADER.pack(MAGIC, VERSION, CODECS[codec], count, start_ts, end_ts, block_count)
+    return header + b"".join(index) + b"".join(payload)
+
+
+class ChunkReader:
+    """Plik archiwum otwarty przez mmap; bloki są dekodowane dopiero przy odczycie."""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.codec, self.row_count, self.start_ts, self.end_ts, block_count = \
+            _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or self.codec not in CODECS.values():
+            self.close()
+            raise ValueError(f"To nie jest plik archiwum pomiarów: {path}")
+        self.blocks = [_BLOCK.unpack_from(self._map, _HEADER.size + i * _BLOCK.size) for i in range(block_count)]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _column(self, offset, length, typecode):
+        values = array(typecode)
+        values.frombytes(zlib.decompress(self._map[offset:offset + length]))
+        return _little_endian(values)
+
+    def read_block(self, block):
+        """(timestamps, values, received_at) jednego bloku."""
+        _, _, count, ts_off, ts_len, val_off, val_len, rec_off, rec_len = block
+        if self.codec == CODECS["gorilla"]:
+            data = self._map
+            return (gorilla.decode_timestamps(data[ts_off:ts_off + ts_len], count),
+                    gorilla.decode_values(data[val_off:val_off + val_len], count),
+                    gorilla.decode_timestamps(data[rec_off:rec_off + rec_len], count))
+        timestamps = list(accumulate(self._column(ts_off, ts_len, "q")))
+        return timestamps, self._column(val_off, val_len, "d"), self._column(rec_off, rec_len, "q")
+
+    def iter_blocks(self, start_ts=None, end_ts=None):
+        """Kolumny bloków nachodzących na [start_ts, end_ts], przycięte do zakresu."""
+        for block in self.blocks:
+            first, last = block[0], block[1]
+            if (start_ts is not None and last < start_ts) or (end_ts is not None and first > end_ts):
+                continue
+            timestamps, values, received = self.read_block(block)
+            lo = 0 if start_ts is None or first >= start_ts else bisect_left(timestamps, start_ts)
+            hi = len(timestamps) if end_ts is None or last <= end_ts else bisect_right(timestamps, end_ts)
+            yield timestamps[lo:hi], values[lo:hi], received[lo:hi]
+
+
+def enabled():
+    return current_app.config['ARCHIVE_AFTER_DAYS'] > 0
+
+def archive_dir():
+    return current_app.config['ARCHIVE_DIR'] or os.path.join(current_app.instance_path, "archive")
+
+def _series_filters(columns, device_id, user_id, sensor_type_id=None):
+    filters = [columns.device_id == device_id,
+               columns.user_id.is_(None) if user_id is None else columns.user_id == user_id]
+    if sensor_type_id is not None:
+        filters.append(columns.sensor_type_id == sensor_type_id)
+    return filters
+
+def chunks_for(device_id, user_id, start_ts=None, end_ts=None, sensor_type_id=None):
+    """Pliki archiwum serii nachodzące na [start_ts, end_ts] (wiersze manifestu)."""
+    c = ArchiveChunk.__table__.c
+    filters = _series_filters(c, device_id, user_id, sensor_type_id)
+    if start_ts is not None:
+        filters.append(c.end_ts > start_ts)
+    if end_ts is not None:
+        filters.append(c.start_ts <= end_ts)
+    return db.session.execute(
+        select(c.path, c.sensor_type_id, c.start_ts, c.end_ts).where(*filters).order_by(c.start_ts)
+    ).all()
+
+def _read_blocks(path, start_ts, end_ts):
+    with ChunkReader(os.path.join(archive_dir(), path)) as reader:
+        yield from reader.iter_blocks(start_ts, end_ts)
+
+def _block_rows(sensor_type_id, timestamps, values, received):
+    return map(_new_row, zip(timestamps, values, repeat(sensor_type_id), [r or None for r in received]))
+
+def _cluster_rows(cluster, start_ts, end_ts):
+    """Wiersze plików nachodzących na siebie w czasie (różne typy czujników) posortowane po timestamp."""
+    if len(cluster) == 1:
+        path, type_id = cluster[0].path, cluster[0].sensor_type_id
+        for timestamps, values, received in _read_blocks(path, start_ts, end_ts):
+            yield from _block_rows(type_id, timestamps, values, received)
+        return
+
+    # Pliki jednego miesiąca - scalane stabilnym sortowaniem tablic, a nie wiersz po wierszu
+    blocks = [(chunk.sensor_type_id,) + block
+              for chunk in cluster for block in _read_blocks(chunk.path, start_ts, end_ts)]
+    if not blocks:
+        return
+    timestamps = np.concatenate([np.asarray(b[1], dtype=np.int64) for b in blocks])
+    order = np.argsort(timestamps, kind="stable")
+    type_ids = np.concatenate([np.full(len(b[1]), b[0], dtype=np.int64) for b in blocks])[order]
+    values = np.concatenate([np.asarray(b[2], dtype=np.float64) for b in blocks])[order]
+    received = np.concatenate([np.asarray(b[3], dtype=np.int64) for b in blocks])[order]
+    yield from map(_new_row, zip(timestamps[order].tolist(), values.tolist(), type_ids.tolist(),
+                                 [r or None for r in received.tolist()]))
+
+def _iter_clusters(chunks, start_ts, end_ts):
+    # Pliki po start_ts; kolejna grupa zaczyna się, gdy plik nie nachodzi na poprzednie
+    cluster, cluster_end = [], None
+    for chunk in chunks:
+        if cluster and chunk.start_ts >= cluster_end:
+            yield from _cluster_rows(cluster, start_ts, end_ts)
+            cluster = []
+        cluster_end = chunk.end_ts if not cluster else max(cluster_end, chunk.end_ts)
+        cluster.append(chunk)
+    if cluster:
+        yield from _cluster_rows(cluster, start_ts, end_ts)
+
+def iter_rows(device_id, user_id, start_ts=None, end_ts=None, sensor_type_id=None):
+    """
+    (wiersze posortowane po timestamp, ostatni timestamp w plikach) - pliki czytane
+    leniwie; None, gdy brak plików albo archiwum jest wyłączone.
+    """
+    if not enabled():
+        return None
+    chunks = chunks_for(device_id, user_id, start_ts, end_ts, sensor_type_id)
+    if not chunks:
+        return None
+    return _iter_clusters(chunks, start_ts, end_ts), max(chunk.end_ts for chunk in chunks) - 1
+
+def iter_blocks(device_id, user_id, start_ts=None, end_ts=None, sensor_type_id=None):
+    """
+    Bloki serii jako tablice (sensor_type_id, timestamps, values, received_at), przycięte
+    do [start_ts, end_ts], plik po pliku - bez scalania typów. Pusto przy wyłączonym archiwum.
+    """
+    if not enabled():
+        return
+    for path, type_id, _, _ in chunks_for(device_id, user_id, start_ts, end_ts, sensor_type_id):
+        for timestamps, values, received in _read_blocks(path, start_ts, end_ts):
+            yield type_id, timestamps, values, received
+
+def read_chunk(path, sensor_type_id=None):
+    """Wszystkie wiersze jednego pliku archiwum."""
+    return [row for block in _read_blocks(path, None, None) for row in _block_rows(sensor_type_id, *block)]
+
+def _add_block(result, values, min_value):
+    if min_value is not None:
+        values = np.asarray(values, dtype=np.float64)
+        values = values[values > min_value]
+    result.add_array(values)
+
+def aggregate(device_id, user_id, sensor_type_id, start_ts, end_ts, min_value=None):
+    """SeriesAggregate wierszy z archiwum w [start_ts, end_ts] (opcjonalnie tylko value > min_value)."""
+    result = SeriesAggregate()
+    for _, _, values, _ in iter_blocks(device_id, user_id, start_ts, end_ts, sensor_type_id):
+        _add_block(result, values, min_value)
+    return result
+
+def aggregate_grouped(device_ids, user_id, sensor_type_ids, start_ts, end_ts, min_value=None):
+    """{(device_id, sensor_type_id): SeriesAggregate} dla wielu serii - jedno zapytanie do manifestu."""
+    if not enabled():
+        return {}
+    c = ArchiveChunk.__table__.c
+    chunks = db.session.execute(
+        select(c.path, c.device_id, c.sensor_type_id).where(
+            c.device_id.in_(device_ids), c.user_id == user_id, c.sensor_type_id.in_(sensor_type_ids),
+            c.end_ts > start_ts, c.start_ts <= end_ts,
+        )
+    ).all()
+
+    result = {}
+    for path, device_id, sensor_type_id in chunks:
+        aggregate = result.setdefault((device_id, sensor_type_id), SeriesAggregate())
+        for _, values, _ in _read_blocks(path, start_ts, end_ts):
+            _add_block(aggregate, values, min_value)
+    return result
+
+def all_chunks():
+    """Cały manifest: (path, device_id, user_id, sensor_type_id)."""
+    c = ArchiveChunk.__table__.c
+    return db.session.execute(select(c.path, c.device_id, c.user_id, c.sensor_type_id)).all()
+
+
+def _month_end(ts):
+    moment = datetime.fromtimestamp(ts, timezone.utc)
+    end = datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(end.timestamp())
+
+def _oldest_rows(tables, device_id, user_id, sensor_type_id, cutoff_ts, limit):
+    """Najstarsze wiersze serii sprzed cutoff_ts (z jednego miesiąca) - (tabela, id, ts, value, received_at)."""
+    streams = []
+    for table in tables:
+        c = table.c
+        query = (
+            select(c.id, c.timestamp, c.value, c.received_at)
+            .where(*_series_filters(c, device_id, user_id, sensor_type_id), c.timestamp < cutoff_ts)
+            .order_by(c.timestamp)
+            .limit(limit)
+        )
+        streams.append([(table,) + tuple(row) for row in db.session.execute(query)])
+    db.session.commit()
+
+    rows = list(heapq.merge(*streams, key=lambda row: row[2]))[:limit]
+    if rows:
+        month_end = _month_end(rows[0][2])
+        rows = [row for row in rows if row[2] < month_end]
+    return rows
+
+def archive_series(device_id, user_id, sensor_type_id, cutoff_ts, should_continue=None):
+    """Przenosi wiersze serii sprzed cutoff_ts do plików archiwum. Zwraca (wiersze, pliki, bajty)."""
+    config = current_app.config
+    tables = partitions.tables_for_range(None, cutoff_ts - 1)
+    moved = files = size = 0
+
+    while should_continue is None or should_continue():
+        rows = _oldest_rows(tables, device_id, user_id, sensor_type_id, cutoff_ts, config['ARCHIVE_CHUNK_ROWS'])
+        if not rows:
+            break
+
+        timestamps = [row[2] for row in rows]
+        data = encode_chunk(timestamps, [row[3] for row in rows], [row[4] for row in rows],
+                            timestamps[0], timestamps[-1] + 1, config['ARCHIVE_BLOCK_ROWS'],
+                            config['ARCHIVE_CODEC'])
+
+        month = datetime.fromtimestamp(timestamps[0], timezone.utc).strftime("%Y%m")
+        owner = "x" if user_id is None else user_id
+        relative = os.path.join(month, f"{device_id}_{owner}_{sensor_type_id}_{timestamps[0]}_{uuid.uuid4().hex[:8]}.col")
+        path = os.path.join(archive_dir(), relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+        # Manifest i usunięcie z bazy w jednej transakcji - wiersz jest albo w bazie, albo w archiwum
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(ArchiveChunk.__table__.insert().values(
+                    device_id=device_id, user_id=user_id, sensor_type_id=sensor_type_id,
+                    start_ts=timestamps[0], end_ts=timestamps[-1] + 1, row_count=len(rows),
+                    path=relative, file_bytes=len(data), created_at=int(time.time()),
+                ))
+                by_table = {}
+                for row in rows:
+                    by_table.setdefault(row[0], []).append(row[1])
+                for table, ids in by_table.items():
+                    for i in range(0, len(ids), 500):
+                        conn.execute(table.delete().where(table.c.id.in_(ids[i:i + 500])))
+        except Exception:
+            os.remove(path)
+            raise
+
+        moved += len(rows)
+        files += 1
+        size += len(data)
+    return moved, files, size
+
+def run_archive(app, should_continue=None, now=None):
+    """Jeden przebieg archiwizacji; zwraca raport (słownik). Wymaga app_context."""
+    from app.utils import rollups
+
+    started = time.monotonic()
+    now = int(now if now is not None else time.time())
+    cutoff = now - app.config['ARCHIVE_AFTER_DAYS'] * DAY
+    cutoff -= cutoff % DAY
+
+    report = {"archived_rows": 0, "chunks": 0, "archive_bytes": 0}
+    type_ids = [type_id for (type_id,) in db.session.query(SensorType.id)]
+    for type_id in type_ids:
+        for device_id, user_id in rollups.series_before(type_id, cutoff):
+            rows, files, size = archive_series(device_id, user_id, type_id, cutoff, should_continue)
+            report["archived_rows"] += rows
+            report["chunks"] += files
+            report["archive_bytes"] += size
+    report["duration"] = round(time.monotonic() - started, 2)
+    return report
+
+def drop_chunks_before(sensor_type_id, cutoff_ts):
+    """Usuwa pliki archiwum typu czujnika, które w całości są sprzed cutoff_ts (retencja)."""
+    c = ArchiveChunk.__table__.c
+    doomed = db.session.execute(
+        select(c.id, c.path).where(c.sensor_type_id == sensor_type_id, c.end_ts <= cutoff_ts)
+    ).all()
+    db.session.commit()
+    for chunk_id, path in doomed:
+        with db.engine.begin() as conn:
+            conn.execute(ArchiveChunk.__table__.delete().where(c.id == chunk_id))
+        try:
+            os.remove(os.path.join(archive_dir(), path))
+        except FileNotFoundError:
+            pass
+    return len(doomed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archiwum kolumnowe starych pomiarów")
+    parser.add_argument("--run", action="store_true",
+                        help="przenieś do archiwum pomiary starsze niż ARCHIVE_AFTER_DAYS")
+    parser.add_argument("--stats", action="store_true")
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        if args.run:
+            if not enabled():
+                print("⚠️ ARCHIVE_AFTER_DAYS=0 - archiwizacja wyłączona")
+                return
+            report = run_archive(app)
+            print(f"✅ Zarchiwizowano {report['archived_rows']} wierszy w {report['chunks']} plikach "
+                  f"({report['archive_bytes'] / 1e6:.1f} MB, {report['duration']}s)")
+
+        chunks, rows, size = db.session.query(
+            func.count(ArchiveChunk.id), func.sum(ArchiveChunk.row_count), func.sum(ArchiveChunk.file_bytes)
+        ).one()
+        rows, size = rows or 0, size or 0
+        per_row = f", {size / rows:.1f} B/wiersz" if rows else ""
+        print(f"📦 Archiwum {archive_dir()}: {chunks} plików, {rows} wierszy, {size / 1e6:.1f} MB{per_row}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark reguł alertów w ścieżce ingestu (mqtt_worker.on_message).
+
+Bez brokera: wiadomości (paczki ADXL345 i MAX6675_NORMAL, część z odczytami
+powyżej progów) są podawane wprost do on_message, writer tylko liczy odczyty,
+a klient MQTT dispatchera zapamiętuje publikacje. Mierzy:
+  - przepustowość on_message bez alertów i z AlertDispatcher (narzut reguł),
+  - opóźnienie alertów od odebrania wiadomości do publikacji (p50/p99/max,
+    z kolumny alerts.latency_ms).
+
+Uruchomienie (z katalogu backend):
+  python -m app.utils.bench_alerts --messages 200000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+START_TS = 1_700_000_000
+
+class CountingWriter:
+    """Zamiast MeasurementWriter - mierzymy samo on_message, nie zapis do bazy."""
+
+    def __init__(self):
+        self.readings = 0
+
+    def submit(self, device_id, user_id, sensor_type, readings):
+        self.readings += len(readings)
+
+class PublishInfo:
+    rc = 0
+
+class RecordingClient:
+    """Zamiast klienta paho - publikacja bez sieci."""
+
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, topic, payload, qos=0):
+        self.published += 1
+        return PublishInfo()
+
+class Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+def make_messages(rnd, macs, count, alert_share):
+    messages = []
+    for i in range(count):
+        mac = rnd.choice(macs)
+        ts = START_TS + i
+        if i % 4:
+            values = [abs(rnd.gauss(9.81, 1.5)) for _ in range(10)]
+            if rnd.random() < alert_share:
+                values[rnd.randrange(10)] = rnd.choice([22.0, 30.0])  # próg urządzenia / zderzenie
+            sensor = "ADXL345"
+        else:
+            values = [rnd.uniform(70, 100)]
+            if rnd.random() < alert_share:
+                values[0] = 120.0
+            sensor = "MAX6675_NORMAL"
+        payload = "\n".join(f"{ts + n};{value:.2f}" for n, value in enumerate(values)).encode()
+        messages.append(Message(f"user/{mac}/sensor/{sensor}", payload))
+    return messages
+
+def run(on_message, messages, userdata):
+    started = time.perf_counter()
+    for message in messages:
+        on_message(None, userdata, message)
+    return time.perf_counter() - started
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Narzut reguł alertów i opóźnienie alertów")
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--alert-share", type=float, default=0.01, help="udział wiadomości z alertem")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_alerts_")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "alerts.db")
+    os.environ["INGEST_SPILL_DIR"] = workdir
+    os.environ["ALERT_COOLDOWN_SECONDS"] = "0"  # każdy alert liczy się do opóźnienia
+
+    from app import create_app, db
+    from app.models.alert import Alert
+    from app.models.device import Device
+    from app.models.user import User
+    from app.utils.alerts import AlertDispatcher
+    from app.utils.device_registry import device_registry
+    from mqtt_worker import on_message
+
+    app = create_app()
+    macs = [f"ALRT{i:08X}" for i in range(args.devices)]
+    with app.app_context():
+        user = User(username="alerts", password_hash="-")
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all([Device(mac_address=mac, user_id=user.id, config_threshold=20.0) for mac in macs])
+        db.session.commit()
+    device_registry.load(app)
+
+    messages = make_messages(random.Random(23), macs, args.messages, args.alert_share)
+    base = {"shard_count": 1, "shard_index": 0}
+    run(on_message, messages[:1000], dict(base, writer=CountingWriter(), alerts=None))  # rozgrzewka
+
+    plain = run(on_message, messages, dict(base, writer=CountingWriter(), alerts=None))
+
+    client = RecordingClient()
+    dispatcher = AlertDispatcher(app, client)
+    dispatcher.start()
+    with_alerts = run(on_message, messages, dict(base, writer=CountingWriter(), alerts=dispatcher))
+    dispatcher.stop()
+    dispatcher.join()
+
+    print(f"{'on_message':>16} {'czas [s]':>9} {'wiadomości/s':>13}")
+    print(f"{'bez alertów':>16} {plain:>9.2f} {args.messages / plain:>13.0f}")
+    print(f"{'z alertami':>16} {with_alerts:>9.2f} {args.messages / with_alerts:>13.0f}")
+    print(f"⚖️ Narzut reguł: {(with_alerts / plain - 1) * 100:+.1f}% "
+          f"({(with_alerts - plain) / args.messages * 1e6:.2f} µs na wiadomość)")
+
+    with app.app_context():
+        latencies = sorted(ms for (ms,) in db.session.query(Alert.latency_ms).filter(Alert.latency_ms.isnot(None)))
+    stats = dispatcher.stats()
+    print(f"🚨 Alerty: zgłoszone {stats['raised']}, odrzucone (pełna kolejka) {stats['dropped']}, "
+          f"wysłane {client.published}, zapisane {stats['recorded']}")
+    if latencies:
+        print(f"⏱️ Opóźnienie [ms]: p50 {percentile(latencies, 0.5):.3f}, p99 {percentile(latencies, 0.99):.3f}, "
+              f"max {latencies[-1]:.3f}")
+
+if __name__ == "__main__":
+    main()
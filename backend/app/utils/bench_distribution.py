@@ -0,0 +1,151 @@
+"""
+Benchmark app/utils/distribution.py (NumPy) wobec zwykłej pętli po wierszach.
+
+Na syntetycznej serii (domyślnie 1M odczytów ADXL345 [m/s^2]: szum, rzadkie szczyty,
+przerwy między jazdami) liczy to samo - podsumowanie, kwantyle, histogram
+i tempo zmian - dwiema metodami:
+  - loop  - pętla Pythona po wierszach (timestamp, value), jak przy encjach ORM,
+  - numpy - distribution.describe na tablicach int64/float64,
+i sprawdza, że wyniki są zgodne.
+
+Uruchomienie (z katalogu backend):
+  python -m app.utils.bench_distribution
+  python -m app.utils.bench_distribution --samples 5000000 --bins 200
+"""
+import argparse
+import bisect
+import math
+import random
+import time
+from array import array
+
+import numpy as np
+
+from app.utils import distribution
+
+START_TS = 1_700_000_000
+QUANTILES = [0.5, 0.9, 0.95, 0.99]
+MAX_GAP = 5
+
+def make_rows(samples):
+    """[(timestamp, value)] - jazdy po ~1h z odczytem co sekundę, przerwy 10 min - 8 h."""
+    rnd = random.Random(21)
+    rows, ts = [], START_TS
+    while len(rows) < samples:
+        for _ in range(min(rnd.randint(1800, 5400), samples - len(rows))):
+            value = abs(rnd.gauss(9.81, 1.5))
+            if rnd.random() < 0.002:
+                value += rnd.uniform(3.0, 25.0)
+            rows.append((ts, round(value, 3)))
+            ts += 1
+        ts += rnd.randint(600, 8 * 3600)
+    return rows
+
+def _quantile(ordered, q):
+    """Kwantyl metodą liniową (jak numpy.quantile) z posortowanej listy."""
+    position = q * (len(ordered) - 1)
+    lo = math.floor(position)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (position - lo)
+
+def describe_loop(rows, bins, quantiles, max_gap):
+    """To samo co distribution.describe, ale pętlą po wierszach."""
+    count, total, total_sq = 0, 0.0, 0.0
+    low, high = math.inf, -math.inf
+    values, rates = [], []
+    previous = None
+    for ts, value in rows:
+        count += 1
+        total += value
+        total_sq += value * value
+        low, high = min(low, value), max(high, value)
+        values.append(value)
+        if previous is not None and 0 < ts - previous[0] <= max_gap:
+            rates.append(abs(value - previous[1]) / (ts - previous[0]))
+        previous = (ts, value)
+
+    mean = total / count
+    # Granice jak w np.histogram (linspace); przedział [a, b), ostatni domknięty
+    step = (high - low) / bins
+    edges = [low + i * step for i in range(bins)] + [high]
+    counts = [0] * bins
+    for value in values:
+        counts[min(bisect.bisect_right(edges, value) - 1, bins - 1)] += 1
+
+    values.sort()
+    rates.sort()
+    return {
+        "summary": {"count": count, "mean": mean, "std": math.sqrt(max(total_sq / count - mean * mean, 0.0)),
+                    "min": low, "max": high},
+        "quantiles": {f"{q:g}": _quantile(values, q) for q in quantiles},
+        "histogram": {"counts": counts},
+        "rate_of_change": {"pairs": len(rates), "max_abs": rates[-1],
+                           "quantiles_abs": {f"{q:g}": _quantile(rates, q) for q in quantiles}},
+    }
+
+def compare(loop, vectorized):
+    """Lista rozbieżności między wynikami obu metod."""
+    problems = []
+    for section in ("summary", "quantiles"):
+        for name, expected in loop[section].items():
+            if not math.isclose(expected, vectorized[section][name], rel_tol=1e-6, abs_tol=1e-9):
+                problems.append(f"{section}.{name}: {expected} != {vectorized[section][name]}")
+    moved = sum(abs(a - b) for a, b in zip(loop["histogram"]["counts"], vectorized["histogram"]["counts"])) // 2
+    if sum(vectorized["histogram"]["counts"]) != loop["summary"]["count"] or moved:
+        problems.append(f"histogram: {moved} odczytów w innych przedziałach")
+    rates, expected = vectorized["rate_of_change"], loop["rate_of_change"]
+    if rates["pairs"] != expected["pairs"] or not math.isclose(rates["max_abs"], expected["max_abs"], rel_tol=1e-6):
+        problems.append(f"rate_of_change: {expected['pairs']}/{expected['max_abs']} != "
+                        f"{rates['pairs']}/{rates['max_abs']}")
+    return problems
+
+def timed(func, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rozkładów odczytów: NumPy vs pętla")
+    parser.add_argument("--samples", type=int, default=1_000_000)
+    parser.add_argument("--bins", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"📦 Generowanie {args.samples} odczytów ...")
+    rows = make_rows(args.samples)
+
+    # Jak distribution.fetch_series: wiersze -> array("q") / array("d") -> tablice numpy
+    def to_arrays():
+        timestamps, values = array("q"), array("d")
+        for ts, value in rows:
+            timestamps.append(ts)
+            values.append(value)
+        return np.frombuffer(timestamps, dtype=np.int64), np.frombuffer(values, dtype=np.float64)
+
+    convert, (timestamps, values) = timed(to_arrays, args.repeat)
+    loop_time, loop = timed(lambda: describe_loop(rows, args.bins, QUANTILES, MAX_GAP), args.repeat)
+    numpy_time, vectorized = timed(
+        lambda: distribution.describe(timestamps, values, args.bins, QUANTILES, MAX_GAP), args.repeat
+    )
+
+    print(f"{'metoda':>22} {'czas [ms]':>10} {'odczyty/s':>12}")
+    print(f"{'loop':>22} {loop_time * 1000:>10.1f} {args.samples / loop_time:>12.0f}")
+    print(f"{'numpy':>22} {numpy_time * 1000:>10.1f} {args.samples / numpy_time:>12.0f}")
+    print(f"{'numpy + tablice':>22} {(convert + numpy_time) * 1000:>10.1f} "
+          f"{args.samples / (convert + numpy_time):>12.0f}")
+    print(f"⚡ numpy {loop_time / numpy_time:.1f}x szybciej (z budową tablic "
+          f"{loop_time / (convert + numpy_time):.1f}x)")
+
+    problems = compare(loop, vectorized)
+    if problems:
+        for problem in problems:
+            print(f"❌ {problem}")
+    else:
+        print(f"✅ Wyniki zgodne (p99 = {vectorized['quantiles']['0.99']:.2f} m/s^2, "
+              f"p99 |jerk| = {vectorized['rate_of_change']['quantiles_abs']['0.99']:.2f} m/s^3)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark eksportu pomiarów (/api/devices/<mac>/measurements/export).
+
+Na tymczasowej bazie SQLite zapisuje --rows odczytów jednego urządzenia,
+po czym przez klienta testowego Flask pobiera eksport (NDJSON i CSV) dla
+coraz dłuższych zakresów i mierzy:
+  - przepustowość [wiersze/s] (odbiór całej odpowiedzi),
+  - szczyt pamięci (tracemalloc, osobny przebieg) - przy strumieniowaniu
+    nie powinien rosnąć z długością zakresu.
+Dla porównania ten sam pomiar dla /measurements (limit 5000 wierszy).
+
+Uruchomienie (z katalogu backend):
+  python -m app.utils.bench_export --rows 2000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+START_TS = 1_700_000_000
+
+def setup(rows):
+    from flask_jwt_extended import create_access_token
+    from app import create_app, db
+    from app.models.device import Device
+    from app.models.measurement import Measurement
+    from app.models.user import User
+    from app.utils.sensor_types import sensor_types
+
+    app = create_app()
+    with app.app_context():
+        user = User(username="export", password_hash="-")
+        db.session.add(user)
+        db.session.flush()
+        device = Device(mac_address="EXPORT000001", user_id=user.id)
+        db.session.add(device)
+        db.session.commit()
+        user_id, device_id = user.id, device.id
+        type_ids = [sensor_types.get_id(name) for name in ("ADXL345", "MAX6675_NORMAL")]
+
+        rnd = random.Random(3)
+        insert = Measurement.__table__.insert()
+        for i in range(0, rows, 50000):
+            batch = [{
+                "device_id": device_id, "user_id": user_id, "sensor_type_id": type_ids[n % 2],
+                "value": round(rnd.uniform(0, 130), 2), "timestamp": START_TS + n, "received_at": START_TS + n + 1,
+            } for n in range(i, min(i + 50000, rows))]
+            with db.engine.begin() as conn:
+                conn.execute(insert, batch)
+
+        with app.test_request_context():
+            token = create_access_token(identity=str(user_id))
+    return app, token
+
+def fetch(client, url, token, marker):
+    """(wiersze, bajty) - odpowiedź konsumowana fragmentami, jak robi to klient HTTP."""
+    response = client.get(url, headers={"Authorization": f"Bearer {token}"}, buffered=False)
+    if response.status_code != 200:
+        raise RuntimeError(f"{url}: HTTP {response.status_code}")
+    lines = size = 0
+    for chunk in response.response:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        lines += chunk.count(marker)
+        size += len(chunk)
+    response.close()
+    return lines, size
+
+def measure(client, url, token, marker):
+    started = time.perf_counter()
+    lines, size = fetch(client, url, token, marker)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    fetch(client, url, token, marker)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return lines, size, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark strumieniowego eksportu pomiarów")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_export_")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "export.db")
+    os.environ["INGEST_SPILL_DIR"] = workdir
+
+    print(f"📦 Zapis {args.rows} wierszy do {workdir} ...")
+    app, token = setup(args.rows)
+    client = app.test_client()
+
+    print(f"{'endpoint':>22} {'zakres':>10} {'wiersze':>9} {'MB':>7} {'wiersze/s':>10} {'szczyt pamięci':>15}")
+    base = "/api/devices/EXPORT000001/measurements"
+    end = datetime.fromtimestamp(START_TS + args.rows)
+    # Znacznik wiersza w odpowiedzi: jsonify - jeden obiekt na pomiar, NDJSON/CSV - linia
+    cases = [("measurements (5000)", base + f"?end_date={end.isoformat()}", args.rows, b'"sensor_type"')]
+    for fraction in (0.01, 0.1, 1.0):
+        span = int(args.rows * fraction)
+        start = datetime.fromtimestamp(START_TS)
+        stop = datetime.fromtimestamp(START_TS + span - 1)
+        window = f"start_date={start.isoformat()}&end_date={stop.isoformat()}"
+        for fmt in ("ndjson", "csv"):
+            cases.append((f"export {fmt}", f"{base}/export?format={fmt}&{window}", span, b"\n"))
+
+    for name, url, span, marker in cases:
+        lines, size, elapsed, peak = measure(client, url, token, marker)
+        if "csv" in name:
+            lines -= 1  # nagłówek
+        print(f"{name:>22} {span:>10} {lines:>9} {size / 1e6:>7.1f} {lines / elapsed:>10.0f} "
+              f"{peak / 1e6:>12.1f} MB")
+
+if __name__ == "__main__":
+    main()
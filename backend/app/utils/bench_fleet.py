@@ -0,0 +1,162 @@
+"""
+Benchmark raportu floty (app/utils/fleet_report.py) dla rosnącej liczby procesów.
+
+Na tymczasowej bazie SQLite zapisuje --rows odczytów (ADXL345 i MAX6675_NORMAL)
+--devices urządzeń kilku właścicieli z --days dni, przelicza measurement_rollups,
+po czym liczy raport floty w 1..N procesach:
+  - bez progu (kubełki measurement_rollups + surowe brzegi okna),
+  - z --min-temp (skan surowych odczytów temperatury - tu równoległość daje najwięcej).
+Czas puli bez startu procesów (pula rozgrzana przed pomiarem). Wynik każdego
+przebiegu jest porównywany z analyze_dashboard liczonym osobno dla każdego właściciela.
+
+Uruchomienie (z katalogu backend):
+  python -m app.utils.bench_fleet --rows 5000000 --workers 1,2,4,8
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+START_TS = 1_700_006_400  # północ UTC
+
+def _warm(_):
+    time.sleep(0.2)
+    return os.getpid()
+
+def seed(app, rnd, rows, device_count, users, days):
+    from app import db
+    from app.models.device import Device
+    from app.models.measurement import Measurement
+    from app.models.user import User
+    from app.utils import rollups
+    from app.utils.sensor_types import sensor_types
+
+    with app.app_context():
+        owners = [User(username=f"fleet{i}", password_hash="-") for i in range(users)]
+        db.session.add_all(owners)
+        db.session.flush()
+        devices = [Device(mac_address=f"FLEET{i:07X}", user_id=owners[i % users].id) for i in range(device_count)]
+        db.session.add_all(devices)
+        db.session.commit()
+        series = [(d.id, d.user_id) for d in devices]
+        adxl_id, temp_id = sensor_types.get_id("ADXL345"), sensor_types.get_id("MAX6675_NORMAL")
+
+        per_device = rows // device_count
+        step = days * 86400 / per_device
+        insert = Measurement.__table__.insert()
+        batch = []
+        for device_id, user_id in series:
+            for n in range(per_device):
+                ts = START_TS + int(n * step)
+                if n % 3:
+                    value = abs(rnd.gauss(9.81, 1.5))
+                    if rnd.random() < 0.0005:
+                        value += rnd.choice([5.0, 20.0])
+                    row = (adxl_id, round(value, 2))
+                else:
+                    row = (temp_id, round(rnd.uniform(20, 110), 2))
+                batch.append({"device_id": device_id, "user_id": user_id, "sensor_type_id": row[0],
+                              "value": row[1], "timestamp": ts, "received_at": ts + 1})
+                if len(batch) >= 50000:
+                    with db.engine.begin() as conn:
+                        conn.execute(insert, batch)
+                    batch = []
+        if batch:
+            with db.engine.begin() as conn:
+                conn.execute(insert, batch)
+        rollups.rebuild()
+        return devices
+
+def reference(app, start_date, end_date, min_value):
+    """{mac: wpis analyze_dashboard} liczony osobno dla każdego właściciela (bez podziału na części)."""
+    from app.controllers.stats_controller import analyze_dashboard
+    from app.models.device import Device
+
+    with app.app_context():
+        devices = Device.query.filter(Device.user_id.isnot(None)).all()
+        owners = {}
+        for d in devices:
+            owners.setdefault(d.user_id, []).append(d)
+        return {
+            entry["mac_address"]: entry
+            for user_id, owned in owners.items()
+            for entry in analyze_dashboard(user_id, owned, start_date, end_date, min_value)
+        }
+
+def differences(report, expected):
+    problems = []
+    for device in report["devices"]:
+        want = expected[device["mac_address"]]
+        if device["acceleration"] != want["acceleration"]:
+            problems.append(f"{device['mac_address']} acceleration: {device['acceleration']} != {want['acceleration']}")
+        if device["engine_temp"] != want["engine_temp"]:
+            problems.append(f"{device['mac_address']} engine_temp: {device['engine_temp']} != {want['engine_temp']}")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Raport floty: skalowanie z liczbą procesów")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--days", type=int, default=28)
+    parser.add_argument("--workers", default=f"1,2,4,{os.cpu_count() or 1}")
+    parser.add_argument("--min-temp", type=float, default=60.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_fleet_")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "fleet.db")
+    os.environ["INGEST_SPILL_DIR"] = workdir
+    # Okno z brzegami w środku doby - część z surowych wierszy, część z kubełków
+    os.environ["FLEET_TIME_CHUNK_DAYS"] = "7"
+
+    from app import create_app
+    from app.controllers.stats_controller import analyze_fleet
+    from app.utils import fleet_report
+
+    app = create_app()
+    started = time.perf_counter()
+    seed(app, random.Random(25), args.rows, args.devices, args.users, args.days)
+    print(f"📦 {args.rows} odczytów, {args.devices} urządzeń, {args.users} właścicieli "
+          f"({time.perf_counter() - started:.1f}s z przeliczeniem agregatów)")
+
+    start_date = datetime.fromtimestamp(START_TS + 3 * 3600 + 17)
+    end_date = datetime.fromtimestamp(START_TS + args.days * 86400 - 5 * 3600)
+    counts = sorted({int(w) for w in args.workers.split(",")})
+
+    print(f"{'próg':>8} {'procesy':>8} {'części':>7} {'czas [s]':>9} {'przyspieszenie':>15}")
+    failures = []
+    for min_value in (None, args.min_temp):
+        expected = reference(app, start_date, end_date, min_value)
+        baseline = None
+        for workers in counts:
+            pool = None
+            if workers > 1:
+                pool = fleet_report.create_pool(workers)
+                list(pool.map(_warm, range(workers * 2)))  # start procesów poza pomiarem
+            best = None
+            with app.app_context():
+                for _ in range(args.repeat):
+                    t0 = time.perf_counter()
+                    report = analyze_fleet(start_date, end_date, min_value, workers=workers, pool=pool)
+                    elapsed = time.perf_counter() - t0
+                    best = elapsed if best is None else min(best, elapsed)
+            if pool is not None:
+                pool.shutdown()
+            baseline = baseline or best
+            label = "-" if min_value is None else f"{min_value:g}"
+            print(f"{label:>8} {workers:>8} {report['chunks']:>7} {best:>9.3f} {baseline / best:>14.2f}x")
+            failures += [f"workers={workers}, min_temp={min_value}: {p}" for p in differences(report, expected)]
+
+    fleet = report["fleet"]
+    print(f"💥 Urządzenia ze zderzeniami: {len(fleet['crashed_devices'])}, "
+          f"temperatura floty: {fleet['engine_temp']}")
+    for failure in failures[:10]:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ Raport zgodny z analyze_dashboard dla każdego właściciela")
+
+if __name__ == "__main__":
+    main()
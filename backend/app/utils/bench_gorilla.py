@@ -0,0 +1,138 @@
+"""
+Benchmark kodowania serii: tabela measurements vs. pliki archiwum (zlib / gorilla).
+
+Dla syntetycznych serii jednego urządzenia - temperatura silnika (MAX6675,
+krok 0.25 st., odczyt co ~10 s, wolne zmiany) i przyspieszenie (ADXL345,
+paczki po 10 odczytów z szumem) - mierzy:
+  - bajty na odczyt: plik SQLite ze schematem i indeksami measurements
+    vs. plik archiwum (.col) w obu kodekach,
+  - kodowanie [odczytów/s]: INSERT paczkami vs. encode_chunk,
+  - dekodowanie [odczytów/s]: SELECT serii po indeksie vs. ChunkReader.iter_blocks.
+
+Uruchomienie (z katalogu backend):
+  python -m app.utils.bench_gorilla --rows 500000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from app.utils.archive import ChunkReader, encode_chunk
+
+DDL = """
+CREATE TABLE measurements (
+    id INTEGER NOT NULL PRIMARY KEY,
+    device_id INTEGER NOT NULL,
+    user_id INTEGER,
+    sensor_type_id SMALLINT NOT NULL,
+    value FLOAT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    received_at INTEGER
+);
+CREATE INDEX ix_measurements_series ON measurements (device_id, user_id, sensor_type_id, timestamp, value);
+CREATE INDEX ix_measurements_device_time ON measurements (device_id, user_id, timestamp);
+"""
+
+SERIES_QUERY = """
+SELECT timestamp, value, received_at FROM measurements
+WHERE device_id = 1 AND user_id = 1 AND sensor_type_id = ? ORDER BY timestamp
+"""
+
+
+def temperature_series(rnd, rows, start_ts):
+    timestamps, values, received = [], [], []
+    ts, temp = start_ts, 80.0
+    for _ in range(rows):
+        ts += rnd.choice([10, 10, 10, 10, 11, 9])
+        if rnd.random() < 0.3:
+            temp = min(max(temp + rnd.choice([-0.25, 0.25]), 15.0), 130.0)
+        timestamps.append(ts)
+        values.append(temp)
+        received.append(ts + rnd.randint(0, 2))
+    return timestamps, values, received
+
+def acceleration_series(rnd, rows, start_ts):
+    timestamps, values, received = [], [], []
+    ts = start_ts
+    while len(timestamps) < rows:
+        ts += 10
+        for i in range(10):
+            timestamps.append(ts + i)
+            values.append(round(abs(rnd.gauss(9.81, 2.5)), 2))
+            received.append(ts + 11)
+    return timestamps[:rows], values[:rows], received[:rows]
+
+def bench_table(workdir, name, type_id, series):
+    path = os.path.join(workdir, f"{name}.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(DDL)
+    rows = [(1, 1, type_id, v, ts, r) for ts, v, r in zip(*series)]
+
+    started = time.perf_counter()
+    for i in range(0, len(rows), 500):
+        conn.executemany(
+            "INSERT INTO measurements (device_id, user_id, sensor_type_id, value, timestamp, received_at) "
+            "VALUES (?,?,?,?,?,?)", rows[i:i + 500])
+        conn.commit()
+    encode = time.perf_counter() - started
+    conn.execute("VACUUM")
+
+    started = time.perf_counter()
+    count = len(conn.execute(SERIES_QUERY, (type_id,)).fetchall())
+    decode = time.perf_counter() - started
+    conn.close()
+    return os.path.getsize(path), encode, decode, count
+
+def bench_archive(workdir, name, codec, series, block_rows):
+    timestamps, values, received = series
+    started = time.perf_counter()
+    data = encode_chunk(timestamps, values, received, timestamps[0], timestamps[-1] + 1, block_rows, codec)
+    encode = time.perf_counter() - started
+
+    path = os.path.join(workdir, f"{name}_{codec}.col")
+    with open(path, "wb") as f:
+        f.write(data)
+
+    started = time.perf_counter()
+    count = 0
+    with ChunkReader(path) as reader:
+        for ts, vals, _ in reader.iter_blocks():
+            count += sum(1 for _ in zip(ts, vals))
+    decode = time.perf_counter() - started
+    return len(data), encode, decode, count
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark kodowania serii (measurements vs. zlib vs. gorilla)")
+    parser.add_argument("--rows", type=int, default=500_000, help="odczytów na serię")
+    parser.add_argument("--block-rows", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    start_ts = 1_700_000_000
+    workdir = tempfile.mkdtemp(prefix="bench_gorilla_")
+    print(f"📦 {args.rows} odczytów na serię, katalog: {workdir}")
+    print(f"{'seria':>12} {'zapis':>13} {'B/odczyt':>9} {'kodowanie [k/s]':>16} {'dekodowanie [k/s]':>18}")
+
+    all_series = [
+        ("temperature", 2, temperature_series(rnd, args.rows, start_ts)),
+        ("acceleration", 1, acceleration_series(rnd, args.rows, start_ts)),
+    ]
+    for name, type_id, series in all_series:
+        results = [("measurements",) + bench_table(workdir, name, type_id, series)]
+        for codec in ("zlib", "gorilla"):
+            results.append((codec,) + bench_archive(workdir, name, codec, series, args.block_rows))
+
+        for storage, size, encode, decode, count in results:
+            if count != args.rows:
+                print(f"❌ {name}/{storage}: odczytano {count} z {args.rows} wierszy")
+            print(f"{name:>12} {storage:>13} {size / args.rows:>9.2f} "
+                  f"{args.rows / encode / 1000:>16.0f} {args.rows / decode / 1000:>18.0f}")
+        table, gorilla = results[0], results[2]
+        print(f"{'':>12} gorilla: {table[1] / gorilla[1]:.0f}x mniej miejsca niż measurements")
+        print("-" * 72)
+
+if __name__ == "__main__":
+    main()
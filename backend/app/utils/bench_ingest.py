@@ -0,0 +1,145 @@
+"""
+Porównanie przepustowości ingestu: jeden worker vs. wiele procesów (ingest_workers.py).
+
+Wymaga działającego lokalnego brokera (np. `mosquitto -v` na localhost:1883).
+Skrypt tworzy tymczasową bazę SQLite (albo używa --database-url), zakłada
+urządzenia testowe, dla każdej liczby workerów uruchamia ingest_workers.py,
+wysyła N wiadomości i mierzy czas, po którym wszystkie trafią do bazy.
+
+Uruchomienie (z katalogu backend):
+  python -m app.utils.bench_ingest --messages 20000 --workers 1,2,4
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import paho.mqtt.client as mqtt
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SENSORS = ["ADXL345", "MAX6675_NORMAL", "MAX6675_PROFILE"]
+
+def seed_devices(count):
+    from app import create_app, db
+    from app.models.device import Device
+
+    app = create_app()
+    macs = [f"BENCH{i:07X}" for i in range(count)]
+    with app.app_context():
+        existing = {d.mac_address for d in Device.query.filter(Device.mac_address.in_(macs))}
+        for mac in macs:
+            if mac not in existing:
+                db.session.add(Device(mac_address=mac, friendly_name="bench"))
+        db.session.commit()
+    return app, macs
+
+def count_rows(app):
+    from app import db
+    from app.models.measurement import Measurement
+
+    with app.app_context():
+        return db.session.query(db.func.count(Measurement.id)).scalar()
+
+def clear_rows(app):
+    from app import db
+    from app.models.measurement import Measurement
+
+    with app.app_context():
+        db.session.query(Measurement).delete()
+        db.session.commit()
+
+def publish(host, port, macs, messages, qos):
+    client = mqtt.Client(client_id="bench_publisher")
+    client.connect(host, port, 60)
+    client.loop_start()
+
+    now = int(time.time())
+    info = None
+    for i in range(messages):
+        mac = macs[i % len(macs)]
+        sensor = SENSORS[i % len(SENSORS)]
+        info = client.publish(f"user/{mac}/sensor/{sensor}", f"{now};{(i % 100) / 10:.2f}", qos=qos)
+
+    if info is not None:
+        info.wait_for_publish()
+    client.loop_stop()
+    client.disconnect()
+
+def run_case(app, workers, mode, args, macs):
+    clear_rows(app)
+
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "ingest_workers.py"),
+         "--workers", str(workers), "--mode", mode, "--qos", str(args.qos)],
+        cwd=BACKEND_DIR,
+        env=os.environ.copy(),
+        stdout=subprocess.DEVNULL,
+    )
+
+    try:
+        # Czas na start procesów, załadowanie rejestru i subskrypcję
+        time.sleep(args.warmup)
+
+        started = time.monotonic()
+        publish(args.host, args.port, macs, args.messages, args.qos)
+
+        received = 0
+        last_progress = time.monotonic()
+        while received < args.messages:
+            time.sleep(0.2)
+            current = count_rows(app)
+            if current != received:
+                received = current
+                last_progress = time.monotonic()
+            elif time.monotonic() - last_progress > args.idle_timeout:
+                break
+        elapsed = last_progress - started
+    finally:
+        process.send_signal(signal.SIGINT)
+        process.wait()
+
+    return received, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestu MQTT")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--devices", type=int, default=300)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--mode", choices=["shared", "hash"], default="shared")
+    parser.add_argument("--qos", type=int, choices=[0, 1], default=1)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--idle-timeout", type=float, default=10.0)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    # Baza musi być ustawiona przed importem config.py (także w procesach workerów)
+    database_url = args.database_url
+    if not database_url:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bench_ingest_"), "bench.db")
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["MQTT_BROKER_HOST"] = args.host
+    os.environ["MQTT_BROKER_PORT"] = str(args.port)
+
+    app, macs = seed_devices(args.devices)
+
+    print(f"📦 Baza: {database_url}")
+    print(f"📡 Broker: {args.host}:{args.port}, {args.messages} wiadomości, {args.devices} urządzeń, QoS {args.qos}")
+    print("-" * 64)
+    print(f"{'workery':>8} {'tryb':>7} {'zapisane':>10} {'czas [s]':>10} {'msg/s':>10} {'x':>6}")
+
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        mode = args.mode if workers > 1 else "hash"
+        received, elapsed = run_case(app, workers, mode, args, macs)
+        rate = received / elapsed if elapsed > 0 else 0.0
+        baseline = baseline or rate
+        speedup = rate / baseline if baseline else 0.0
+        print(f"{workers:>8} {mode:>7} {received:>10} {elapsed:>10.2f} {rate:>10.0f} {speedup:>6.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark odpowiedzi /api/devices/<mac>/measurements dla 5k, 50k i 500k wierszy.
+
+Porównuje czas pobrania + przygotowania danych i czas serializacji JSON:
+  - orm      - encje Measurement z ORM, słownik na wiersz (jak dawniej),
+  - rows     - get_device_measurements (zapytania Core, słownik na wiersz),
+  - columnar - get_device_measurements_columnar (kolumny ts/value/sensor),
+każdy z providerem JSON Flaska (stdlib) i FastJSONProvider (orjson, jeśli zainstalowany).
+
+Uruchomienie (z katalogu backend):
+  python -m app.utils.bench_json
+  python -m app.utils.bench_json --sizes 5000 50000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+START_TS = 1_700_000_000
+
+def setup(rows):
+    from app import create_app, db
+    from app.models.device import Device
+    from app.models.measurement import Measurement
+    from app.models.user import User
+
+    app = create_app()
+    with app.app_context():
+        user = User(username="json", password_hash="-")
+        db.session.add(user)
+        db.session.flush()
+        device = Device(mac_address="JSON00000001", user_id=user.id)
+        db.session.add(device)
+        db.session.commit()
+        user_id, device_id = user.id, device.id
+
+        rnd = random.Random(5)
+        insert = Measurement.__table__.insert()
+        for i in range(0, rows, 50000):
+            batch = [{
+                "device_id": device_id, "user_id": user_id, "sensor_type_id": 1 + n % 2,
+                "value": round(rnd.uniform(0, 130), 2), "timestamp": START_TS + n, "received_at": START_TS + n + 1,
+            } for n in range(i, min(i + 50000, rows))]
+            with db.engine.begin() as conn:
+                conn.execute(insert, batch)
+    return app, device_id, user_id
+
+def orm_rows(device_id, user_id, limit):
+    """Dawna implementacja get_device_measurements - encje ORM i słownik na wiersz."""
+    from app.models.measurement import Measurement
+    from app.utils.sensor_types import sensor_types
+
+    measurements = (
+        Measurement.query.filter_by(device_id=device_id, user_id=user_id)
+        .order_by(Measurement.timestamp.asc()).limit(limit).all()
+    )
+    return [{
+        "timestamp": datetime.fromtimestamp(m.timestamp).isoformat(),
+        "value": m.value,
+        "sensor_type": sensor_types.get_name(m.sensor_type_id),
+        "received_at": datetime.utcfromtimestamp(m.received_at).isoformat() if m.received_at else None,
+    } for m in measurements]
+
+def timed(func, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serializacji pomiarów")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 50000, 500000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_json_")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "json.db")
+    os.environ["INGEST_SPILL_DIR"] = workdir
+
+    from flask.json.provider import DefaultJSONProvider
+    from app.controllers.device_controller import get_device_measurements, get_device_measurements_columnar
+    from app.utils import json_provider
+
+    print(f"📦 Zapis {max(args.sizes)} wierszy do {workdir} ...")
+    app, device_id, user_id = setup(max(args.sizes))
+    providers = [("stdlib", DefaultJSONProvider(app)), ("fast", json_provider.FastJSONProvider(app))]
+    if json_provider.orjson is None:
+        print("⚠️ orjson nie jest zainstalowany - provider 'fast' działa jak stdlib")
+
+    shapes = [
+        ("orm", lambda n: orm_rows(device_id, user_id, n)),
+        ("rows", lambda n: get_device_measurements(device_id, user_id, limit=n)),
+        ("columnar", lambda n: get_device_measurements_columnar(device_id, user_id, limit=n)),
+    ]
+    print(f"{'wiersze':>8} {'kształt':>9} {'pobranie [ms]':>14} {'json':>7} {'serializacja [ms]':>18} "
+          f"{'razem [ms]':>11} {'MB':>6}")
+    with app.app_context():
+        for size in args.sizes:
+            for shape, build in shapes:
+                fetch, data = timed(lambda: build(size), args.repeat)
+                for name, provider in providers:
+                    serialize, body = timed(lambda: provider.response({"success": True, "measurements": data}),
+                                            args.repeat)
+                    print(f"{size:>8} {shape:>9} {fetch * 1000:>14.1f} {name:>7} {serialize * 1000:>18.1f} "
+                          f"{(fetch + serialize) * 1000:>11.1f} {len(body.get_data()) / 1e6:>6.1f}")
+            print("-" * 80)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Test obciążeniowy pomiarów na żywo (/api/devices/<mac>/live, SSE).
+
+Na tymczasowej bazie SQLite uruchamia serwer API (werkzeug, wątek na
+połączenie), otwiera --subscribers równoczesnych połączeń SSE do --devices
+urządzeń (część z nich to wolni klienci - nie czytają, dopóki trwa zapis), po czym
+przez --seconds sekund zapisuje odczyty writerem (MeasurementWriter._flush,
+tak jak robi to worker MQTT) w tempie --rate wiadomości/s. Mierzy:
+  - opóźnienie od zapisu paczki do odebrania odczytu przez klienta (p50/p99/max),
+  - kompletność: odczyty odebrane + pominięte ("skipped") vs. zapisane
+    (wolni klienci przepełniają bufor --buffer i dostają "skipped"),
+  - zdarzenia na klienta (łączenie odczytów co LIVE_COALESCE_INTERVAL),
+  - czas zapisu paczki bez subskrybentów i z nimi (koszt publish_rows).
+
+Uruchomienie (z katalogu backend):
+  python -m app.utils.bench_live --subscribers 500 --devices 50 --seconds 20
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+START_TS = 1_700_000_000
+
+class Subscriber(threading.Thread):
+    def __init__(self, port, mac, token, sent_at, done, stall):
+        super().__init__(daemon=True)
+        self.port = port
+        self.mac = mac
+        self.token = token
+        self.sent_at = sent_at
+        self.done = done
+        self.stall = stall  # wolny klient: tyle sekund bez czytania po połączeniu
+        self.connected = threading.Event()
+        self.status = None
+        self.events = 0
+        self.readings = 0
+        self.skipped = 0
+        self.latencies = []
+
+    def run(self):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        conn.connect()
+        if self.stall:
+            # Mały bufor gniazda - zaległe odczyty zostają w buforze połączenia w hubie
+            conn.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        conn.request("GET", f"/api/devices/{self.mac}/live?jwt={self.token}")
+        response = conn.getresponse()
+        self.status = response.status
+        self.connected.set()
+        if response.status != 200:
+            return
+        if self.stall:
+            time.sleep(self.stall)
+
+        event = None
+        while not self.done.is_set():
+            line = response.readline()  # keepalive co LIVE_KEEPALIVE_SECONDS - pętla sprawdza done
+            if not line:
+                break
+            line = line.decode().rstrip("\n")
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event == "measurements":
+                received = time.perf_counter()
+                payload = json.loads(line[6:])
+                self.events += 1
+                self.readings += len(payload["ts"])
+                self.skipped += payload["skipped"]
+                if payload["ts"]:
+                    self.latencies.append(received - self.sent_at[max(payload["ts"])])
+        conn.close()
+
+def messages(rnd, macs, device_ids, user_id, count, readings, next_ts):
+    """count wiadomości writera po `readings` odczytów, każdy z innym timestampem."""
+    batch = []
+    for _ in range(count):
+        i = rnd.randrange(len(macs))
+        values = [(next_ts + n, round(abs(rnd.gauss(9.81, 1.5)), 2)) for n in range(readings)]
+        next_ts += readings
+        batch.append((device_ids[i], user_id, "ADXL345", values, time.monotonic(), datetime.utcnow()))
+    return batch, next_ts
+
+def feed(writer, rnd, macs, device_ids, user_id, sent_at, seconds, rate, readings, next_ts, written):
+    """Zapis przez `seconds` s w tempie `rate` wiadomości/s, paczka co 0.1 s; zwraca (czasy zapisu, ts)."""
+    flush_times = []
+    per_tick = max(1, rate // 10)
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        tick = time.perf_counter()
+        batch, end_ts = messages(rnd, macs, device_ids, user_id, per_tick, readings, next_ts)
+        for ts in range(next_ts, end_ts):
+            sent_at[ts] = tick
+        next_ts = end_ts
+        for item in batch:
+            written[item[0]] = written.get(item[0], 0) + len(item[3])
+        writer._flush(batch)
+        flush_times.append(time.perf_counter() - tick)
+        time.sleep(max(0.0, tick + 0.1 - time.perf_counter()))
+    return flush_times, next_ts
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Test obciążeniowy SSE /live")
+    parser.add_argument("--subscribers", type=int, default=300)
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--slow", type=int, default=10, help="ilu klientów nie czyta, dopóki trwa zapis")
+    parser.add_argument("--buffer", type=int, default=200, help="LIVE_BUFFER_SIZE")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rate", type=int, default=200, help="wiadomości/s")
+    parser.add_argument("--readings", type=int, default=10, help="odczytów w wiadomości")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_live_")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "live.db")
+    os.environ["INGEST_SPILL_DIR"] = workdir
+    os.environ["LIVE_MAX_SUBSCRIBERS"] = str(args.subscribers)
+    os.environ["LIVE_KEEPALIVE_SECONDS"] = "1"
+    os.environ["LIVE_BUFFER_SIZE"] = str(args.buffer)
+
+    from flask_jwt_extended import create_access_token
+    from werkzeug.serving import make_server
+    from app import create_app, db
+    from app.models.device import Device
+    from app.models.user import User
+    from app.utils.live_hub import live_hub
+    from app.utils.measurement_writer import MeasurementWriter
+
+    app = create_app()
+    macs = [f"LIVE{i:08X}" for i in range(args.devices)]
+    with app.app_context():
+        user = User(username="live", password_hash="-")
+        db.session.add(user)
+        db.session.flush()
+        devices = [Device(mac_address=mac, user_id=user.id) for mac in macs]
+        db.session.add_all(devices)
+        db.session.commit()
+        user_id, device_ids = user.id, [d.id for d in devices]
+        with app.test_request_context():
+            token = create_access_token(identity=str(user_id))
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    writer = MeasurementWriter(app)
+    rnd = random.Random(24)
+    sent_at, next_ts = {}, START_TS
+
+    # Koszt zapisu bez subskrybentów
+    baseline, next_ts = feed(writer, rnd, macs, device_ids, user_id, sent_at, 2, args.rate, args.readings, next_ts, {})
+
+    done = threading.Event()
+    subscribers = [
+        Subscriber(server.server_port, macs[i % len(macs)], token, sent_at, done,
+                   args.seconds if i < args.slow else 0)
+        for i in range(args.subscribers)
+    ]
+    started = time.perf_counter()
+    for subscriber in subscribers:
+        subscriber.start()
+    for subscriber in subscribers:
+        subscriber.connected.wait(30)
+    while live_hub.stats()["subscribers"] < args.subscribers and time.perf_counter() - started < 30:
+        time.sleep(0.05)
+    refused = sum(1 for s in subscribers if s.status != 200)
+    print(f"🔌 Połączono {args.subscribers - refused}/{args.subscribers} klientów "
+          f"w {time.perf_counter() - started:.2f}s")
+
+    written = {}
+    flush_times, next_ts = feed(writer, rnd, macs, device_ids, user_id, sent_at,
+                                args.seconds, args.rate, args.readings, next_ts, written)
+
+    # Czekamy, aż klienci (także wolni, po wznowieniu czytania) odbiorą ostatnie zdarzenia
+    device_by_mac = dict(zip(macs, device_ids))
+    expected = {s: written.get(device_by_mac[s.mac], 0) for s in subscribers if s.status == 200}
+    deadline = time.perf_counter() + 10
+    while time.perf_counter() < deadline and any(s.readings + s.skipped < n for s, n in expected.items()):
+        time.sleep(0.1)
+    done.set()
+    for subscriber in subscribers:
+        subscriber.join(5)
+    server.shutdown()
+
+    print(f"✍️ Zapis paczki [ms]: bez subskrybentów {sum(baseline) / len(baseline) * 1000:.2f}, "
+          f"z {args.subscribers} subskrybentami {sum(flush_times) / len(flush_times) * 1000:.2f}")
+
+    for label, group in (("szybcy", subscribers[args.slow:]), ("wolni", subscribers[:args.slow])):
+        group = [s for s in group if s.status == 200]
+        if not group:
+            continue
+        total = sum(expected[s] for s in group)
+        received = sum(s.readings for s in group)
+        skipped = sum(s.skipped for s in group)
+        events = sum(s.events for s in group)
+        latencies = sorted(x for s in group for x in s.latencies)
+        print(f"📡 {label} ({len(group)}): odczyty {received}/{total}, pominięte {skipped}, "
+              f"zdarzeń na klienta {events / len(group):.1f}, odczytów na zdarzenie {received / max(events, 1):.1f}")
+        if latencies:
+            print(f"   ⏱️ opóźnienie [ms]: p50 {percentile(latencies, 0.5) * 1000:.1f}, "
+                  f"p99 {percentile(latencies, 0.99) * 1000:.1f}, max {latencies[-1] * 1000:.1f}")
+        if received + skipped != total:
+            print(f"   ⚠️ brakuje {total - received - skipped} odczytów")
+
+    print(f"📊 Hub: {live_hub.stats()}")
+
+if __name__ == "__main__":
+    main()
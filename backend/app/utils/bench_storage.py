@@ -0,0 +1,144 @@
+"""
+Porównanie rozmiaru wiersza i czasu zapytań: stary schemat measurements
+(sensor_type jako napis, received_at jako DateTime) vs. nowy (sensor_type_id
+ze słownika sensor_types, received_at jako epoch).
+
+Generuje te same syntetyczne dane do dwóch tymczasowych plików SQLite
+i mierzy rozmiar pliku na wiersz oraz czas zapytań z stats_controller.
+
+Uruchomienie:
+  python backend/app/utils/bench_storage.py --rows 3000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+
+SENSORS = [("ADXL345", 1), ("MAX6675_NORMAL", 2), ("MAX6675_PROFILE", 3)]
+
+LEGACY_DDL = """
+CREATE TABLE measurements (
+    id INTEGER NOT NULL PRIMARY KEY,
+    device_id INTEGER NOT NULL,
+    user_id INTEGER,
+    sensor_type VARCHAR(50) NOT NULL,
+    value FLOAT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    received_at DATETIME
+)
+"""
+
+COMPACT_DDL = """
+CREATE TABLE sensor_types (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(50) NOT NULL UNIQUE);
+CREATE TABLE measurements (
+    id INTEGER NOT NULL PRIMARY KEY,
+    device_id INTEGER NOT NULL,
+    user_id INTEGER,
+    sensor_type_id SMALLINT NOT NULL REFERENCES sensor_types(id),
+    value FLOAT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    received_at INTEGER
+);
+"""
+
+ACCEL_LEGACY = """
+SELECT count(id), sum(CASE WHEN value > 12.26 AND value <= 24.52 THEN 1 ELSE 0 END),
+       sum(CASE WHEN value > 24.52 THEN 1 ELSE 0 END)
+FROM measurements
+WHERE device_id = ? AND user_id = ? AND sensor_type = 'ADXL345' AND timestamp >= ? AND timestamp <= ?
+"""
+ACCEL_COMPACT = ACCEL_LEGACY.replace("sensor_type = 'ADXL345'", "sensor_type_id = 1")
+
+TEMP_LEGACY = """
+SELECT count(id), avg(value), max(value) FROM measurements
+WHERE device_id = ? AND user_id = ? AND sensor_type = 'MAX6675_NORMAL' AND timestamp >= ? AND timestamp <= ?
+"""
+TEMP_COMPACT = TEMP_LEGACY.replace("sensor_type = 'MAX6675_NORMAL'", "sensor_type_id = 2")
+
+def generate(rows, devices, start_ts, seed):
+    rnd = random.Random(seed)
+    ts = start_ts
+    for i in range(rows):
+        device_id = i % devices + 1
+        name, type_id = SENSORS[(i // devices) % 3]
+        if i % (devices * 3) == 0:
+            ts += 2
+        value = rnd.uniform(0, 30) if type_id == 1 else rnd.uniform(20, 200)
+        yield device_id, device_id, name, type_id, value, ts
+
+def build(path, compact, rows, devices, start_ts):
+    conn = sqlite3.connect(path)
+    conn.executescript(COMPACT_DDL if compact else LEGACY_DDL)
+    if compact:
+        conn.executemany("INSERT INTO sensor_types VALUES (?, ?)", [(i, n) for n, i in SENSORS])
+
+    batch = []
+    for device_id, user_id, name, type_id, value, ts in generate(rows, devices, start_ts, seed=42):
+        if compact:
+            batch.append((device_id, user_id, type_id, value, ts, ts + 1))
+        else:
+            received = datetime.fromtimestamp(ts + 1, timezone.utc).replace(tzinfo=None)
+            batch.append((device_id, user_id, name, value, ts, str(received) + ".123456"))
+        if len(batch) >= 50000:
+            _insert(conn, compact, batch)
+            batch = []
+    if batch:
+        _insert(conn, compact, batch)
+    conn.commit()
+    conn.execute("VACUUM")
+    return conn
+
+def _insert(conn, compact, batch):
+    if compact:
+        sql = "INSERT INTO measurements (device_id, user_id, sensor_type_id, value, timestamp, received_at) VALUES (?,?,?,?,?,?)"
+    else:
+        sql = "INSERT INTO measurements (device_id, user_id, sensor_type, value, timestamp, received_at) VALUES (?,?,?,?,?,?)"
+    conn.executemany(sql, batch)
+
+def time_query(conn, sql, params, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rozmiaru wierszy measurements")
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    start_ts = 1_700_000_000
+    end_ts = start_ts + (args.rows // (args.devices * 3)) * 2
+    params = (7, 7, start_ts, end_ts)
+    workdir = tempfile.mkdtemp(prefix="bench_storage_")
+
+    print(f"📦 {args.rows} wierszy, {args.devices} urządzeń, katalog: {workdir}")
+    print(f"{'schemat':>10} {'plik [MB]':>10} {'B/wiersz':>9} {'accel [ms]':>11} {'temp [ms]':>10}")
+
+    results = {}
+    for compact in (False, True):
+        name = "compact" if compact else "legacy"
+        path = os.path.join(workdir, f"{name}.db")
+        conn = build(path, compact, args.rows, args.devices, start_ts)
+        size = os.path.getsize(path)
+
+        accel = time_query(conn, ACCEL_COMPACT if compact else ACCEL_LEGACY, params, args.repeat)
+        temp = time_query(conn, TEMP_COMPACT if compact else TEMP_LEGACY, params, args.repeat)
+        conn.close()
+
+        results[name] = (size, accel, temp)
+        print(f"{name:>10} {size / 1e6:>10.1f} {size / args.rows:>9.1f} {accel * 1000:>11.1f} {temp * 1000:>10.1f}")
+
+    legacy, compact = results["legacy"], results["compact"]
+    print("-" * 54)
+    print(f"rozmiar: {compact[0] / legacy[0]:.2f}x, accel: {legacy[1] / compact[1]:.2f}x szybciej, "
+          f"temp: {legacy[2] / compact[2]:.2f}x szybciej")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Kontrola archiwum kolumnowego (archive.py) na danych syntetycznych.
+
+Na pustej bazie tymczasowej zapisuje ~60 dni odczytów przez MeasurementWriter,
+zapamiętuje wyniki listy pomiarów (measurement_store.iter_rows) i statystyk
+(analyze_acceleration / analyze_engine_temperature, także z min_temp) dla
+losowych okien, po czym przenosi do archiwum wszystko starsze niż
+ARCHIVE_AFTER_DAYS i sprawdza, że:
+  - wyniki są identyczne (okna w całości w archiwum, w bazie i na granicy),
+  - rollups.rebuild() odtwarza te same kubełki co przed archiwizacją.
+Wypisuje też rozmiar archiwum na wiersz i czas skanu całej historii
+urządzenia z bazy vs. z archiwum (najlepszy z 3 przebiegów). Kończy się kodem 1 przy niezgodności.
+
+Uruchomienie (z katalogu backend):
+  python -m app.utils.check_archive --days 60 --archive-after 20
+  python -m app.utils.check_archive --codec gorilla
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+SENSORS = ["ADXL345", "MAX6675_NORMAL"]
+
+def generate(rnd, device_ids, user_id, start_ts, end_ts):
+    batch = []
+    ts = start_ts
+    while ts < end_ts:
+        for device_id in device_ids:
+            sensor = rnd.choice(SENSORS)
+            if sensor == "ADXL345":
+                values = [rnd.choice([12.26, 24.52, round(rnd.uniform(0, 40), 2)]) for _ in range(10)]
+            else:
+                values = [round(rnd.uniform(15, 130), 2)]
+            readings = [(ts + i, value) for i, value in enumerate(values)]
+            batch.append((device_id, user_id, sensor, readings, time.monotonic(), datetime.utcfromtimestamp(ts + 5)))
+        ts += rnd.randint(300, 900)
+    return batch
+
+def snapshot(app, windows, device_ids, user_id):
+    from app.controllers.stats_controller import analyze_acceleration, analyze_engine_temperature
+    from app.utils import measurement_store
+    from app.utils.sensor_types import sensor_types
+
+    results = []
+    with app.app_context():
+        for device_id, start_ts, end_ts in windows:
+            rows = [tuple(row) for row in measurement_store.iter_rows(device_id, user_id, start_ts, end_ts)]
+            ordered = all(a[0] <= b[0] for a, b in zip(rows, rows[1:]))
+            start, end = datetime.fromtimestamp(start_ts), datetime.fromtimestamp(end_ts)
+            results.append((
+                sorted(rows), ordered,
+                analyze_acceleration(device_id, user_id, start, end),
+                analyze_engine_temperature(device_id, user_id, start, end),
+                analyze_engine_temperature(device_id, user_id, start, end, min_value=60),
+                [tuple(series) for series in measurement_store.fetch_series(
+                    device_id, user_id, sensor_types.get_id("ADXL345"), start_ts, end_ts)],
+            ))
+    return results
+
+def rollup_table(app):
+    from app import db
+    from app.models.measurement_rollup import MeasurementRollup
+
+    with app.app_context():
+        rows = {tuple(r[:5]): tuple(r[5:]) for r in db.session.execute(db.select(MeasurementRollup.__table__))}
+        db.session.commit()
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Kontrola archiwum kolumnowego")
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--archive-after", type=int, default=20)
+    parser.add_argument("--windows", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--codec", choices=["zlib", "gorilla"], default="zlib")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="check_archive_")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "archive.db")
+    os.environ["INGEST_SPILL_DIR"] = workdir
+    os.environ["ARCHIVE_DIR"] = os.path.join(workdir, "archive")
+    os.environ["ARCHIVE_AFTER_DAYS"] = str(args.archive_after)
+    os.environ["ARCHIVE_CODEC"] = args.codec
+
+    from app import create_app, db
+    from app.models.device import Device
+    from app.models.user import User
+    from app.utils import archive, measurement_store, rollups
+    from app.utils.measurement_writer import MeasurementWriter
+
+    rnd = random.Random(args.seed)
+    app = create_app()
+    with app.app_context():
+        user = User(username="archive", password_hash="-")
+        db.session.add(user)
+        db.session.flush()
+        devices = [Device(mac_address=f"ARCH{i:08X}", user_id=user.id) for i in range(2)]
+        db.session.add_all(devices)
+        db.session.commit()
+        user_id, device_ids = user.id, [d.id for d in devices]
+
+    now = int(time.time())
+    start_ts = now - args.days * 86400
+    writer = MeasurementWriter(app)
+    batch = generate(rnd, device_ids, user_id, start_ts, now)
+    for i in range(0, len(batch), 200):
+        if not writer._flush(batch[i:i + 200]):
+            print("❌ Writer nie zapisał paczki")
+            sys.exit(1)
+    total = writer.stats()["total_rows"]
+    print(f"📦 Zapisano {total} odczytów z {args.days} dni")
+
+    boundary = now - args.archive_after * 86400
+    windows = [(device_ids[0], start_ts - 3600, now + 3600)]
+    for _ in range(args.windows):
+        lo = rnd.randint(start_ts, now)
+        if rnd.random() < 0.3:
+            lo = boundary - rnd.randint(0, 3 * 86400)  # okno na granicy archiwum
+        windows.append((rnd.choice(device_ids), lo, lo + rnd.choice([59, 3600, 86400, rnd.randint(0, 20 * 86400)])))
+
+    def full_scan(repeats=3):
+        best = None
+        for _ in range(repeats):
+            started = time.perf_counter()
+            with app.app_context():
+                count = sum(1 for _ in measurement_store.iter_rows(device_ids[0], user_id))
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return count, best
+
+    before = snapshot(app, windows, device_ids, user_id)
+    rollups_before = rollup_table(app)
+    scan_rows, scan_db = full_scan()
+
+    with app.app_context():
+        report = archive.run_archive(app, now=now)
+    print(f"📦 Zarchiwizowano {report['archived_rows']} wierszy w {report['chunks']} plikach, "
+          f"{report['archive_bytes'] / max(report['archived_rows'], 1):.1f} B/wiersz")
+
+    failures = []
+    if report["archived_rows"] == 0 or report["archived_rows"] >= total:
+        failures.append(f"nieoczekiwana liczba zarchiwizowanych wierszy: {report['archived_rows']} z {total}")
+
+    after = snapshot(app, windows, device_ids, user_id)
+    _, scan_archive = full_scan()
+    for window, old, new in zip(windows, before, after):
+        if not new[1]:
+            failures.append(f"okno {window}: wiersze nieposortowane po timestamp")
+        if old[0] != new[0]:
+            failures.append(f"okno {window}: lista pomiarów {len(old[0])} != {len(new[0])} wierszy")
+        for name, a, b in zip(("acceleration", "temperature", "temperature(min_temp)", "fetch_series"),
+                              old[2:], new[2:]):
+            if a != b:
+                failures.append(f"okno {window}: {name} {a} != {b}")
+
+    with app.app_context():
+        rollups.rebuild()
+    rollups_after = rollup_table(app)
+    if rollups_before.keys() != rollups_after.keys():
+        failures.append(f"rebuild: {len(rollups_before)} kubełków przed, {len(rollups_after)} po")
+    for key, values in rollups_before.items():
+        other = rollups_after.get(key)
+        # value_sum + value_sum_err to dokładna suma - zgodna niezależnie od kolejności dopisywania
+        if other is not None and (values[0] != other[0] or values[3:] != other[3:]
+                                  or math.fsum(values[1:3]) != math.fsum(other[1:3])):
+            failures.append(f"rebuild {key}: {values} != {other}")
+
+    print(f"⏱️ Skan całej historii urządzenia ({scan_rows} wierszy): baza {scan_db * 1000:.0f} ms, "
+          f"po archiwizacji {scan_archive * 1000:.0f} ms")
+    for failure in failures[:20]:
+        print(f"❌ {failure}")
+    if failures:
+        print(f"\n❌ {len(failures)} niezgodności")
+        sys.exit(1)
+    print(f"✅ {len(windows)} okien i {len(rollups_before)} kubełków zgodnych po archiwizacji")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Kontrola zachowania writera przy błędnych danych i przy niedostępnej bazie.
+
+Na pustej bazie tymczasowej uruchamia MeasurementWriter (polityka spill):
+  1. W WAL czeka już wiadomość, której baza nie przyjmie (NaN -> NULL łamie
+     NOT NULL), a za nią przez submit idą poprawne wiadomości, wiadomość
+     z jednym złym odczytem wśród dobrych i odczyt z timestampem poza zakresem
+     INTEGER. Wszystkie poprawne odczyty muszą trafić do bazy, a tylko złe do
+     pliku dead-letter - jeden zły wiersz nie może zatrzymać ingestu.
+  2. Tabela measurements znika na chwilę (błąd przejściowy, OperationalError):
+     paczka ma wrócić do WAL i zapisać się po przywróceniu tabeli, bez
+     dead-letter.
+Kończy się kodem 1 przy pierwszej niezgodności.
+
+Uruchomienie (z katalogu backend):
+  python -m app.utils.check_dead_letter
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+START_TS = 1_700_000_000
+
+def wait_until(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="check_dead_letter_")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "dead_letter.db")
+    os.environ["INGEST_SPILL_DIR"] = workdir
+    os.environ["INGEST_OVERFLOW_POLICY"] = "spill"
+    os.environ["INGEST_FLUSH_INTERVAL"] = "0.05"
+    os.environ["INGEST_RETRY_INTERVAL"] = "0.2"
+
+    from sqlalchemy import text
+    from app import create_app, db
+    from app.models.device import Device
+    from app.models.measurement import Measurement
+    from app.models.measurement_rollup import MeasurementRollup
+    from app.models.user import User
+    from app.utils.measurement_writer import MeasurementWriter
+
+    app = create_app()
+    with app.app_context():
+        user = User(username="dead_letter", password_hash="-")
+        db.session.add(user)
+        db.session.flush()
+        devices = [Device(mac_address=f"DEAD{i:08X}", user_id=user.id) for i in range(2)]
+        db.session.add_all(devices)
+        db.session.commit()
+        user_id, device_ids = user.id, [d.id for d in devices]
+
+    def count_rows():
+        with app.app_context():
+            return db.session.query(db.func.count(Measurement.id)).scalar()
+
+    def item(device_id, readings):
+        return (device_id, user_id, "ADXL345", readings, time.monotonic(), datetime.utcnow())
+
+    failures = []
+    writer = MeasurementWriter(app, spill_name="check.wal")
+
+    # 1. Zła wiadomość w WAL (np. z poprzedniego uruchomienia), za nią poprawne
+    writer.spill.append([item(device_ids[0], [(START_TS, float("nan"))])])
+    writer.start()
+
+    expected = 0
+    ts = START_TS + 1
+    for n in range(200):
+        readings = [(ts + i, 9.81 + i / 100) for i in range(5)]
+        if n == 50:
+            readings[2] = (readings[2][0], float("nan"))
+        if n == 120:
+            readings[4] = (10 ** 20, 9.81)
+        expected += sum(1 for t, v in readings if v == v and t < 2 ** 63)
+        writer.submit(device_ids[n % 2], user_id, "ADXL345", readings)
+        ts += 5
+
+    drained = lambda: writer.queue.empty() and not writer.spill.has_pending() and count_rows() == expected
+    if not wait_until(drained):
+        failures.append(f"błąd danych: w bazie {count_rows()}/{expected} odczytów, "
+                        f"WAL {writer.spill.pending_bytes} B")
+    dead = writer.stats()["dead_letter_rows"]
+    if dead != 3:
+        failures.append(f"dead-letter: {dead} odczytów zamiast 3")
+    with open(writer.dead_letter.path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    if sorted(str(line["value"]) for line in lines) != ["9.81", "nan", "nan"]:
+        failures.append(f"plik dead-letter: {lines}")
+    print(f"☠️ Błąd danych: {count_rows()} odczytów w bazie, {dead} w dead-letter")
+
+    # 2. Błąd przejściowy - paczka czeka w WAL, nie w dead-letter
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(text("ALTER TABLE measurements RENAME TO measurements_hidden"))
+    for n in range(20):
+        writer.submit(device_ids[0], user_id, "ADXL345", [(ts + i, 9.81) for i in range(5)])
+        ts += 5
+    expected += 100
+    if not wait_until(writer.spill.has_pending):
+        failures.append("błąd przejściowy: paczka nie trafiła do WAL")
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(text("ALTER TABLE measurements_hidden RENAME TO measurements"))
+
+    if not wait_until(drained):
+        failures.append(f"błąd przejściowy: w bazie {count_rows()}/{expected} odczytów po przywróceniu tabeli")
+    if writer.stats()["dead_letter_rows"] != dead:
+        failures.append("błąd przejściowy trafił do dead-letter")
+    print(f"💾 Błąd przejściowy: {count_rows()} odczytów w bazie po odtworzeniu WAL")
+
+    writer.stop()
+    writer.join(10)
+
+    # Agregaty zgadzają się z zapisanymi wierszami (części paczek zapisane osobno)
+    with app.app_context():
+        minute_rows = db.session.query(db.func.sum(MeasurementRollup.value_count)).filter(
+            MeasurementRollup.bucket_seconds == 60).scalar()
+    if minute_rows != expected:
+        failures.append(f"measurement_rollups: {minute_rows} odczytów zamiast {expected}")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"✅ {expected} poprawnych odczytów zapisanych, złe odczyty tylko w dead-letter")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Kontrola planów zapytań do measurements (EXPLAIN QUERY PLAN, SQLite).
+
+Buduje dokładnie te zapytania, których używają kontrolery
+(build_measurements_query, build_acceleration_query,
+build_engine_temperature_query) i sprawdza, że SQLite wybiera wyszukiwanie
+po indeksie (SEARCH ... USING INDEX), a nie pełny skan tabeli ani
+sortowanie w tymczasowym B-drzewie. Kończy się kodem 1, jeśli któreś
+zapytanie straciło indeks - do uruchamiania w CI po zmianach w zapytaniach.
+
+Sprawdzenie działa z włączonym partycjonowaniem (MEASUREMENT_PARTITIONING=monthly)
+i jedną partycją w badanym zakresie, więc obejmuje zarówno tabelę measurements,
+jak i measurements_pRRRRMM.
+
+Uruchomienie (z katalogu backend, na pustej bazie tymczasowej):
+  python -m app.utils.check_query_plans
+"""
+import os
+import sys
+import tempfile
+
+START_TS = 1_700_000_000
+END_TS = START_TS + 7 * 86400
+
+def explain(query):
+    from app import db
+
+    statement = query.compile(db.engine, compile_kwargs={"literal_binds": True})
+    rows = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {statement}")).fetchall()
+    return [row[-1] for row in rows]
+
+def check(name, query, index_suffix, table="measurements"):
+    """index_suffix: np. "_series" - pasuje do ix_measurements_series i ix_measurements_pRRRRMM_series."""
+    plan = explain(query)
+    problems = []
+
+    searches = [line for line in plan if line.startswith(f"SEARCH {table}")]
+    if not searches or not all("INDEX " in line and f"{index_suffix} (" in line for line in searches):
+        problems.append(f"brak wyszukiwania po indeksie *{index_suffix}")
+    if any(line.startswith(f"SCAN {table}") for line in plan):
+        problems.append(f"pełny skan tabeli {table}")
+    if any("TEMP B-TREE" in line for line in plan):
+        problems.append("sortowanie w tymczasowym B-drzewie")
+
+    status = "✅" if not problems else "❌"
+    print(f"{status} {name}")
+    for line in plan:
+        print(f"     {line}")
+    for problem in problems:
+        print(f"     -> {problem}")
+    return not problems
+
+def main():
+    if "DATABASE_URL" not in os.environ:
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="query_plans_"), "plans.db")
+    os.environ.setdefault("MEASUREMENT_PARTITIONING", "monthly")
+
+    from app import create_app, db
+    from app.controllers.device_controller import build_measurements_query
+    from app.controllers.stats_controller import build_acceleration_query, build_engine_temperature_query
+    from app.utils import partitions, rollups
+
+    app = create_app()
+    with app.app_context():
+        if partitions.enabled():
+            with db.engine.begin() as conn:
+                partitions.ensure_partitions(conn, [partitions.partition_name(START_TS)])
+
+        cases = []
+        # Listing: osobne zapytanie na każdą tabelę (scalane w Pythonie)
+        for query in build_measurements_query(1, 1, START_TS, END_TS):
+            table = query.get_final_froms()[0].name
+            cases.append((f"get_device_measurements (zakres dat, {table})", query, "_device_time"))
+        for query in build_measurements_query(1, 1):
+            table = query.get_final_froms()[0].name
+            cases.append((f"get_device_measurements (bez dat, {table})", query, "_device_time"))
+        cases += [
+            ("analyze_acceleration",
+             build_acceleration_query(1, 1, START_TS, END_TS), "_series"),
+            ("analyze_engine_temperature",
+             build_engine_temperature_query(1, 1, START_TS, END_TS), "_series"),
+            ("analyze_engine_temperature (min_temp)",
+             build_engine_temperature_query(1, 1, START_TS, END_TS, min_value=50), "_series"),
+        ]
+        results = [check(name, query, index) for name, query, index in cases]
+
+        # Statystyki z measurement_rollups: kubełki po kluczu głównym + surowe brzegi okna
+        buckets, raw = rollups.plan_window(START_TS + 1234, END_TS - 56)
+        results.append(check("rollups: kubełki", rollups.rollup_query([1], 1, [1], buckets),
+                             "autoindex_measurement_rollups_1", table="measurement_rollups"))
+        lo, hi = raw[0]
+        results.append(check("rollups: brzeg okna", rollups.raw_query(1, 1, 1, lo, hi), "_series"))
+        results.append(check("rollups: odczyty > próg (min_temp)",
+                             rollups.raw_grouped_query([1], 1, [1], START_TS, END_TS, 50.0), "_series"))
+
+    if not all(results):
+        print(f"\n❌ {results.count(False)} zapytań bez indeksu")
+        sys.exit(1)
+    print("\n✅ Wszystkie zapytania używają indeksów")
+
+if __name__ == "__main__":
+    main()
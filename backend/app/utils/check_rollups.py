@@ -0,0 +1,184 @@
+"""
+Kontrola zgodności measurement_rollups z surowymi pomiarami.
+
+Na pustej bazie tymczasowej zapisuje losowe odczyty przez MeasurementWriter
+(tak jak ingest MQTT: paczki, odczyty spóźnione do starszych kubełków,
+wartości dokładnie na progach harsh/crash), a potem dla wielu losowych okien
+porównuje rollups.aggregate_window z tymi samymi agregatami policzonymi
+wprost z surowych wierszy, wyniki analyze_acceleration /
+analyze_engine_temperature z zapytaniami build_*_query, oraz analyze_dashboard
+(wszystkie urządzenia naraz) z wynikami dla pojedynczych urządzeń. Na koniec sprawdza,
+że rollups.rebuild() odtwarza dokładnie te same kubełki, które writer
+utrzymywał przyrostowo. Kończy się kodem 1 przy pierwszej niezgodności.
+
+Uruchomienie (z katalogu backend):
+  python -m app.utils.check_rollups --windows 500
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+START_TS = 1_700_000_000
+DAYS = 4
+SENSORS = ["ADXL345", "MAX6675_NORMAL"]
+
+def same_float(a, b):
+    if a is None or b is None:
+        return a is b
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+
+def generate(rnd, device_ids, user_id):
+    """Paczki w formacie kolejki writera, lekko pomieszane w czasie."""
+    batch = []
+    ts = START_TS + rnd.randint(0, 3600)
+    end_ts = START_TS + DAYS * 86400
+    while ts < end_ts:
+        sensor = rnd.choice(SENSORS)
+        if sensor == "ADXL345":
+            values = [rnd.choice([12.26, 24.52, round(rnd.uniform(0, 40), 2)]) for _ in range(rnd.randint(1, 20))]
+        else:
+            values = [round(rnd.uniform(15, 130), 2) for _ in range(rnd.randint(1, 5))]
+        # Część odczytów dociera z opóźnieniem (bufor ESP32) - trafia do starszych kubełków
+        base = ts - rnd.choice([0, 0, 0, 59, 3600, 86400])
+        readings = [(base + i, value) for i, value in enumerate(values)]
+        batch.append((rnd.choice(device_ids), user_id, sensor, readings, time.monotonic(), datetime.utcnow()))
+        ts += rnd.randint(1, 240)
+    rnd.shuffle(batch)
+    return batch
+
+def random_window(rnd):
+    start = START_TS + rnd.randint(-600, DAYS * 86400)
+    length = rnd.choice([0, 1, 59, 60, 61, 3599, 3600, 86400, rnd.randint(0, DAYS * 86400)])
+    if rnd.random() < 0.3:
+        start -= start % rnd.choice([60, 3600, 86400])
+    return start, start + length
+
+def main():
+    parser = argparse.ArgumentParser(description="Zgodność measurement_rollups z surowymi pomiarami")
+    parser.add_argument("--windows", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="check_rollups_")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "rollups.db")
+    os.environ["INGEST_SPILL_DIR"] = workdir
+
+    from app import create_app, db
+    from app.models.device import Device
+    from app.models.measurement_rollup import MeasurementRollup
+    from app.models.user import User
+    from app.controllers.stats_controller import (
+        analyze_acceleration, analyze_engine_temperature, analyze_dashboard,
+        build_acceleration_query, build_engine_temperature_query,
+    )
+    from app.utils import rollups
+    from app.utils.measurement_writer import MeasurementWriter
+    from app.utils.sensor_types import sensor_types
+
+    rnd = random.Random(args.seed)
+    app = create_app()
+    failures = []
+
+    with app.app_context():
+        user = User(username="rollups", password_hash="-")
+        db.session.add(user)
+        db.session.flush()
+        devices = [Device(mac_address=f"ROLL{i:08X}", user_id=user.id) for i in range(3)]
+        db.session.add_all(devices)
+        db.session.commit()
+        user_id, device_ids = user.id, [d.id for d in devices]
+
+    writer = MeasurementWriter(app, batch_size=200)
+    batch = generate(rnd, device_ids, user_id)
+    for i in range(0, len(batch), 50):
+        if not writer._flush(batch[i:i + 50]):
+            print("❌ Writer nie zapisał paczki")
+            sys.exit(1)
+    print(f"📦 Zapisano {writer.stats()['total_rows']} odczytów")
+
+    with app.app_context():
+        type_ids = [sensor_types.get_id(name) for name in SENSORS]
+        user_devices = Device.query.filter_by(user_id=user_id).all()
+
+        for _ in range(args.windows):
+            device_id = rnd.choice(device_ids)
+            type_id = rnd.choice(type_ids)
+            start_ts, end_ts = random_window(rnd)
+
+            got = rollups.aggregate_window(device_id, user_id, type_id, start_ts, end_ts)
+            values = db.session.execute(rollups.raw_query(device_id, user_id, type_id, start_ts, end_ts)).scalars()
+            want = rollups.SeriesAggregate.from_values(values)
+
+            # Suma dokładna - kubełki + brzegi muszą dać bit w bit math.fsum surowych wartości
+            same = (
+                got.count == want.count and got.harsh == want.harsh and got.crash == want.crash
+                and same_float(got.minimum, want.minimum) and same_float(got.maximum, want.maximum)
+                and got.total == want.total
+            )
+            if not same:
+                failures.append(f"aggregate_window({device_id}, {type_id}, {start_ts}, {end_ts}): "
+                                f"{vars(got)} != {vars(want)}")
+
+            # Wyniki endpointów vs. zapytania na surowych wierszach
+            start_date, end_date = datetime.fromtimestamp(start_ts), datetime.fromtimestamp(end_ts)
+            accel = analyze_acceleration(device_id, user_id, start_date, end_date)["stats"]
+            raw = db.session.execute(build_acceleration_query(device_id, user_id, start_ts, end_ts)).first()
+            if (accel["total_readings"], accel["total_harsh"], accel["total_crashes"]) != \
+                    (raw.total, int(raw.harsh or 0), int(raw.crash or 0)):
+                failures.append(f"analyze_acceleration({device_id}, {start_ts}, {end_ts}): {accel} != {tuple(raw)}")
+
+            temp = analyze_engine_temperature(device_id, user_id, start_date, end_date)
+            raw = db.session.execute(build_engine_temperature_query(device_id, user_id, start_ts, end_ts)).first()
+            expected = None
+            if raw.total:
+                # Średnia z dokładnej sumy (math.fsum) surowych wartości
+                values = db.session.execute(rollups.raw_query(
+                    device_id, user_id, sensor_types.get_id("MAX6675_NORMAL"), start_ts, end_ts
+                )).scalars().all()
+                avg = math.fsum(values) / len(values)
+                expected = {"avg_temp": round(avg, 1), "max_temp": round(float(raw.max_temp), 1),
+                            "total_readings": raw.total, "threshold_used": None}
+            if temp != expected:
+                failures.append(f"analyze_engine_temperature({device_id}, {start_ts}, {end_ts}): {temp} != {expected}")
+
+            # Zapytania grupowane dla wszystkich urządzeń vs. urządzenie po urządzeniu
+            min_value = rnd.choice([None, 60.0])
+            for entry, d in zip(analyze_dashboard(user_id, user_devices, start_date, end_date, min_value),
+                                user_devices):
+                single = (analyze_acceleration(d.id, user_id, start_date, end_date),
+                          analyze_engine_temperature(d.id, user_id, start_date, end_date, min_value))
+                if (entry["acceleration"], entry["engine_temp"]) != single:
+                    failures.append(f"analyze_dashboard({d.id}, {start_ts}, {end_ts}, {min_value}): "
+                                    f"{entry} != {single}")
+
+        # Kubełki przyrostowe (writer) vs. przeliczone od zera
+        table = MeasurementRollup.__table__
+        incremental = {tuple(r[:5]): r[5:] for r in db.session.execute(db.select(table))}
+        db.session.commit()
+        rollups.rebuild()
+        rebuilt = {tuple(r[:5]): r[5:] for r in db.session.execute(db.select(table))}
+        if incremental.keys() != rebuilt.keys():
+            failures.append(f"rebuild: {len(incremental)} kubełków przyrostowo, {len(rebuilt)} po przeliczeniu")
+        for key, values in incremental.items():
+            other = rebuilt.get(key)
+            if other is None:
+                continue
+            count, total, total_err, low, high, harsh, crash = values
+            if (count, low, high, harsh, crash) != (other[0], other[3], other[4], other[5], other[6]) \
+                    or math.fsum((total, total_err)) != math.fsum((other[1], other[2])):
+                failures.append(f"rebuild {key}: {tuple(values)} != {tuple(other)}")
+
+    for failure in failures[:20]:
+        print(f"❌ {failure}")
+    if failures:
+        print(f"\n❌ {len(failures)} niezgodności")
+        sys.exit(1)
+    print(f"✅ {args.windows} okien i {len(incremental)} kubełków zgodnych z surowymi pomiarami")
+
+if __name__ == "__main__":
+    main()
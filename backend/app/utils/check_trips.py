@@ -0,0 +1,174 @@
+"""
+Kontrola przyrostowego wykrywania jazd (app/utils/trips.py).
+
+Na pustej bazie tymczasowej symuluje kilka dni jazd kilku urządzeń (ADXL345
+co sekundę, MAX6675_NORMAL co 10 s: nagrzewanie, postoje z urządzeniem
+nadającym przy stygnącym silniku, ponowne rozruchy, krótkie przestawienia auta,
+przerwy) i zapisuje odczyty przez MeasurementWriter paczkami losowej wielkości -
+granice jazd wypadają w środku paczek i między nimi. Potem sprawdza, że:
+  - trips.rebuild() (jeden przebieg po całej historii) daje dokładnie te same
+    jazdy i stan co writer,
+  - liczba jazd zgadza się z tym, ile ich zasymulowano,
+  - jedna paczka z ponad 1000 jazd krótszych niż TRIP_MIN_SECONDS (np. ramka
+    binarna z bufora ESP32) zapisuje się - krótkie jazdy są usuwane w jednej
+    transakcji writera.
+Kończy się kodem 1 przy niezgodności.
+
+Uruchomienie (z katalogu backend):
+  python -m app.utils.check_trips --days 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+START_TS = 1_700_000_000
+
+def simulate(rnd, days, config):
+    """(strumień (ts, czujnik, wartość) posortowany po czasie, liczba jazd, które powinny zostać wykryte)."""
+    stream, expected = [], 0
+    ts, end_ts = START_TS, START_TS + days * 86400
+    temp = 20.0
+    while ts < end_ts:
+        # Jazda: 2 - 60 min albo przestawienie auta krótsze niż TRIP_MIN_SECONDS
+        short = rnd.random() < 0.1
+        length = rnd.randint(10, config['TRIP_MIN_SECONDS'] - 10) if short else rnd.randint(120, 3600)
+        expected += not short
+        for second in range(length):
+            # Temperatura co 10 s, w sekundach bez odczytu ADXL345 (kolejność odczytów jednoznaczna)
+            if second % 10 == 5:
+                temp = min(90.0, temp + 1.5)
+                stream.append((ts + second, "MAX6675_NORMAL", round(temp + rnd.uniform(-0.5, 0.5), 2)))
+                continue
+            value = abs(rnd.gauss(9.81, 1.5))
+            if rnd.random() < 0.003:
+                value += rnd.choice([3.0, 15.0, 20.0])
+            stream.append((ts + second, "ADXL345", round(value, 2)))
+        ts += length
+
+        if not short and temp >= config['TRIP_ENGINE_ON_TEMP'] + 1 and rnd.random() < 0.4:
+            # Postój: silnik zgaszony, urządzenie nadaje dalej, temperatura spada poniżej
+            # TRIP_ENGINE_OFF_TEMP; następna jazda zaczyna się bez przerwy (ponowny rozruch)
+            length = rnd.randint(600, 1800)
+            for second in range(length):
+                if second % 10 == 5:
+                    temp = max(20.0, temp - 2.0)
+                    stream.append((ts + second, "MAX6675_NORMAL", round(temp, 2)))
+                else:
+                    stream.append((ts + second, "ADXL345", round(rnd.gauss(9.81, 0.05), 2)))
+            ts += length
+            continue
+
+        ts += rnd.randint(config['TRIP_GAP_SECONDS'] + 1, 10 * 3600)
+        temp = max(20.0, temp - rnd.uniform(0, 70))
+    return stream, expected
+
+def messages(rnd, stream, device_id, user_id):
+    """Strumień -> wiadomości writera (kolejne odczyty jednego czujnika, po 1 - 20)."""
+    batch, i = [], 0
+    while i < len(stream):
+        sensor, size = stream[i][1], rnd.randint(1, 20)
+        readings = []
+        while i < len(stream) and stream[i][1] == sensor and len(readings) < size:
+            readings.append((stream[i][0], stream[i][2]))
+            i += 1
+        batch.append((device_id, user_id, sensor, readings, time.monotonic(), datetime.utcnow()))
+    return batch
+
+def main():
+    parser = argparse.ArgumentParser(description="Zgodność przyrostowego wykrywania jazd z przeliczeniem")
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--devices", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=22)
+    parser.add_argument("--short-trips", type=int, default=1500, help="krótkie jazdy w jednej paczce")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="check_trips_")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "trips.db")
+    os.environ["INGEST_SPILL_DIR"] = workdir
+
+    from app import create_app, db
+    from app.models.device import Device
+    from app.models.trip import Trip, TripState
+    from app.models.user import User
+    from app.utils import trips
+    from app.utils.measurement_writer import MeasurementWriter
+
+    rnd = random.Random(args.seed)
+    app = create_app()
+    failures = []
+
+    with app.app_context():
+        user = User(username="trips", password_hash="-")
+        db.session.add(user)
+        db.session.flush()
+        devices = [Device(mac_address=f"TRIP{i:08X}", user_id=user.id) for i in range(args.devices + 1)]
+        db.session.add_all(devices)
+        db.session.commit()
+        user_id, device_ids = user.id, [d.id for d in devices[:-1]]
+        short_id = devices[-1].id
+
+    writer = MeasurementWriter(app, batch_size=500)
+    expected = {}
+    for device_id in device_ids:
+        stream, expected[device_id] = simulate(rnd, args.days, app.config)
+        batch = messages(rnd, stream, device_id, user_id)
+        i = 0
+        while i < len(batch):
+            size = rnd.randint(1, 300)
+            if not writer._flush(batch[i:i + size]):
+                print("❌ Writer nie zapisał paczki")
+                sys.exit(1)
+            i += size
+
+    # Ostatnie urządzenie: same przestawienia auta, wszystkie w jednej paczce
+    burst, ts = [], START_TS
+    for _ in range(args.short_trips):
+        burst.append((short_id, user_id, "ADXL345", [(ts + second, 9.81) for second in range(10)],
+                      time.monotonic(), datetime.utcnow()))
+        ts += 10 + app.config['TRIP_GAP_SECONDS'] + 1
+    if not writer._flush(burst):
+        print(f"❌ Writer nie zapisał paczki z {args.short_trips} krótkimi jazdami")
+        sys.exit(1)
+    device_ids.append(short_id)
+    expected[short_id] = 0
+    print(f"📦 Zapisano {writer.stats()['total_rows']} odczytów")
+
+    with app.app_context():
+        def snapshot():
+            found = {tuple(r) for r in db.session.execute(db.select(Trip.__table__))}
+            state = {tuple(r) for r in db.session.execute(db.select(TripState.__table__))}
+            db.session.commit()
+            return found, state
+
+        incremental, incremental_state = snapshot()
+        min_seconds = app.config['TRIP_MIN_SECONDS']
+        for device_id in device_ids:
+            # Ostatnia jazda może zostać otwarta - liczy się, jeśli jest dość długa
+            found = sum(1 for r in incremental
+                        if r[0] == device_id and (r[4] or r[3] - r[2] >= min_seconds))
+            if found != expected[device_id]:
+                failures.append(f"urządzenie {device_id}: wykryto {found} jazd, zasymulowano {expected[device_id]}")
+
+        print(f"🚗 Writer: {len(incremental)} jazd, przeliczanie ...")
+        trips.rebuild()
+        rebuilt, rebuilt_state = snapshot()
+        for row in sorted(incremental - rebuilt)[:10]:
+            failures.append(f"tylko przyrostowo: {row}")
+        for row in sorted(rebuilt - incremental)[:10]:
+            failures.append(f"tylko po przeliczeniu: {row}")
+        if incremental_state != rebuilt_state:
+            failures.append(f"stan: {sorted(incremental_state)} != {sorted(rebuilt_state)}")
+
+    for failure in failures[:20]:
+        print(f"❌ {failure}")
+    if failures:
+        print(f"\n❌ {len(failures)} niezgodności")
+        sys.exit(1)
+    print(f"✅ {len(incremental)} jazd zgodnych z przeliczeniem")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from app import db
+from app.models.device import Device
+
+DeviceEntry = namedtuple('DeviceEntry', ['device_id', 'user_id', 'config_interval', 'config_threshold'])
+
+
+class DeviceRegistry:
+    """
+    Pamięć podręczna MAC -> (device_id, user_id, konfiguracja) dla ścieżki MQTT.
+
+    Ładowana w całości przy starcie workera. Kontrolery urządzeń wołają
+    invalidate(mac) po każdej zmianie urządzenia, więc kolejny odczyt
+    pobierze świeże dane z bazy. invalidate działa tylko w procesie API -
+    samodzielne procesy ingestu (ingest_workers.py) o zmianie nie wiedzą,
+    dlatego każdy wpis żyje najwyżej REGISTRY_TTL sekund i po tym czasie
+    jest ponownie czytany z bazy (odpięcie urządzenia albo zmiana właściciela
+    dociera do workerów z takim opóźnieniem). Nieznane adresy MAC trafiają do
+    ograniczonej pamięci negatywnej (z TTL), żeby obcy nadawca nie
+    generował zapytania do bazy przy każdej wiadomości.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._lock = threading.Lock()
+        self._entries = {}  # mac -> (DeviceEntry, ważny do: monotonic)
+        self._negative = OrderedDict()
+        self.ttl = 30.0
+        self.negative_size = 10000
+        self.negative_ttl = 60.0
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.refreshes = 0
+
+    def configure(self, app):
+        """Podpina aplikację bez ładowania urządzeń (proces API) - lookup doczyta je z bazy."""
+        self.app = app
+        self.ttl = app.config['REGISTRY_TTL']
+        self.negative_size = app.config['REGISTRY_NEGATIVE_CACHE_SIZE']
+        self.negative_ttl = app.config['REGISTRY_NEGATIVE_TTL']
+
+    def load(self, app):
+        """Ładuje wszystkie urządzenia z bazy (wywoływane przy starcie workera)."""
+        self.configure(app)
+
+        with app.app_context():
+            rows = db.session.query(
+                Device.mac_address, Device.id, Device.user_id,
+                Device.config_interval, Device.config_threshold
+            ).all()
+
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._entries = {row[0]: (DeviceEntry(*row[1:]), expires) for row in rows}
+            self._negative.clear()
+
+        print(f"📇 Rejestr urządzeń: załadowano {len(rows)} urządzeń")
+
+    def lookup(self, mac_address):
+        """Zwraca DeviceEntry albo None dla nieznanego urządzenia."""
+        with self._lock:
+            cached = self._entries.get(mac_address)
+            if cached is not None:
+                if cached[1] > time.monotonic():
+                    self.hits += 1
+                    return cached[0]
+                # Wpis starszy niż REGISTRY_TTL - właściciel mógł się zmienić w innym procesie
+                del self._entries[mac_address]
+                self.refreshes += 1
+
+            expires = self._negative.get(mac_address)
+            if expires is not None:
+                if expires > time.monotonic():
+                    self.negative_hits += 1
+                    return None
+                del self._negative[mac_address]
+
+            self.misses += 1
+
+        entry = self._fetch(mac_address)
+
+        with self._lock:
+            if entry is not None:
+                self._entries[mac_address] = (entry, time.monotonic() + self.ttl)
+            else:
+                self._negative[mac_address] = time.monotonic() + self.negative_ttl
+                while len(self._negative) > self.negative_size:
+                    self._negative.popitem(last=False)
+
+        if entry is None:
+            print(f"MQTT: Nieznane urządzenie: {mac_address}")
+        return entry
+
+    def invalidate(self, mac_address):
+        """Usuwa wpis (także negatywny) - następny lookup pobierze dane z bazy."""
+        with self._lock:
+            self._entries.pop(mac_address, None)
+            self._negative.pop(mac_address, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.negative_hits
+            return {
+                "devices": len(self._entries),
+                "negative_entries": len(self._negative),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "hit_rate": round((self.hits + self.negative_hits) / lookups, 4) if lookups else None,
+            }
+
+    def _fetch(self, mac_address):
+        if self.app is None:
+            return None
+
+        with self.app.app_context():
+            row = db.session.query(
+                Device.id, Device.user_id,
+                Device.config_interval, Device.config_threshold
+            ).filter(Device.mac_address == mac_address).first()
+
+        return DeviceEntry(*row) if row else None
+
+
+device_registry = DeviceRegistry()
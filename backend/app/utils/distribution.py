@@ -0,0 +1,74 @@
+"""
+Rozkłady odczytów jednej serii (urządzenie + typ czujnika) do strojenia progów alertów.
+
+Seria jest pobierana jako dwie zwarte tablice (array("q") znaczników czasu
+i array("d") wartości - 16 B na odczyt, bez obiektów ORM), a następnie
+liczona wektorowo w NumPy:
+  - podsumowanie (liczba, średnia, odchylenie, min, max),
+  - kwantyle wartości (metoda liniowa jak numpy.quantile),
+  - histogram o zadanej liczbie przedziałów,
+  - tempo zmian między kolejnymi odczytami (dla ADXL345 to jerk w m/s^3,
+    dla temperatury °C/s) - tylko dla par odczytów odległych o 0 < dt <= max_gap,
+    żeby przerwy między jazdami nie zaniżały wyniku.
+
+Porównanie z pętlą po wierszach: python -m app.utils.bench_distribution
+"""
+import numpy as np
+
+from app.utils import measurement_store
+
+
+def fetch_series(device_id, user_id, sensor_type_id, start_ts, end_ts, batch_size=5000):
+    """(timestamps, values) jako tablice numpy posortowane po czasie (tabele, partycje i archiwum)."""
+    timestamps, values = measurement_store.fetch_series(
+        device_id, user_id, sensor_type_id, start_ts, end_ts, batch_size=batch_size
+    )
+    return np.frombuffer(timestamps, dtype=np.int64), np.frombuffer(values, dtype=np.float64)
+
+
+def _summary(values):
+    return {
+        "count": int(values.size),
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+    }
+
+
+def _quantiles(values, quantiles):
+    return {f"{q:g}": float(v) for q, v in zip(quantiles, np.quantile(values, quantiles))}
+
+
+def rate_of_change(timestamps, values, max_gap):
+    """Tempo zmian [jednostka/s] między kolejnymi odczytami odległymi o 0 < dt <= max_gap."""
+    dt = np.diff(timestamps)
+    valid = (dt > 0) & (dt <= max_gap)
+    return np.diff(values)[valid] / dt[valid]
+
+
+def describe(timestamps, values, bins, quantiles, max_gap):
+    """
+    Podsumowanie, kwantyle, histogram i tempo zmian serii (None, gdy seria jest pusta).
+    quantiles: lista z przedziału [0, 1]; histogram: bins równych przedziałów od min do max.
+    """
+    if values.size == 0:
+        return None
+
+    counts, edges = np.histogram(values, bins=bins)
+    result = {
+        "summary": _summary(values),
+        "quantiles": _quantiles(values, quantiles),
+        "histogram": {"edges": edges.tolist(), "counts": counts.tolist()},
+        "rate_of_change": None,
+    }
+
+    rates = rate_of_change(timestamps, values, max_gap)
+    if rates.size:
+        magnitude = np.abs(rates)
+        result["rate_of_change"] = {
+            "pairs": int(rates.size),
+            "max_abs": float(magnitude.max()),
+            "quantiles_abs": _quantiles(magnitude, quantiles),
+        }
+    return result
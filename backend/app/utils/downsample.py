@@ -0,0 +1,96 @@
+"""
+Zmniejszanie liczby punktów serii do wykresu (max_points w /measurements).
+
+  - lttb   - Largest-Triangle-Three-Buckets: wybiera punkty zachowujące kształt
+             linii (szczyty, skoki), jeden przebieg po posortowanej serii,
+  - minmax - podział zakresu na równe przedziały i w każdym punkt z minimum
+             i z maksimum; jeden przebieg, działa też na kubełkach
+             measurement_rollups (min/max kubełka zamiast surowych wierszy).
+
+Serie są trzymane jako array("q") / array("d") (16 B na punkt), nie jako wiersze ORM.
+"""
+from array import array
+
+MODES = ("lttb", "minmax")
+
+
+def lttb(timestamps, values, threshold):
+    """Indeksy threshold punktów wybranych algorytmem LTTB (zawsze z pierwszym i ostatnim)."""
+    count = len(timestamps)
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+
+    every = (count - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Średni punkt następnego przedziału - trzeci wierzchołek trójkąta
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, count)
+        width = next_end - next_start
+        avg_ts = sum(timestamps[next_start:next_end]) / width
+        avg_value = sum(values[next_start:next_end]) / width
+
+        ax, ay = timestamps[a], values[a]
+        best, best_area = next_start - 1, -1.0
+        for j in range(int(i * every) + 1, next_start):
+            area = abs((ax - avg_ts) * (values[j] - ay) - (ax - timestamps[j]) * (avg_value - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(count - 1)
+    return selected
+
+
+class MinMaxBuckets:
+    """
+    Minimum i maksimum w równych przedziałach [start_ts + k*width, ...).
+    add() przyjmuje pojedyncze odczyty (low == high) albo całe kubełki rollupów.
+    """
+
+    def __init__(self, start_ts, end_ts, buckets):
+        self.start_ts = start_ts
+        self.width = max(1, -(-(end_ts - start_ts + 1) // buckets))
+        self._slots = {}
+
+    def add(self, ts, low, high):
+        key = (ts - self.start_ts) // self.width
+        slot = self._slots.get(key)
+        if slot is None:
+            self._slots[key] = [ts, low, ts, high]
+            return
+        if low < slot[1]:
+            slot[0], slot[1] = ts, low
+        if high > slot[3]:
+            slot[2], slot[3] = ts, high
+
+    def points(self):
+        """[(timestamp, value)] posortowane po czasie - min i max każdego przedziału."""
+        result = []
+        for key in sorted(self._slots):
+            low_ts, low, high_ts, high = self._slots[key]
+            if low_ts == high_ts and low == high:
+                result.append((low_ts, low))
+            elif low_ts <= high_ts:
+                result += [(low_ts, low), (high_ts, high)]
+            else:
+                result += [(high_ts, high), (low_ts, low)]
+        return result
+
+
+def downsample(timestamps, values, max_points, mode="lttb"):
+    """Seria surowych punktów (tablice) -> [(timestamp, value)] o najwyżej max_points punktach."""
+    if len(timestamps) <= max_points:
+        return list(zip(timestamps, values))
+    if mode == "minmax":
+        buckets = MinMaxBuckets(timestamps[0], timestamps[-1], max_points // 2)
+        for ts, value in zip(timestamps, values):
+            buckets.add(ts, value, value)
+        return buckets.points()
+    return [(timestamps[i], values[i]) for i in lttb(timestamps, values, max_points)]
+
+
+def new_series():
+    """Para pustych tablic (timestamps, values) do zbierania surowej serii."""
+    return array("q"), array("d")
@@ -0,0 +1,197 @@
+"""
+Raport floty: ocena stylu jazdy i temperatura silnika wszystkich urządzeń naraz
+(te same wyniki co analyze_acceleration / analyze_engine_temperature), np.
+"które auta miały zderzenie w tym tygodniu", "średnia temperatura silnika floty".
+
+Urządzenia i okres są dzielone na części: po FLEET_DEVICE_CHUNK urządzeń i po
+FLEET_TIME_CHUNK_DAYS dni (granice wyrównane do doby UTC, więc części nie
+przecinają dziennych kubełków measurement_rollups). Część zbiera urządzenia
+wielu właścicieli - flota z tysiącami użytkowników po jednym aucie to wtedy
+kilkadziesiąt części, a nie tysiące drobnych zadań dla puli. Statystyki
+urządzenia liczą tylko odczyty jego właściciela, więc w części zapytania idą
+osobno dla każdego właściciela. Każda część to agregaty SeriesAggregate liczone
+w osobnym procesie (ProcessPoolExecutor) tym samym kodem co /api/stats/dashboard;
+agregaty części łączy się przez merge().
+
+Procesy puli są uruchamiane metodą spawn i każdy tworzy własną aplikację
+i pulę połączeń z bazą (jak ingest_workers.py).
+
+Uruchomienie (z katalogu backend):
+  python -m app.utils.fleet_report --days 7
+  python -m app.utils.fleet_report --start 2024-05-01 --end 2024-05-31 --min-temp 60 --workers 8 --json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from app import db
+from app.utils import rollups
+from app.utils.sensor_types import sensor_types, ADXL345, MAX6675_NORMAL
+from app.utils.series_aggregate import SeriesAggregate
+
+DAY = 86400
+
+_worker_app = None
+_pool_lock = threading.Lock()
+
+
+def plan_chunks(owners, start_ts, end_ts, device_chunk, time_chunk_days):
+    """
+    Części raportu: [(series, od, do)] - series to do device_chunk par (user_id, device_id),
+    także różnych właścicieli; rozłączne, domknięte przedziały czasu wyrównane do doby UTC.
+    owners: {user_id: [device_id]}.
+    """
+    step = max(1, time_chunk_days) * DAY
+    spans = []
+    lo = start_ts
+    while lo <= end_ts:
+        hi = min((lo // step + 1) * step - 1, end_ts)
+        spans.append((lo, hi))
+        lo = hi + 1
+
+    # Urządzenia jednego właściciela obok siebie - mniej zapytań w części
+    series = sorted((user_id, device_id) for user_id, device_ids in owners.items() for device_id in device_ids)
+    chunks = []
+    for i in range(0, len(series), max(1, device_chunk)):
+        part = tuple(series[i:i + device_chunk])
+        chunks.extend((part, lo, hi) for lo, hi in spans)
+    return chunks
+
+
+def aggregate_chunk(series, start_ts, end_ts, min_temp=None):
+    """
+    Agregaty jednej części: {(device_id, sensor_type_id): SeriesAggregate} dla ADXL345
+    i MAX6675_NORMAL (przy min_temp tylko odczyty > min_temp); series: pary
+    (user_id, device_id). Wymaga app_context.
+    """
+    adxl_id, temp_id = sensor_types.get_id(ADXL345), sensor_types.get_id(MAX6675_NORMAL)
+    thresholds = {temp_id: float(min_temp)} if min_temp is not None else None
+    by_user = {}
+    for user_id, device_id in series:
+        by_user.setdefault(user_id, []).append(device_id)
+
+    result = {}
+    for user_id, device_ids in by_user.items():
+        # Urządzenie ma jednego właściciela - klucze grup się nie powtarzają
+        result.update(rollups.aggregate_window_grouped(
+            device_ids, user_id, [adxl_id, temp_id], start_ts, end_ts, thresholds
+        ))
+    return result
+
+
+def _init_worker():
+    global _worker_app
+    from app import create_app
+
+    _worker_app = create_app()
+    _worker_app.app_context().push()
+
+
+def _run_chunk(task):
+    try:
+        return aggregate_chunk(*task)
+    finally:
+        db.session.remove()  # bez otwartej transakcji odczytu między częściami
+
+
+def create_pool(workers):
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+
+
+def get_pool(app):
+    """Pula procesów API (app.extensions['fleet_pool']) - start procesów tylko przy pierwszym raporcie."""
+    with _pool_lock:
+        pool = app.extensions.get('fleet_pool')
+        if pool is None:
+            pool = app.extensions['fleet_pool'] = create_pool(resolve_workers(app.config['FLEET_REPORT_WORKERS']))
+        return pool
+
+
+def resolve_workers(workers):
+    return workers if workers and workers > 0 else (os.cpu_count() or 1)
+
+
+def fleet_aggregates(owners, start_ts, end_ts, min_temp=None, workers=1,
+                     device_chunk=50, time_chunk_days=7, pool=None):
+    """
+    {(device_id, sensor_type_id): SeriesAggregate} całego okresu dla wszystkich urządzeń
+    i liczba części. Przy workers <= 1 (bez pool) części liczone są w tym procesie.
+    """
+    tasks = [task + (min_temp,) for task in plan_chunks(owners, start_ts, end_ts, device_chunk, time_chunk_days)]
+
+    if pool is not None:
+        partials = pool.map(_run_chunk, tasks)
+    elif workers > 1 and len(tasks) > 1:
+        with create_pool(min(workers, len(tasks))) as own_pool:
+            partials = list(own_pool.map(_run_chunk, tasks))
+    else:
+        partials = (aggregate_chunk(*task) for task in tasks)
+
+    totals = {}
+    for partial in partials:
+        for key, aggregate in partial.items():
+            current = totals.get(key)
+            if current is None:
+                current = totals[key] = SeriesAggregate()
+            current.merge(aggregate)
+    return totals, len(tasks)
+
+
+def _print_report(report):
+    fleet = report["fleet"]
+    print(f"🚗 Flota: {fleet['devices']} urządzeń, {fleet['devices_with_data']} z odczytami "
+          f"({report['period']['start']} - {report['period']['end']}, "
+          f"{report['chunks']} części, {report['workers']} procesów)")
+    print(f"{'MAC':>18} {'ocena':>6} {'manewry':>8} {'zderzenia':>10} {'śr. temp':>9} {'max temp':>9}")
+    rows = sorted(report["devices"], key=lambda d: (-d["acceleration"]["stats"]["total_crashes"],
+                                                   d["acceleration"]["score"]))
+    for device in rows:
+        stats, temp = device["acceleration"]["stats"], device["engine_temp"]
+        print(f"{device['mac_address']:>18} {device['acceleration']['score']:>6} {stats['total_harsh']:>8} "
+              f"{stats['total_crashes']:>10} {temp['avg_temp'] if temp else '-':>9} "
+              f"{temp['max_temp'] if temp else '-':>9}")
+    if fleet["crashed_devices"]:
+        print(f"💥 Zderzenia: {', '.join(fleet['crashed_devices'])}")
+    if fleet["engine_temp"]:
+        print(f"🌡️ Temperatura silnika floty: średnia {fleet['engine_temp']['avg_temp']}°C, "
+              f"max {fleet['engine_temp']['max_temp']}°C ({fleet['engine_temp']['total_readings']} odczytów)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raport floty (wszystkie urządzenia)")
+    parser.add_argument("--start", help="początek okresu (ISO), domyślnie --days dni przed --end")
+    parser.add_argument("--end", help="koniec okresu (ISO), domyślnie teraz")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--min-temp", type=float, help="średnia temperatura tylko z odczytów > próg")
+    parser.add_argument("--workers", type=int, help="liczba procesów (domyślnie FLEET_REPORT_WORKERS)")
+    parser.add_argument("--json", action="store_true", help="wynik jako JSON")
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.controllers.stats_controller import analyze_fleet
+
+    end_date = datetime.fromisoformat(args.end) if args.end else datetime.now()
+    if args.end and end_date.hour == 0 and end_date.minute == 0:
+        end_date = end_date.replace(hour=23, minute=59, second=59)
+    start_date = datetime.fromisoformat(args.start) if args.start else end_date - timedelta(days=args.days)
+
+    app = create_app()
+    workers = resolve_workers(args.workers if args.workers is not None else app.config['FLEET_REPORT_WORKERS'])
+    with app.app_context():
+        report = analyze_fleet(start_date, end_date, args.min_temp, workers=workers)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Kodowanie serii czasowych w stylu Gorilla (Facebook, VLDB 2015).
+
+Timestampy: pierwszy zapisany wprost, potem delta-of-delta - przy stałym
+interwale wysyłki każdy kolejny odczyt to 1 bit. Wartości: XOR z poprzednią
+wartością float64 - powtórzona wartość to 1 bit, wolno zmieniająca się
+(temperatura silnika z MAX6675, krok 0.25 st.) to zwykle kilkanaście bitów.
+
+Używane przez archiwum kolumnowe (archive.py, ARCHIVE_CODEC=gorilla) do
+kodowania bloków. Czysty Python, bez zależności - koduje bloki po kilka
+tysięcy odczytów, więc dekodowanie strumieniowe wystarcza do zapytań.
+"""
+from array import array
+
+# delta-of-delta: (prefiks, długość prefiksu, bity wartości)
+_DOD_CLASSES = (
+    (0b10, 2, 7),
+    (0b110, 3, 9),
+    (0b1110, 4, 12),
+)
+
+
+class BitWriter:
+    def __init__(self):
+        self._out = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value, width):
+        self._acc = (self._acc << width) | (value & ((1 << width) - 1))
+        self._bits += width
+        if self._bits >= 64:
+            self._bits -= 64
+            self._out += (self._acc >> self._bits).to_bytes(8, "big")
+            self._acc &= (1 << self._bits) - 1
+
+    def getvalue(self):
+        out = bytearray(self._out)
+        if self._bits:
+            pad = -self._bits % 8
+            out += (self._acc << pad).to_bytes((self._bits + pad) // 8, "big")
+        return bytes(out)
+
+
+class BitReader:
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+        self._acc = 0
+        self._bits = 0
+
+    def read(self, width):
+        while self._bits < width:
+            chunk = self._data[self._pos:self._pos + 8]
+            self._pos += 8
+            self._acc = (self._acc << 64) | int.from_bytes(bytes(chunk).ljust(8, b"\0"), "big")
+            self._bits += 64
+        self._bits -= width
+        value = self._acc >> self._bits
+        self._acc &= (1 << self._bits) - 1
+        return value
+
+
+def _signed(value, width):
+    return value - (1 << width) if value >= 1 << (width - 1) else value
+
+def encode_timestamps(timestamps):
+    """Lista int (sekundy) -> bytes."""
+    writer = BitWriter()
+    if not timestamps:
+        return writer.getvalue()
+    writer.write(timestamps[0], 64)
+    prev, prev_delta = timestamps[0], 0
+    for ts in timestamps[1:]:
+        delta = ts - prev
+        dod = delta - prev_delta
+        if dod == 0:
+            writer.write(0, 1)
+        else:
+            for prefix, prefix_bits, bits in _DOD_CLASSES:
+                if -(1 << (bits - 1)) < dod <= 1 << (bits - 1):
+                    writer.write(prefix, prefix_bits)
+                    writer.write(dod - 1 if dod > 0 else dod, bits)
+                    break
+            else:
+                writer.write(0b1111, 4)
+                writer.write(dod, 64)
+        prev, prev_delta = ts, delta
+    return writer.getvalue()
+
+def decode_timestamps(data, count):
+    """bytes z encode_timestamps -> lista count timestampów."""
+    if not count:
+        return []
+    reader = BitReader(data)
+    ts = _signed(reader.read(64), 64)
+    result = [ts]
+    delta = 0
+    read = reader.read
+    for _ in range(count - 1):
+        if read(1) == 0:
+            dod = 0
+        else:
+            for _, _, bits in _DOD_CLASSES:
+                if read(1) == 0:
+                    dod = _signed(read(bits), bits)
+                    if dod >= 0:
+                        dod += 1
+                    break
+            else:
+                dod = _signed(read(64), 64)
+        delta += dod
+        ts += delta
+        result.append(ts)
+    return result
+
+def encode_values(values):
+    """Lista float -> bytes (XOR z poprzednią wartością)."""
+    writer = BitWriter()
+    if not values:
+        return writer.getvalue()
+    # Bity float64 jako liczby całkowite - jedna konwersja całej listy przez array
+    as_bits = array("Q")
+    as_bits.frombytes(array("d", values).tobytes())
+    prev = as_bits[0]
+    writer.write(prev, 64)
+    write = writer.write
+    prev_lead, prev_trail = -1, -1
+
+    for current in as_bits[1:]:
+        xor = current ^ prev
+        prev = current
+        if xor == 0:
+            write(0, 1)
+            continue
+        lead = 64 - xor.bit_length()
+        trail = (xor & -xor).bit_length() - 1
+        if lead > 31:
+            lead = 31
+        if prev_lead >= 0 and lead >= prev_lead and trail >= prev_trail:
+            # Znaczące bity mieszczą się w oknie poprzedniej wartości
+            write(0b10, 2)
+            write(xor >> prev_trail, 64 - prev_lead - prev_trail)
+        else:
+            meaningful = 64 - lead - trail
+            write(0b11, 2)
+            write(lead, 5)
+            write(meaningful & 63, 6)  # 64 zapisujemy jako 0
+            write(xor >> trail, meaningful)
+            prev_lead, prev_trail = lead, trail
+    return writer.getvalue()
+
+def decode_values(data, count):
+    """bytes z encode_values -> array("d") count wartości."""
+    if not count:
+        return []
+    reader = BitReader(data)
+    read = reader.read
+    prev = read(64)
+    as_bits = array("Q", [prev])
+    append = as_bits.append
+    lead = trail = 0
+
+    for _ in range(count - 1):
+        if read(1) == 1:
+            if read(1) == 1:
+                lead = read(5)
+                meaningful = read(6) or 64
+                trail = 64 - lead - meaningful
+            prev ^= read(64 - lead - trail) << trail
+        append(prev)
+    values = array("d")
+    values.frombytes(as_bits.tobytes())
+    return values
@@ -0,0 +1,57 @@
+"""
+Szybsza serializacja odpowiedzi JSON (jsonify we wszystkich blueprintach).
+
+Gdy zainstalowany jest orjson (w requirements.txt; bez niego działa stdlib), dumps()
+i response() używają go zamiast json ze stdlib, co przy dużych listach
+pomiarów skraca serializację kilkukrotnie. Wynik jest taki sam jak
+w DefaultJSONProvider Flaska: klucze posortowane, datetime jako http_date,
+Decimal/UUID jako napis. Bez orjson albo przy JSON_PRETTY=true (wcięcia,
+do ręcznego oglądania odpowiedzi) działa zwykły provider - niezależnie od
+trybu debug serwera (run.py uruchamia się z debug=True).
+"""
+import dataclasses
+import decimal
+import uuid
+from datetime import date
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # Daty przez _default (http_date jak we Flasku), nie w formacie ISO orjson
+    _OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+
+def _default(o):
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    def _use_orjson(self):
+        return orjson is not None and self.compact is not False
+
+    def dumps(self, obj, **kwargs):
+        # Ten sam wybór co w response() - /live (dumps) i jsonify (response) dają taki sam JSON
+        if not self._use_orjson() or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=_OPTIONS).decode()
+
+    def response(self, *args, **kwargs):
+        if not self._use_orjson():
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=_OPTIONS) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,87 @@
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import case, update
+
+from app import db
+from app.models.device import Device
+
+
+class LastSeenTracker:
+    """
+    Czas ostatniej aktywności urządzeń trzymany w pamięci workera MQTT.
+
+    Zamiast UPDATE-u tabeli devices przy każdej wiadomości, worker tylko
+    zapamiętuje czas (touch), a writer co HEARTBEAT_FLUSH_INTERVAL sekund
+    zapisuje wszystkie zmiany jednym UPDATE ... SET last_seen = CASE id ...
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_seen = {}
+        self._pending = {}
+        self.flush_interval = 10.0
+        self._next_flush = time.monotonic() + self.flush_interval
+        self.total_flushes = 0
+        self.last_flush_devices = 0
+
+    def configure(self, app):
+        self.flush_interval = app.config['HEARTBEAT_FLUSH_INTERVAL']
+        self._next_flush = time.monotonic() + self.flush_interval
+
+    def touch(self, device_id, when=None):
+        when = when or datetime.utcnow()
+        with self._lock:
+            self._last_seen[device_id] = when
+            self._pending[device_id] = when
+
+    def get(self, device_id):
+        """Najświeższy znany czas aktywności z pamięci (None, gdy brak)."""
+        with self._lock:
+            return self._last_seen.get(device_id)
+
+    def merge(self, device_id, db_value):
+        """Zwraca nowszą z wartości: z bazy albo z pamięci workera."""
+        in_memory = self.get(device_id)
+        if in_memory is None:
+            return db_value
+        if db_value is None or in_memory > db_value:
+            return in_memory
+        return db_value
+
+    def flush_if_due(self, app):
+        if time.monotonic() < self._next_flush:
+            return
+        self._next_flush = time.monotonic() + self.flush_interval
+        self.flush(app)
+
+    def flush(self, app):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        if not pending:
+            return
+
+        with app.app_context():
+            try:
+                db.session.execute(
+                    update(Device)
+                    .where(Device.id.in_(pending.keys()))
+                    .values(last_seen=case(pending, value=Device.id))
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Heartbeat: Błąd zapisu last_seen: {e}")
+                # Oddajemy niezapisane wartości (chyba że w międzyczasie przyszły nowsze)
+                with self._lock:
+                    for device_id, when in pending.items():
+                        self._pending.setdefault(device_id, when)
+                return
+
+        self.total_flushes += 1
+        self.last_flush_devices = len(pending)
+
+
+last_seen_tracker = LastSeenTracker()
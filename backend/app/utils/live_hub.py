@@ -0,0 +1,202 @@
+"""
+Pomiary na żywo przez Server-Sent Events (GET /api/devices/<mac>/live).
+
+Writer po każdej zapisanej paczce woła live_hub.publish_rows(rows) - odczyty
+trafiają do bufora każdego połączenia, które subskrybuje to urządzenie
+(tylko wiersze właściciela, który otworzył połączenie, jak w /measurements).
+publish_rows nie czeka na klientów: dopisuje do buforów i budzi ich wątki.
+
+Każde połączenie ma własny, ograniczony bufor (LIVE_BUFFER_SIZE odczytów).
+Wolny klient nie spowalnia writera ani innych klientów - przy pełnym buforze
+najstarsze odczyty wypadają, a następne zdarzenie ma pole "skipped" z ich
+liczbą (klient może wtedy doczytać luki z /measurements). Odczyty zebrane
+w ciągu LIVE_COALESCE_INTERVAL są wysyłane jednym zdarzeniem, więc klient
+dostaje najwyżej kilka zdarzeń na sekundę niezależnie od tempa ingestu.
+
+Hub żyje w procesie API, więc dostaje odczyty od writera uruchomionego
+w tym samym procesie (run.py). Przy ingeście w osobnych procesach
+(ingest_workers.py) połączenia dostają tylko keepalive.
+"""
+import threading
+import time
+from collections import deque
+
+from app.utils.sensor_types import sensor_types
+
+
+class LiveSubscription:
+    """Jedno połączenie SSE: urządzenie, właściciel, filtr czujników i bufor odczytów."""
+
+    def __init__(self, device_id, user_id, sensor_type_ids, buffer_size):
+        self.device_id = device_id
+        self.user_id = user_id
+        self.sensor_type_ids = sensor_type_ids  # None = wszystkie typy
+        self.readings = deque(maxlen=buffer_size)  # (timestamp, wartość, nazwa czujnika, id typu)
+        self.skipped = 0
+        self.ready = threading.Event()
+
+
+class LiveHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_device = {}  # device_id -> set(LiveSubscription)
+        self._count = 0
+
+        self.buffer_size = 1000
+        self.coalesce_interval = 0.25
+        self.keepalive = 15.0
+        self.max_subscribers = 1000
+
+        self.published_rows = 0
+        self.queued_readings = 0
+        self.skipped_readings = 0
+        self.events = 0
+        self.rejected = 0
+
+    def configure(self, app):
+        self.buffer_size = app.config['LIVE_BUFFER_SIZE']
+        self.coalesce_interval = app.config['LIVE_COALESCE_INTERVAL']
+        self.keepalive = app.config['LIVE_KEEPALIVE_SECONDS']
+        self.max_subscribers = app.config['LIVE_MAX_SUBSCRIBERS']
+
+    def subscribe(self, device_id, user_id, sensor_type_ids=None):
+        """Nowa subskrypcja albo None, gdy osiągnięto LIVE_MAX_SUBSCRIBERS."""
+        subscription = LiveSubscription(
+            device_id, int(user_id),
+            frozenset(sensor_type_ids) if sensor_type_ids else None,
+            self.buffer_size,
+        )
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            self._by_device.setdefault(device_id, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._by_device.get(subscription.device_id)
+            if subscriptions is None or subscription not in subscriptions:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._by_device[subscription.device_id]
+            self._count -= 1
+
+    def publish_rows(self, rows):
+        """
+        Rozsyła świeżo zapisane wiersze (słowniki writera) do subskrybentów ich urządzeń.
+        Wołane z wątku writera w app_context; bez subskrybentów kosztuje jedno sprawdzenie.
+        """
+        if not self._by_device:
+            return 0
+
+        # Odczyty grupowane raz na (urządzenie, właściciel) - subskrybent dostaje
+        # gotową listę (deque.extend), a nie pętlę po wierszach na każde połączenie
+        names = {}
+        grouped = {}
+        for row in rows:
+            if row["device_id"] not in self._by_device:
+                continue
+            type_id = row["sensor_type_id"]
+            name = names.get(type_id)
+            if name is None:
+                name = names[type_id] = sensor_types.get_name(type_id)
+            key = (row["device_id"], row["user_id"])
+            readings = grouped.get(key)
+            if readings is None:
+                readings = grouped[key] = []
+            readings.append((row["timestamp"], row["value"], name, type_id))
+        if not grouped:
+            return 0
+
+        woken = []
+        queued = skipped = 0
+        with self._lock:
+            for (device_id, user_id), readings in grouped.items():
+                for subscription in self._by_device.get(device_id, ()):
+                    if subscription.user_id != user_id:
+                        continue
+                    selected = readings
+                    if subscription.sensor_type_ids is not None:
+                        selected = [r for r in readings if r[3] in subscription.sensor_type_ids]
+                        if not selected:
+                            continue
+                    # Wolny klient - przy pełnym buforze wypadają najstarsze odczyty
+                    overflow = len(subscription.readings) + len(selected) - subscription.readings.maxlen
+                    if overflow > 0:
+                        subscription.skipped += overflow
+                        skipped += overflow
+                    subscription.readings.extend(selected)
+                    woken.append(subscription)
+                    queued += len(selected)
+            self.published_rows += len(rows)
+            self.queued_readings += queued
+            self.skipped_readings += skipped
+
+        for subscription in woken:
+            subscription.ready.set()
+        return queued
+
+    def _take(self, subscription):
+        with self._lock:
+            subscription.ready.clear()
+            readings = list(subscription.readings)
+            subscription.readings.clear()
+            skipped, subscription.skipped = subscription.skipped, 0
+            if readings or skipped:
+                self.events += 1
+        return readings, skipped
+
+    def stream(self, subscription, dumps, expires_at=None):
+        """
+        Generator zdarzeń SSE dla subskrypcji (dumps: serializacja JSON aplikacji).
+        Kończy się przy wygaśnięciu tokenu (expires_at, epoch) albo rozłączeniu
+        klienta - zapis keepalive do zerwanego połączenia zamyka generator.
+        """
+        try:
+            yield "retry: 3000\n\n"
+            next_event = 0.0
+            while True:
+                if expires_at is not None and time.time() >= expires_at:
+                    yield "event: expired\ndata: {}\n\n"
+                    return
+
+                if not subscription.ready.wait(self.keepalive):
+                    yield ": keepalive\n\n"
+                    continue
+
+                # Odczyty z kolejnych paczek writera zbierane w jedno zdarzenie
+                delay = next_event - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+                readings, skipped = self._take(subscription)
+                if not readings and not skipped:
+                    continue
+                payload = {
+                    "ts": [r[0] for r in readings],
+                    "value": [r[1] for r in readings],
+                    "sensor": [r[2] for r in readings],
+                    "skipped": skipped,
+                }
+                yield f"event: measurements\ndata: {dumps(payload)}\n\n"
+                next_event = time.monotonic() + self.coalesce_interval
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": self._count,
+                "devices": len(self._by_device),
+                "published_rows": self.published_rows,
+                "queued_readings": self.queued_readings,
+                "skipped_readings": self.skipped_readings,
+                "events": self.events,
+                "rejected": self.rejected,
+            }
+
+
+live_hub = LiveHub()
@@ -0,0 +1,134 @@
+"""
+Wspólne zapytania do pomiarów, niezależne od tego, gdzie fizycznie leżą wiersze
+(tabela measurements, ewentualne partycje miesięczne - patrz partitions.py -
+i pliki archiwum kolumnowego - patrz archive.py).
+"""
+import heapq
+from array import array
+from itertools import chain, islice
+
+import numpy as np
+from sqlalchemy import select, union_all
+
+from app import db
+from app.utils import archive
+from app.utils import partitions
+
+ROW_COLUMNS = ("timestamp", "value", "sensor_type_id", "received_at")
+
+def series_filters(table, device_id, user_id, start_ts=None, end_ts=None, sensor_type_id=None):
+    c = table.c
+    filters = [c.device_id == device_id, c.user_id == user_id]
+    if sensor_type_id is not None:
+        filters.append(c.sensor_type_id == sensor_type_id)
+    if start_ts is not None:
+        filters.append(c.timestamp >= start_ts)
+    if end_ts is not None:
+        filters.append(c.timestamp <= end_ts)
+    return filters
+
+def series_subquery(device_id, user_id, start_ts, end_ts, sensor_type_id=None,
+                    columns=("value",), extra_filters=None):
+    """
+    Podzapytanie (UNION ALL po partycjach w zakresie) z wybranymi kolumnami.
+    Każda gałąź ma własne filtry, więc korzysta z indeksu swojej tabeli.
+    extra_filters: funkcja table -> lista dodatkowych warunków.
+    """
+    selects = []
+    for table in partitions.tables_for_range(start_ts, end_ts):
+        filters = series_filters(table, device_id, user_id, start_ts, end_ts, sensor_type_id)
+        if extra_filters is not None:
+            filters.extend(extra_filters(table))
+        selects.append(select(*[table.c[name] for name in columns]).where(*filters))
+
+    if len(selects) == 1:
+        return selects[0].subquery("series")
+    return union_all(*selects).subquery("series")
+
+def row_selects(device_id, user_id, start_ts=None, end_ts=None, limit=None, columns=ROW_COLUMNS,
+                sensor_type_id=None):
+    """Osobne zapytanie na każdą tabelę, każde posortowane po czasie (z indeksu)."""
+    selects = []
+    for table in partitions.tables_for_range(start_ts, end_ts):
+        query = (
+            select(*[table.c[name] for name in columns])
+            .where(*series_filters(table, device_id, user_id, start_ts, end_ts, sensor_type_id))
+            .order_by(table.c.timestamp.asc())
+        )
+        if limit is not None:
+            query = query.limit(limit)
+        selects.append(query)
+    return selects
+
+def _table_streams(device_id, user_id, start_ts, end_ts, limit, columns, batch_size, sensor_type_id):
+    def execute():
+        selects = row_selects(device_id, user_id, start_ts, end_ts, limit, columns, sensor_type_id)
+        if batch_size is not None:
+            selects = [query.execution_options(yield_per=batch_size) for query in selects]
+        return [db.session.execute(query) for query in selects]
+
+    return partitions.retry_missing(execute)
+
+def _merge(streams):
+    if len(streams) == 1:
+        return iter(streams[0])
+    return heapq.merge(*streams, key=lambda row: row.timestamp)
+
+def _peek(stream):
+    """(pierwszy wiersz albo None, ten sam strumień od początku)."""
+    rows = iter(stream)
+    first = next(rows, None)
+    return first, rows if first is None else chain((first,), rows)
+
+def iter_rows(device_id, user_id, start_ts=None, end_ts=None, limit=None, columns=ROW_COLUMNS,
+              batch_size=None, sensor_type_id=None):
+    """
+    Wiersze pomiarów posortowane po timestamp. Zamiast ORDER BY na UNION-ie
+    (sortowanie w pamięci) scalamy już posortowane wyniki poszczególnych tabel
+    i plików archiwum (columns: podzbiór ROW_COLUMNS).
+
+    batch_size: wiersze pobierane z kursora po stronie serwera (PostgreSQL)
+    paczkami tej wielkości zamiast całego wyniku naraz - stała pamięć dla
+    dowolnie dużego zakresu (eksport).
+    """
+    streams = _table_streams(device_id, user_id, start_ts, end_ts, limit, columns, batch_size, sensor_type_id)
+    archived = archive.iter_rows(device_id, user_id, start_ts, end_ts, sensor_type_id)
+    if archived is None:
+        rows = _merge(streams)
+    else:
+        archived_rows, archived_last = archived
+        # Wiersze z bazy są zwykle nowsze niż całe archiwum - wtedy archiwum idzie
+        # przed nimi w całości, bez porównywania wiersz po wierszu
+        peeked = [_peek(stream) for stream in streams]
+        streams = [stream for _, stream in peeked]
+        if all(first is None or first.timestamp > archived_last for first, _ in peeked):
+            rows = chain(archived_rows, _merge(streams))
+        else:
+            rows = heapq.merge(*streams, archived_rows, key=lambda row: row.timestamp)
+    return islice(rows, limit) if limit is not None else rows
+
+def fetch_series(device_id, user_id, sensor_type_id, start_ts, end_ts, batch_size=5000):
+    """
+    (timestamps, values) jednej serii jako array("q") / array("d") posortowane po czasie.
+    Bloki archiwum są doklejane całymi tablicami, bez obiektu na wiersz.
+    """
+    timestamps, values = array("q"), array("d")
+    for _, block_ts, block_values, _ in archive.iter_blocks(device_id, user_id, start_ts, end_ts, sensor_type_id):
+        timestamps.extend(array("q", block_ts))
+        values.extend(array("d", block_values))
+    archived = len(timestamps)
+
+    streams = _table_streams(device_id, user_id, start_ts, end_ts, None, ("timestamp", "value"),
+                             batch_size, sensor_type_id)
+    for ts, value in _merge(streams):
+        timestamps.append(ts)
+        values.append(value)
+
+    if archived and archived < len(timestamps):
+        # Wiersze z bazy starsze niż archiwum (np. spóźnione odczyty) - stabilne sortowanie tablic
+        ts = np.frombuffer(timestamps, dtype=np.int64)
+        if (ts[1:] < ts[:-1]).any():
+            order = np.argsort(ts, kind="stable")
+            timestamps = array("q", ts[order].tobytes())
+            values = array("d", np.frombuffer(values, dtype=np.float64)[order].tobytes())
+    return timestamps, values
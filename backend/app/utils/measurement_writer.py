@@ -0,0 +1,407 @@
+import os
+import queue
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, DataError, IntegrityError, StatementError
+
+from app import db
+from app.models.measurement import Measurement
+from app.utils.device_registry import device_registry
+from app.utils.last_seen import last_seen_tracker
+from app.utils.stats_cache import stats_cache
+from app.utils.live_hub import live_hub
+from app.utils.spill_log import SpillLog, DeadLetterLog
+from app.utils.sensor_types import sensor_types
+from app.utils import partitions
+from app.utils import rollups
+from app.utils import trips
+from app.utils import metrics
+
+OVERFLOW_POLICIES = ("spill", "drop_oldest", "drop_newest", "block")
+
+
+def is_data_error(error):
+    """
+    Błąd samych danych (NOT NULL, CHECK, liczba poza zakresem kolumny) - ponowienie
+    tej samej paczki nigdy się nie uda. OperationalError (blokada bazy, zerwane
+    połączenie) i inne błędy bazy są przejściowe.
+    """
+    if isinstance(error, (IntegrityError, DataError)):
+        return True
+    if isinstance(error, DBAPIError):
+        return False
+    if isinstance(error, StatementError):  # błąd przy wiązaniu parametrów, przed wysłaniem do bazy
+        error = error.orig
+    return isinstance(error, (ValueError, TypeError, OverflowError))
+
+def _rows_in(batch):
+    return sum(len(item[3]) for item in batch)
+
+def _split(batch):
+    """Dwie połowy paczki; pojedyncza wiadomość dzielona jest po odczytach."""
+    if len(batch) > 1:
+        middle = len(batch) // 2
+        return batch[:middle], batch[middle:]
+    item = batch[0]
+    middle = len(item[3]) // 2
+    return [item[:3] + (item[3][:middle],) + item[4:]], [item[:3] + (item[3][middle:],) + item[4:]]
+
+
+class MeasurementWriter(threading.Thread):
+    """
+    Wątek zapisujący pomiary z MQTT do bazy paczkami.
+
+    on_message tylko parsuje wiadomość i wrzuca jej odczyty do kolejki (submit),
+    a ten wątek zbiera odczyty i zapisuje je jednym INSERT-em (executemany),
+    gdy uzbiera się INGEST_BATCH_SIZE wierszy albo najstarszy odczyt czeka
+    dłużej niż INGEST_FLUSH_INTERVAL sekund.
+
+    Kolejka ma ograniczony rozmiar (INGEST_QUEUE_SIZE wiadomości). Gdy jest
+    pełna, decyduje INGEST_OVERFLOW_POLICY:
+      spill       - dopisanie do pliku WAL na dysku (SpillLog), odtwarzanego
+                    w kolejności, gdy baza znów nadąża (także po restarcie)
+      drop_oldest - wyrzucenie najstarszej wiadomości z kolejki
+      drop_newest - odrzucenie nowej wiadomości
+      block       - czekanie do INGEST_BLOCK_TIMEOUT s (blokuje wątek paho!)
+    Paczki, których nie udało się zapisać do bazy, w trybie spill też trafiają do WAL.
+
+    Błąd danych (is_data_error, np. NaN zapisany przez SQLite jako NULL) nie
+    wstrzymuje ingestu: paczka jest dzielona na połowy aż do pojedynczych
+    odczytów, poprawne części są zapisywane, a odrzucone odczyty trafiają do
+    pliku dead-letter (<WAL>_dead_letter.ndjson) zamiast z powrotem do WAL.
+    """
+
+    def __init__(self, app, batch_size=None, flush_interval=None, spill_name="ingest_spill.wal"):
+        super().__init__(name="measurement-writer", daemon=True)
+        self.app = app
+        self.batch_size = batch_size or app.config['INGEST_BATCH_SIZE']
+        self.flush_interval = flush_interval or app.config['INGEST_FLUSH_INTERVAL']
+        self.stats_interval = app.config['INGEST_STATS_INTERVAL']
+
+        self.overflow_policy = app.config['INGEST_OVERFLOW_POLICY']
+        if self.overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Nieznana polityka INGEST_OVERFLOW_POLICY: {self.overflow_policy}")
+        self.block_timeout = app.config['INGEST_BLOCK_TIMEOUT']
+        self.retry_interval = app.config['INGEST_RETRY_INTERVAL']
+
+        self.queue = queue.Queue(maxsize=app.config['INGEST_QUEUE_SIZE'])
+        self.running = True
+
+        spill_dir = app.config['INGEST_SPILL_DIR'] or app.instance_path
+        self.spill = SpillLog(os.path.join(spill_dir, spill_name), fsync=app.config['INGEST_SPILL_FSYNC'])
+        self.dead_letter = DeadLetterLog(os.path.join(spill_dir, os.path.splitext(spill_name)[0] + "_dead_letter.ndjson"))
+        self._retry_at = 0.0
+
+        # Statystyki do strojenia (przepustowość vs. świeżość danych)
+        self._stats_lock = threading.Lock()
+        self.total_rows = 0
+        self.total_flushes = 0
+        self.failed_rows = 0
+        self.dropped_messages = 0
+        self.replayed_rows = 0
+        self.replay_rate = 0.0
+        self.last_flush_size = 0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+        self.last_flush_duration = 0.0
+
+    def submit(self, device_id, user_id, sensor_type, readings):
+        """
+        Dodaje odczyty jednej wiadomości (lista (timestamp, wartość)) do kolejki.
+        Wywoływane z wątku sieciowego paho - nie blokuje (poza polityką "block").
+        """
+        item = (device_id, user_id, sensor_type, readings, time.monotonic(), datetime.utcnow())
+
+        # Dopóki w WAL są nieodtworzone dane, nowe wiadomości idą za nimi (kolejność)
+        if self.overflow_policy == "spill" and self.spill.append([item], only_if_pending=True):
+            return
+
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self._overflow(item)
+
+    def _overflow(self, item):
+        if self.overflow_policy == "spill":
+            self.spill.append([item])
+            return
+
+        if self.overflow_policy == "block":
+            try:
+                self.queue.put(item, timeout=self.block_timeout)
+                return
+            except queue.Full:
+                pass
+        elif self.overflow_policy == "drop_oldest":
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(item)
+            except (queue.Empty, queue.Full):
+                pass
+
+        with self._stats_lock:
+            self.dropped_messages += 1
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        spill = self.spill.stats()
+        with self._stats_lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "queue_size": self.queue.maxsize,
+                "overflow_policy": self.overflow_policy,
+                "dropped_messages": self.dropped_messages,
+                "replayed_rows": self.replayed_rows,
+                "replay_rate": round(self.replay_rate, 1),
+                **spill,
+                **self.dead_letter.stats(),
+                "batch_size": self.batch_size,
+                "flush_interval": self.flush_interval,
+                "total_rows": self.total_rows,
+                "total_flushes": self.total_flushes,
+                "failed_rows": self.failed_rows,
+                "last_flush_size": self.last_flush_size,
+                "last_flush_lag": round(self.last_flush_lag, 3),
+                "max_flush_lag": round(self.max_flush_lag, 3),
+                "last_flush_duration": round(self.last_flush_duration, 3),
+            }
+
+    def run(self):
+        print(f"✍️ Writer: paczki do {self.batch_size} wierszy, max opóźnienie {self.flush_interval}s")
+        if self.spill.has_pending():
+            print(f"💾 Writer: w WAL czeka {self.spill.pending_bytes} B z poprzedniego uruchomienia")
+        next_stats = time.monotonic() + self.stats_interval
+
+        while self.running or not self.queue.empty():
+            # Wyjątek w jednym obiegu nie może zatrzymać wątku - on_message dalej
+            # wrzucałby odczyty do kolejki (albo WAL), których nikt nie zapisze
+            try:
+                next_stats = self._run_once(next_stats)
+            except Exception as e:
+                print(f"❌ Writer: nieoczekiwany błąd, pętla działa dalej: {e!r}")
+                traceback.print_exc()
+                self._retry_at = time.monotonic() + self.retry_interval
+                time.sleep(min(self.retry_interval, 1.0))
+
+        last_seen_tracker.flush(self.app)
+        self.spill.close()
+
+    def _run_once(self, next_stats):
+        """Jeden obieg pętli writera; zwraca czas następnego wypisania statystyk."""
+        # Gdy czeka WAL, nie blokujemy się na pustej kolejce - od razu odtwarzamy
+        replay_due = self.spill.has_pending() and time.monotonic() >= self._retry_at
+        batch = self._collect_batch(0 if replay_due else self.flush_interval)
+        if batch:
+            self._flush(batch)
+
+        # WAL odtwarzamy, gdy kolejka jest co najwyżej w połowie pełna
+        if self.queue.qsize() <= self.queue.maxsize // 2:
+            self._replay_spill()
+
+        # last_seen zapisujemy zbiorczo, raz na HEARTBEAT_FLUSH_INTERVAL
+        last_seen_tracker.flush_if_due(self.app)
+
+        if time.monotonic() >= next_stats:
+            print(f"📊 Writer: {self.stats()}")
+            print(f"📇 Rejestr urządzeń: {device_registry.stats()}")
+            next_stats = time.monotonic() + self.stats_interval
+        return next_stats
+
+    def _replay_spill(self):
+        if time.monotonic() < self._retry_at or not self.spill.has_pending():
+            return
+
+        started = time.monotonic()
+        items, offset = self.spill.read(self.batch_size)
+        if not items:
+            return
+
+        # Czas w kolejce liczymy od momentu odczytu z WAL
+        batch = [item[:4] + (started,) + item[5:] for item in items]
+        remainder = []
+        if self._flush(batch, remainder=remainder):
+            self.spill.commit(offset, len(items), remainder)
+            rows = _rows_in(items) - _rows_in(remainder)
+            with self._stats_lock:
+                self.replayed_rows += rows
+                self.replay_rate = rows / max(time.monotonic() - started, 1e-6)
+
+    def _collect_batch(self, timeout):
+        """Czeka na pierwszą wiadomość, potem dobiera kolejne aż do limitu wierszy lub czasu."""
+        try:
+            first = self.queue.get(timeout=timeout) if timeout else self.queue.get_nowait()
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        rows = len(first[3])
+        deadline = first[4] + self.flush_interval
+
+        while rows < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows += len(item[3])
+
+        return batch
+
+    def _build_rows(self, batch, type_ids):
+        rows = []
+        for device_id, user_id, sensor_type, readings, _, received_at in batch:
+            sensor_type_id = type_ids[sensor_type]
+            received_ts = int(received_at.replace(tzinfo=timezone.utc).timestamp())
+            rows.extend({
+                "device_id": device_id,
+                "user_id": user_id,
+                "sensor_type_id": sensor_type_id,
+                "timestamp": timestamp,
+                "value": value,
+                "received_at": received_ts,
+            } for timestamp, value in readings)
+        return rows
+
+    def _write(self, batch):
+        """Zapis paczki w jednej transakcji (pomiary, agregaty, jazdy); zwraca None albo wyjątek."""
+        with self.app.app_context():
+            # Id typów przed transakcją paczki: nowy typ jest dopisywany w osobnej transakcji,
+            # a zła nazwa (ValueError) to błąd danych tylko wiadomości z tym typem
+            try:
+                type_ids = {
+                    sensor_type: sensor_types.get_id(sensor_type, create=True)
+                    for sensor_type in {item[2] for item in batch}
+                }
+            except Exception as e:
+                db.session.rollback()
+                return e
+
+            try:
+                rows = self._build_rows(batch, type_ids)
+                if partitions.enabled():
+                    # Każdy wiersz do partycji swojego miesiąca (brakujące są zakładane)
+                    routed = partitions.route_rows(rows)
+                    partitions.ensure_partitions(db.session.connection(), routed.keys())
+                    for name, part_rows in routed.items():
+                        db.session.execute(insert(partitions.partition_table(name)), part_rows)
+                else:
+                    db.session.execute(insert(Measurement), rows)
+                # Agregaty minutowe/godzinowe/dzienne w tej samej transakcji
+                rollups.apply_rows(db.session, rows)
+                # Jazdy: przyrostowo, od stanu zapisanego przy poprzedniej paczce
+                trips.apply_rows(db.session, rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                partitions.invalidate()  # partycje założone w tej transakcji też zostały wycofane
+                return e
+
+            # Paczka jest już w bazie - błąd w tych dodatkach nie może jej cofnąć ani powtórzyć
+            try:
+                # Wyniki /api/stats, których okno obejmuje nowe odczyty, są nieaktualne
+                stats_cache.invalidate_rows(rows)
+            except Exception as e:
+                print(f"❌ Writer: błąd unieważniania pamięci statystyk: {e!r}")
+            try:
+                # Subskrybenci /live dostają tylko odczyty zapisane w bazie
+                live_hub.publish_rows(rows)
+            except Exception as e:
+                print(f"❌ Writer: błąd publikacji odczytów na /live: {e!r}")
+        return None
+
+    def _isolate(self, batch, error):
+        """
+        Bisekcja paczki z błędem danych: części bez błędu są zapisywane, a pojedyncze
+        odczyty, których baza nie przyjmuje, trafiają do pliku dead-letter.
+        Zwraca (błąd przejściowy albo None, niezapisane wiadomości, zapisane wiersze).
+        """
+        written = 0
+        stack = [(batch, error)]
+        while stack:
+            part, error = stack.pop()
+            if error is None:
+                error = self._write(part)
+            if error is None:
+                written += _rows_in(part)
+                continue
+
+            if not is_data_error(error):
+                # Baza przestała odpowiadać w trakcie - reszta czeka jak zwykła nieudana paczka
+                pending = part + [item for rest, _ in reversed(stack) for item in rest]
+                return error, pending, written
+
+            if _rows_in(part) <= 1:
+                if part[0][3]:
+                    self.dead_letter.append(part[0], error)
+                    metrics.INGEST_DEAD_LETTER_ROWS.inc()
+                    print(f"☠️ Writer: odczyt odrzucony przez bazę -> dead-letter: {part[0][:3]} {part[0][3]}: "
+                          f"{str(error).splitlines()[0]}")
+                continue
+
+            left, right = _split(part)
+            stack.append((right, None))
+            stack.append((left, None))
+
+        return None, [], written
+
+    def _flush(self, batch, remainder=None):
+        """
+        Zapisuje paczkę; zwraca False, gdy nie zapisała się przez błąd bazy (do ponowienia).
+        remainder: lista dla paczki odtwarzanej z WAL - trafia do niej niezapisana część
+        paczki, gdy zapisała się tylko w części (wtedy zwraca True).
+        """
+        started = time.monotonic()
+        row_count = _rows_in(batch)
+
+        error = self._write(batch)
+        pending, written = ([], row_count) if error is None else (batch, 0)
+        if error is not None:
+            print(f"❌ Writer: Błąd zapisu paczki ({row_count} wierszy): {error}")
+            if is_data_error(error):
+                # Powtarzanie tej samej paczki nic nie da - szukamy wadliwych odczytów
+                error, pending, written = self._isolate(batch, error)
+
+        ok = error is None
+        handled = ok
+        lost = 0
+        if not ok:
+            # Baza nie odpowiada - odczekujemy z odtwarzaniem WAL,
+            # a w trybie spill paczka trafia na dysk zamiast przepaść
+            self._retry_at = time.monotonic() + self.retry_interval
+            if remainder is not None:
+                if _rows_in(pending) < row_count:
+                    # Część paczki z WAL jest już w bazie - resztę commit() zostawia
+                    # na początku WAL, przed tym, co wylało się na dysk później
+                    remainder.extend(pending)
+                    handled = True
+            elif self.overflow_policy == "spill":
+                self.spill.append(pending)
+            else:
+                lost = _rows_in(pending)
+
+        finished = time.monotonic()
+        if ok:
+            metrics.INGEST_WRITE_SECONDS.observe(finished - started)
+            metrics.INGEST_BATCH_ROWS.observe(row_count)
+
+        with self._stats_lock:
+            self.total_flushes += 1
+            self.total_rows += written
+            if ok:
+                self.last_flush_size = written
+                # Lag = ile czekał najstarszy odczyt z paczki, zanim trafił do bazy
+                self.last_flush_lag = finished - batch[0][4]
+                self.max_flush_lag = max(self.max_flush_lag, self.last_flush_lag)
+            self.failed_rows += lost
+            self.last_flush_duration = finished - started
+
+        return handled
@@ -0,0 +1,261 @@
+"""
+Proste metryki w formacie tekstowym Prometheusa (bez zewnętrznych zależności).
+
+Każda metryka trzyma wartości w słowniku {krotka etykiet: wartość} pod
+własnym lockiem, więc inkrementacja to jedna operacja na słowniku -
+wystarczająco tanio, żeby zostawić to włączone na produkcji.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _label_str(self, values, extra=None):
+        pairs = list(zip(self.labels, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+        return "{" + body + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{self._label_str(label_values)} {_format(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                # [liczniki kubełków..., suma, liczba]
+                state = self._values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for label_values, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._label_str(label_values, ('le', _format(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._label_str(label_values, ('le', '+Inf'))} {state[-1]}")
+            lines.append(f"{self.name}_sum{self._label_str(label_values)} {_format(state[-2])}")
+            lines.append(f"{self.name}_count{self._label_str(label_values)} {state[-1]}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+_registry = []
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+# --- MQTT / ingest ---
+MQTT_MESSAGES = _register(Counter(
+    "mqtt_messages_total", "Przyjęte wiadomości MQTT z pomiarami", ["sensor_type"]))
+MQTT_READINGS = _register(Counter(
+    "mqtt_readings_total", "Przyjęte odczyty (wiadomość może mieć ich wiele)", ["sensor_type"]))
+MQTT_PARSE_ERRORS = _register(Counter(
+    "mqtt_parse_errors_total", "Wiadomości z błędnym formatem"))
+MQTT_UNKNOWN_DEVICES = _register(Counter(
+    "mqtt_unknown_device_total", "Wiadomości od nieznanych urządzeń"))
+INGEST_WRITE_SECONDS = _register(Histogram(
+    "ingest_db_write_seconds", "Czas zapisu paczki pomiarów do bazy"))
+INGEST_BATCH_ROWS = _register(Histogram(
+    "ingest_batch_rows", "Liczba wierszy w zapisanej paczce",
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000)))
+INGEST_DEAD_LETTER_ROWS = _register(Counter(
+    "ingest_dead_letter_rows_total", "Odczyty odrzucone przez bazę (błąd danych), zapisane w pliku dead-letter"))
+INGEST_GAUGES = _register(Gauge(
+    "ingest_writer", "Stan writera pomiarów (kolejka, WAL, liczniki)", ["stat"]))
+REGISTRY_GAUGES = _register(Gauge(
+    "device_registry", "Stan pamięci podręcznej urządzeń", ["stat"]))
+STATS_CACHE_GAUGES = _register(Gauge(
+    "stats_cache", "Stan pamięci podręcznej wyników /api/stats", ["stat"]))
+LIVE_GAUGES = _register(Gauge(
+    "live_hub", "Połączenia SSE /live (subskrybenci, dostarczone i pominięte odczyty)", ["stat"]))
+
+# --- Alerty ---
+ALERTS = _register(Counter(
+    "alerts_total", "Alerty wysłane na user/<mac>/alerts", ["rule"]))
+ALERT_LATENCY_SECONDS = _register(Histogram(
+    "alert_latency_seconds", "Czas od odebrania wiadomości MQTT do publikacji alertu", ["rule"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)))
+ALERT_GAUGES = _register(Gauge(
+    "alert_dispatcher", "Stan wątku alertów (kolejka, liczniki, opóźnienie)", ["stat"]))
+
+# --- Retencja ---
+RETENTION_DELETED_ROWS = _register(Counter(
+    "retention_deleted_rows_total", "Surowe pomiary usunięte przez retencję", ["sensor_type"]))
+RETENTION_RECLAIMED_BYTES = _register(Counter(
+    "retention_reclaimed_bytes_total", "Bajty oddane systemowi przez incremental_vacuum"))
+
+# --- HTTP / SQLAlchemy ---
+HTTP_REQUEST_SECONDS = _register(Histogram(
+    "http_request_duration_seconds", "Czas obsługi żądania API",
+    ["blueprint", "route", "method", "status"]))
+DB_QUERY_SECONDS = _register(Histogram(
+    "db_query_duration_seconds", "Czas wykonania zapytania SQL"))
+DB_QUERIES_PER_REQUEST = _register(Histogram(
+    "db_queries_per_request", "Liczba zapytań SQL na żądanie API", ["blueprint"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)))
+DB_SLOW_QUERIES = _register(Counter(
+    "db_slow_queries_total", "Zapytania SQL dłuższe niż METRICS_SLOW_QUERY_SECONDS"))
+
+
+def _set_stats(gauge, stats):
+    for key, value in stats.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            gauge.set(value, key)
+
+def render(app):
+    """Zwraca wszystkie metryki w formacie tekstowym Prometheusa."""
+    writer = app.extensions.get('measurement_writer')
+    if writer is not None:
+        from app.utils.device_registry import device_registry
+        _set_stats(INGEST_GAUGES, writer.stats())
+        _set_stats(REGISTRY_GAUGES, device_registry.stats())
+    dispatcher = app.extensions.get('alert_dispatcher')
+    if dispatcher is not None:
+        _set_stats(ALERT_GAUGES, dispatcher.stats())
+
+    from app.utils.stats_cache import stats_cache
+    _set_stats(STATS_CACHE_GAUGES, stats_cache.stats())
+
+    from app.utils.live_hub import live_hub
+    _set_stats(LIVE_GAUGES, live_hub.stats())
+
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def serve(app, port, host="127.0.0.1"):
+    """
+    Osobny serwer HTTP z /metrics dla procesu bez API (ingest_workers.py). Liczniki
+    ingestu żyją w procesie, który je zlicza, więc każdy worker wystawia własny port,
+    a Prometheus odpytuje wszystkie (etykieta instance rozróżnia procesy).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render(app).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def init_app(app, engine):
+    """Podpina pomiar czasu żądań (wszystkie blueprinty) i zapytań SQLAlchemy."""
+    slow_query_seconds = app.config['METRICS_SLOW_QUERY_SECONDS']
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+
+    # Czas do zwrócenia odpowiedzi z widoku - przy odpowiedziach strumieniowych
+    # (/live, eksport NDJSON/CSV) to czas do pierwszego bajtu, a nie trwania strumienia
+    @app.after_request
+    def _observe_request(response):
+        started = g.get('metrics_started')
+        if started is not None and request.url_rule is not None:
+            blueprint = request.blueprint or ""
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                blueprint, request.url_rule.rule, request.method, response.status_code
+            )
+            DB_QUERIES_PER_REQUEST.observe(g.get('metrics_queries', 0), blueprint)
+        return response
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_started'].pop()
+        DB_QUERY_SECONDS.observe(elapsed)
+        if elapsed >= slow_query_seconds:
+            DB_SLOW_QUERIES.inc()
+        if has_request_context() and 'metrics_queries' in g:
+            g.metrics_queries += 1
+
+    @event.listens_for(engine, "handle_error")
+    def _query_failed(context):
+        started = context.connection.info.get('metrics_started') if context.connection else None
+        if started:
+            started.pop()
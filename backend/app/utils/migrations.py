@@ -0,0 +1,155 @@
+"""
+Proste migracje schematu uruchamiane przy starcie aplikacji (po db.create_all()).
+
+Każdy krok sprawdza stan bazy (inspector) i robi coś tylko wtedy, gdy jest
+to potrzebne, więc można go bezpiecznie uruchamiać przy każdym starcie.
+"""
+from sqlalchemy import inspect, text
+
+from app import db
+from app.models.measurement import Measurement
+from app.models.measurement_rollup import MeasurementRollup
+from app.models.sensor_type import SensorType
+from app.models.trip import TripState
+from app.utils.sensor_types import BUILTIN_SENSOR_TYPES
+
+# Seria (0, 0) w trip_states: wykrywanie jazd w historii zostało wykonane (id urządzeń zaczynają się od 1)
+TRIPS_BACKFILL_MARKER = {"device_id": 0, "user_id": 0, "last_ts": 0}
+
+def run_migrations():
+    """Wymaga app_context."""
+    _add_user_admin_flag()
+    _seed_sensor_types()
+    _migrate_measurements_to_sensor_type_ids()
+    _create_measurement_indexes()
+    _add_rollup_sum_err()
+    _backfill_rollups()
+    _backfill_trips()
+
+def _add_user_admin_flag():
+    """users.is_admin (raport floty) - db.create_all() nie dodaje kolumn do istniejących tabel."""
+    columns = {c["name"] for c in inspect(db.engine).get_columns("users")}
+    if "is_admin" in columns:
+        return
+
+    print("🛠️ Migracja: kolumna users.is_admin ...")
+    default = "FALSE" if db.engine.dialect.name == "postgresql" else "0"
+    with db.engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE users ADD COLUMN is_admin BOOLEAN NOT NULL DEFAULT {default}"))
+
+def _seed_sensor_types():
+    existing = {name for (name,) in db.session.query(SensorType.name)}
+    missing = [
+        {"id": type_id, "name": name}
+        for name, type_id in BUILTIN_SENSOR_TYPES.items() if name not in existing
+    ]
+    if missing:
+        db.session.execute(db.insert(SensorType), missing)
+        if db.engine.dialect.name == "postgresql":
+            # Jawne id nie przesuwają sekwencji - kolejny INSERT (name) dostałby id 1
+            db.session.execute(text(
+                "SELECT setval(pg_get_serial_sequence('sensor_types', 'id'), "
+                "(SELECT MAX(id) FROM sensor_types))"
+            ))
+        db.session.commit()
+
+def _migrate_measurements_to_sensor_type_ids():
+    """
+    Stary schemat: measurements.sensor_type (String) i received_at (DateTime).
+    Nowy: sensor_type_id (SmallInteger -> sensor_types) i received_at (epoch Integer).
+    Tabela jest przebudowywana (nowa tabela + INSERT ... SELECT), bo w SQLite
+    tylko to faktycznie zmniejsza wiersze.
+    """
+    columns = {c["name"] for c in inspect(db.engine).get_columns("measurements")}
+    if "sensor_type" not in columns:
+        return
+
+    print("🛠️ Migracja: measurements.sensor_type -> sensor_type_id ...")
+    dialect = db.engine.dialect.name
+
+    if dialect == "postgresql":
+        received_expr = "CAST(EXTRACT(EPOCH FROM m.received_at) AS INTEGER)"
+    else:
+        received_expr = "CAST(strftime('%s', m.received_at) AS INTEGER)"
+
+    with db.engine.begin() as conn:
+        # Typy czujników spoza wbudowanych (np. z nietypowych tematów MQTT)
+        conn.execute(text("""
+            INSERT INTO sensor_types (name)
+            SELECT DISTINCT m.sensor_type FROM measurements m
+            WHERE m.sensor_type NOT IN (SELECT name FROM sensor_types)
+        """))
+
+        conn.execute(text("ALTER TABLE measurements RENAME TO measurements_legacy"))
+        if dialect == "postgresql":
+            # Nazwy indeksów są unikalne w schemacie - zwalniamy nazwę klucza głównego
+            conn.execute(text("ALTER INDEX measurements_pkey RENAME TO measurements_legacy_pkey"))
+            conn.execute(text("ALTER SEQUENCE measurements_id_seq RENAME TO measurements_legacy_id_seq"))
+
+        Measurement.__table__.create(conn)
+
+        conn.execute(text(f"""
+            INSERT INTO measurements (id, device_id, user_id, sensor_type_id, value, timestamp, received_at)
+            SELECT m.id, m.device_id, m.user_id, st.id, m.value, m.timestamp, {received_expr}
+            FROM measurements_legacy m
+            JOIN sensor_types st ON st.name = m.sensor_type
+        """))
+        conn.execute(text("DROP TABLE measurements_legacy"))
+
+        if dialect == "postgresql":
+            conn.execute(text(
+                "SELECT setval(pg_get_serial_sequence('measurements', 'id'), "
+                "COALESCE((SELECT MAX(id) FROM measurements), 0) + 1, false)"
+            ))
+
+    print("✅ Migracja measurements zakończona")
+
+def _create_measurement_indexes():
+    """db.create_all() nie dodaje indeksów do istniejących tabel - robimy to tutaj."""
+    existing = {ix["name"] for ix in inspect(db.engine).get_indexes("measurements")}
+    for index in Measurement.__table__.indexes:
+        if index.name not in existing:
+            print(f"🛠️ Migracja: tworzenie indeksu {index.name} ...")
+            index.create(db.engine)
+
+def _add_rollup_sum_err():
+    """measurement_rollups.value_sum_err (dokładne sumy kubełków) - przeliczana od zera z historii."""
+    columns = {c["name"] for c in inspect(db.engine).get_columns("measurement_rollups")}
+    if "value_sum_err" in columns:
+        return
+
+    print("🛠️ Migracja: kolumna measurement_rollups.value_sum_err ...")
+    with db.engine.begin() as conn:
+        conn.execute(text("ALTER TABLE measurement_rollups ADD COLUMN value_sum_err FLOAT NOT NULL DEFAULT 0"))
+    # Stare sumy były dodawane zwykłym +, więc kubełki z historii liczymy jeszcze raz
+    if db.session.query(MeasurementRollup.device_id).first() is not None:
+        from app.utils import rollups
+        print(f"✅ Przeliczono {rollups.rebuild()} kubełków")
+
+def _backfill_rollups():
+    """Nowa (pusta) tabela measurement_rollups przy istniejących pomiarach - liczymy ją z historii."""
+    if db.session.query(MeasurementRollup.device_id).first() is not None:
+        return
+    if db.session.query(Measurement.id).filter(Measurement.user_id.isnot(None)).first() is None:
+        return
+
+    from app.utils import rollups
+    print("🛠️ Migracja: przeliczanie measurement_rollups z historii pomiarów ...")
+    print(f"✅ Utworzono {rollups.rebuild()} kubełków")
+
+def _backfill_trips():
+    """
+    Nowa (pusta) tabela trips przy istniejących pomiarach - wykrywamy jazdy w historii.
+    Po przebiegu zostaje wiersz-znacznik TRIPS_BACKFILL_MARKER, bo historia bez
+    odczytów do wykrywania jazd nie zostawia stanu serii w trip_states.
+    """
+    if db.session.query(TripState.device_id).first() is not None:
+        return
+    if db.session.query(MeasurementRollup.device_id).first() is None:
+        return
+
+    from app.utils import trips
+    print("🛠️ Migracja: wykrywanie jazd w historii pomiarów ...")
+    print(f"✅ Zapisano {trips.rebuild()} jazd")
+    db.session.execute(db.insert(TripState), [TRIPS_BACKFILL_MARKER])
+    db.session.commit()
@@ -0,0 +1,273 @@
+"""
+Partycjonowanie pomiarów po czasie: jedna tabela measurements_pRRRRMM na miesiąc (UTC).
+
+Włączane przez MEASUREMENT_PARTITIONING=monthly. Writer kieruje każdy wiersz
+do partycji miesiąca z jego timestampu (tabela jest zakładana przy pierwszym
+zapisie), a ścieżki odczytu (measurement_store) sięgają tylko do partycji,
+które nachodzą na zakres start_date/end_date. Stara tabela measurements
+działa jak partycja domyślna (dane sprzed włączenia partycjonowania) i jest
+zawsze dołączana do odczytów.
+
+Usunięcie starego miesiąca to DROP TABLE jednej partycji - bez kasowania
+wierszy po kolei i bez aktualizacji indeksów.
+
+Partycje nie są częścią db.metadata (db.create_all ich nie dotyka).
+Ten sam mechanizm działa na SQLite i PostgreSQL.
+
+Lista partycji jest trzymana w pamięci procesu (PARTITION_CACHE_TTL), a zakładają
+i usuwają je inne procesy (writer ingestu, retencja, --drop-before). Dlatego
+tables_for_range sprawdza w katalogu bazy (po nazwach) miesiące z zakresu, których
+nie ma na liście, a retry_missing ponawia zapytanie po odświeżeniu listy, gdy
+trafiło na usuniętą partycję.
+
+Narzędzie (z katalogu backend):
+  python -m app.utils.partitions --list
+  python -m app.utils.partitions --drop-before 2025-01
+  python -m app.utils.partitions --migrate-legacy
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import Column, Float, Index, Integer, MetaData, SmallInteger, Table, bindparam, inspect, text
+from sqlalchemy.exc import DBAPIError
+
+from app import db
+from app.models.measurement import Measurement
+
+PARTITION_PREFIX = "measurements_p"
+
+_metadata = MetaData()
+_tables = {}
+_lock = threading.Lock()
+_known = None
+_known_at = 0.0
+_absent = {}  # nazwa -> time.monotonic() sprawdzenia, że tabeli nie ma
+
+
+def enabled():
+    return current_app.config['MEASUREMENT_PARTITIONING'] == 'monthly'
+
+def partition_name(ts):
+    moment = datetime.fromtimestamp(ts, timezone.utc)
+    return f"{PARTITION_PREFIX}{moment.year:04d}{moment.month:02d}"
+
+def partition_range(name):
+    """(początek, koniec) miesiąca partycji w epoch; koniec wyłącznie."""
+    year, month = int(name[-6:-2]), int(name[-2:])
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp()), int(end.timestamp())
+
+def partition_table(name):
+    """Obiekt Table partycji (ten sam układ kolumn i indeksów co measurements)."""
+    with _lock:
+        table = _tables.get(name)
+        if table is None:
+            table = Table(
+                name, _metadata,
+                Column('id', Integer, primary_key=True),
+                Column('device_id', Integer, nullable=False),
+                Column('user_id', Integer, nullable=True),
+                Column('sensor_type_id', SmallInteger, nullable=False),
+                Column('value', Float, nullable=False),
+                Column('timestamp', Integer, nullable=False),
+                Column('received_at', Integer, nullable=True),
+                Index(f'ix_{name}_series', 'device_id', 'user_id', 'sensor_type_id', 'timestamp', 'value'),
+                Index(f'ix_{name}_device_time', 'device_id', 'user_id', 'timestamp'),
+            )
+            _tables[name] = table
+        return table
+
+def list_partitions(refresh=False):
+    """Nazwy istniejących partycji (posortowane). Lista jest cache'owana na PARTITION_CACHE_TTL s."""
+    global _known, _known_at
+    ttl = current_app.config['PARTITION_CACHE_TTL']
+    if refresh or _known is None or time.monotonic() - _known_at > ttl:
+        names = inspect(db.engine).get_table_names()
+        _known = sorted(n for n in names if n.startswith(PARTITION_PREFIX))
+        _known_at = time.monotonic()
+    return list(_known)
+
+def invalidate():
+    """Wymusza ponowne odczytanie listy partycji (np. po wycofanej transakcji, która je zakładała)."""
+    global _known
+    with _lock:
+        _known = None
+
+def existing_tables(names):
+    """Które z podanych tabel istnieją - jedno zapytanie do katalogu bazy po nazwach."""
+    if not names:
+        return set()
+    if db.engine.dialect.name == "postgresql":
+        sql = "SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename IN :names"
+    else:
+        sql = "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN :names"
+    statement = text(sql).bindparams(bindparam("names", expanding=True))
+    return set(db.session.execute(statement, {"names": list(names)}).scalars())
+
+def _months(start_ts, end_ts):
+    """Nazwy partycji kolejnych miesięcy od start_ts do end_ts."""
+    names = []
+    while start_ts <= end_ts:
+        name = partition_name(start_ts)
+        names.append(name)
+        start_ts = partition_range(name)[1]
+    return names
+
+def _discover(known, start_ts, end_ts):
+    """
+    Miesiące z zakresu (najpóźniej bieżący), których nie ma na liście, ale które
+    mógł już założyć writer innego procesu. Bez start_ts - tylko od ostatniej znanej
+    partycji. Brak tabeli z minionego miesiąca jest pamiętany na PARTITION_CACHE_TTL,
+    bieżący miesiąc jest sprawdzany za każdym razem.
+    """
+    global _known
+    now = int(time.time())
+    hi = now if end_ts is None else min(end_ts, now)
+    lo = start_ts if start_ts is not None else (partition_range(known[-1])[0] if known else now)
+    if lo > hi:
+        return known
+
+    ttl = current_app.config['PARTITION_CACHE_TTL']
+    current = partition_name(now)
+    checked = time.monotonic()
+    with _lock:
+        candidates = [
+            name for name in _months(lo, hi)
+            if name not in known and (name >= current or checked - _absent.get(name, -ttl) > ttl)
+        ]
+    if not candidates:
+        return known
+
+    found = existing_tables(candidates)
+    with _lock:
+        for name in candidates:
+            if name in found:
+                _absent.pop(name, None)
+            else:
+                _absent[name] = checked
+        if found and _known is not None:
+            _known = sorted(set(_known) | found)
+    return sorted(set(known) | found)
+
+def tables_for_range(start_ts=None, end_ts=None):
+    """Tabela measurements + partycje nachodzące na [start_ts, end_ts]."""
+    tables = [Measurement.__table__]
+    if not enabled():
+        return tables
+
+    for name in _discover(list_partitions(), start_ts, end_ts):
+        part_start, part_end = partition_range(name)
+        if start_ts is not None and part_end <= start_ts:
+            continue
+        if end_ts is not None and part_start > end_ts:
+            continue
+        tables.append(partition_table(name))
+    return tables
+
+def is_missing_partition(error):
+    """Błąd zapytania o partycję, której już nie ma (SQLite: no such table, PostgreSQL: 42P01)."""
+    orig = getattr(error, "orig", error)
+    if PARTITION_PREFIX not in str(orig):
+        return False
+    return getattr(orig, "pgcode", None) == "42P01" or "no such table" in str(orig)
+
+def retry_missing(run):
+    """
+    Wywołuje run() (zapytania zbudowane z tables_for_range). Gdy trafi na partycję
+    usuniętą przez inny proces, odświeża listę partycji i wywołuje run() jeszcze raz.
+    """
+    try:
+        return run()
+    except DBAPIError as e:
+        if not enabled() or not is_missing_partition(e):
+            raise
+        db.session.rollback()
+        list_partitions(refresh=True)
+        return run()
+
+def ensure_partitions(conn, names):
+    """Zakłada brakujące partycje (w transakcji wołającego)."""
+    global _known
+    known = set(list_partitions())
+    created = False
+    for name in names:
+        if name not in known:
+            partition_table(name).create(conn, checkfirst=True)
+            created = True
+    if created:
+        with _lock:
+            _known = sorted(known | set(names))
+
+def route_rows(rows):
+    """Dzieli wiersze writera na {nazwa partycji: wiersze}."""
+    routed = {}
+    for row in rows:
+        routed.setdefault(partition_name(row["timestamp"]), []).append(row)
+    return routed
+
+def drop_partition(name):
+    if not name.startswith(PARTITION_PREFIX):
+        raise ValueError(f"To nie jest partycja pomiarów: {name}")
+    partition_table(name).drop(db.engine, checkfirst=True)
+    list_partitions(refresh=True)
+
+def drop_partitions_before(cutoff_ts):
+    """Usuwa całe partycje, które kończą się przed cutoff_ts. Zwraca ich nazwy."""
+    dropped = []
+    for name in list_partitions(refresh=True):
+        if partition_range(name)[1] <= cutoff_ts:
+            drop_partition(name)
+            dropped.append(name)
+    return dropped
+
+def migrate_legacy():
+    """Przenosi wiersze ze starej tabeli measurements do partycji, miesiąc po miesiącu."""
+    table = Measurement.__table__
+    columns = [c.name for c in table.c if c.name != 'id']
+    moved = 0
+    while True:
+        with db.engine.begin() as conn:
+            first_ts = conn.execute(db.select(db.func.min(table.c.timestamp))).scalar()
+            if first_ts is None:
+                return moved
+
+            name = partition_name(first_ts)
+            start, end = partition_range(name)
+            ensure_partitions(conn, [name])
+            target = partition_table(name)
+            source = db.select(*[table.c[c] for c in columns]).where(
+                table.c.timestamp >= start, table.c.timestamp < end
+            )
+            result = conn.execute(target.insert().from_select(columns, source))
+            conn.execute(table.delete().where(table.c.timestamp >= start, table.c.timestamp < end))
+        moved += result.rowcount
+        print(f"📦 {name}: przeniesiono {result.rowcount} wierszy")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partycje miesięczne tabeli measurements")
+    parser.add_argument("--list", action="store_true")
+    parser.add_argument("--drop-before", metavar="RRRR-MM")
+    parser.add_argument("--migrate-legacy", action="store_true")
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        if args.migrate_legacy:
+            print(f"✅ Przeniesiono {migrate_legacy()} wierszy do partycji")
+        if args.drop_before:
+            cutoff = datetime.strptime(args.drop_before, "%Y-%m").replace(tzinfo=timezone.utc)
+            for name in drop_partitions_before(int(cutoff.timestamp())):
+                print(f"🗑️ Usunięto {name}")
+        if args.list or not (args.migrate_legacy or args.drop_before):
+            for name in list_partitions(refresh=True):
+                count = db.session.query(db.func.count()).select_from(partition_table(name)).scalar()
+                print(f"{name}: {count} wierszy")
+
+if __name__ == "__main__":
+    main()
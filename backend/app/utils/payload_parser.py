@@ -0,0 +1,82 @@
+"""
+Parsowanie wiadomości z czujników (temat user/<mac>/sensor/<typ>).
+
+Obsługiwane formaty:
+  pojedynczy odczyt (tekst)  "timestamp;wartość"                 np. "1700000000;9.81"
+  paczka tekstowa            odczyty rozdzielone znakiem nowej linii
+                             "1700000000;9.81\\n1700000000;9.79\\n..."
+  paczka binarna             nagłówek <BBH: magic 0xA5, wersja 1, liczba odczytów N,
+                             potem N x uint32 timestamp i N x float32 wartość
+                             (little-endian, najpierw cała kolumna czasów, potem wartości)
+
+Wartości muszą być skończone - "nan", "inf" (i takie float32 w ramce binarnej)
+są odrzucane jak każdy inny błędny format (SQLite zapisałby NaN jako NULL).
+"""
+import math
+import struct
+
+BINARY_MAGIC = 0xA5
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<BBH')
+BINARY_MAX_READINGS = 0xFFFF
+
+def _value(val_str):
+    value = float(val_str)
+    if not math.isfinite(value):
+        raise ValueError(f"Nieskończona wartość odczytu: {val_str!r}")
+    return value
+
+def parse_payload(payload):
+    """
+    Zwraca listę krotek (timestamp, wartość).
+    Pusta lista = wiadomość bez pomiarów (np. status). Błędny format -> ValueError.
+    """
+    if payload and payload[0] == BINARY_MAGIC:
+        return parse_binary_frame(payload)
+
+    text = payload.decode('utf-8')
+    if ";" not in text:
+        return []
+
+    if "\n" not in text:
+        ts_str, val_str = text.split(';', 1)
+        return [(int(ts_str), _value(val_str))]
+
+    readings = []
+    for line in text.split("\n"):
+        if not line:
+            continue
+        ts_str, val_str = line.split(';', 1)
+        readings.append((int(ts_str), _value(val_str)))
+    return readings
+
+def parse_binary_frame(payload):
+    if len(payload) < BINARY_HEADER.size:
+        raise ValueError("Za krótka ramka binarna")
+
+    magic, version, count = BINARY_HEADER.unpack_from(payload)
+    if version != BINARY_VERSION:
+        raise ValueError(f"Nieobsługiwana wersja ramki: {version}")
+    if len(payload) != BINARY_HEADER.size + count * 8:
+        raise ValueError(f"Długość ramki nie zgadza się z liczbą odczytów ({count})")
+
+    # Dwie kolumny rozpakowane jednym wywołaniem każda
+    timestamps = struct.unpack_from(f'<{count}I', payload, BINARY_HEADER.size)
+    values = struct.unpack_from(f'<{count}f', payload, BINARY_HEADER.size + count * 4)
+    if not all(map(math.isfinite, values)):
+        raise ValueError("Nieskończona wartość odczytu w ramce binarnej")
+    return list(zip(timestamps, values))
+
+def encode_text_frame(readings):
+    return "\n".join(f"{ts};{value:.2f}" for ts, value in readings)
+
+def encode_binary_frame(readings):
+    if len(readings) > BINARY_MAX_READINGS:
+        raise ValueError(f"Max {BINARY_MAX_READINGS} odczytów w jednej ramce")
+
+    count = len(readings)
+    timestamps = [ts for ts, _ in readings]
+    values = [value for _, value in readings]
+    return (BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, count)
+            + struct.pack(f'<{count}I', *timestamps)
+            + struct.pack(f'<{count}f', *values))
@@ -0,0 +1,245 @@
+"""
+Retencja surowych pomiarów: kasowanie odczytów starszych niż polityka ich typu czujnika.
+
+Polityki (RETENTION_POLICIES, np. "ADXL345=14,MAX6675_NORMAL=90") podają,
+ile dni surowych wierszy trzymać. Granica jest wyrównana do pełnej doby UTC,
+więc kubełki measurement_rollups (minuta/godzina/doba) leżą całe po jednej
+jej stronie - agregaty zostają i statystyki dla starszych okresów nadal
+działają (z dokładnością do minuty na brzegach okna).
+
+Kasowanie nie blokuje writera MQTT na długo:
+  - partycje miesięczne (MEASUREMENT_PARTITIONING=monthly), w których są
+    wyłącznie wygasłe dane, są usuwane w całości (DROP TABLE),
+  - reszta jest kasowana po RETENTION_BATCH_SIZE wierszy na transakcję
+    (po indeksie ix_*_series, seria po serii) z przerwą RETENTION_BATCH_PAUSE,
+  - w SQLite zwolnione strony wracają do systemu przez PRAGMA incremental_vacuum
+    (wymaga auto_vacuum=INCREMENTAL - patrz --enable-incremental-vacuum).
+
+W mqtt_worker działa jako wątek RetentionJob (co RETENTION_INTERVAL s, tylko shard 0),
+który przed retencją przenosi stare pomiary do archiwum kolumnowego (ARCHIVE_AFTER_DAYS,
+app/utils/archive.py) - incremental_vacuum oddaje wtedy także miejsce po nich.
+
+Narzędzie (z katalogu backend):
+  python -m app.utils.retention --dry-run
+  python -m app.utils.retention
+  python -m app.utils.retention --enable-incremental-vacuum
+"""
+import argparse
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from app import db
+from app.utils import archive
+from app.utils import partitions
+from app.utils import rollups
+from app.utils.sensor_types import sensor_types
+from app.utils import metrics
+
+DAY = 86400
+
+
+def retention_cutoffs(policies, now=None):
+    """{sensor_type_id: cutoff_ts} - wiersze z timestamp < cutoff_ts są do usunięcia."""
+    now = int(now if now is not None else time.time())
+    cutoffs = {}
+    for name, days in policies.items():
+        type_id = sensor_types.get_id(name)
+        if type_id is not None:
+            cutoff = now - days * DAY
+            cutoffs[type_id] = cutoff - cutoff % DAY
+    return cutoffs
+
+def delete_expired(table, device_id, user_id, sensor_type_id, cutoff_ts,
+                   batch_size, pause=0.0, should_continue=None):
+    """Kasuje wygasłe wiersze jednej serii po batch_size na transakcję. Zwraca liczbę wierszy."""
+    c = table.c
+    owner = c.user_id.is_(None) if user_id is None else c.user_id == user_id
+    doomed = select(c.id).where(
+        c.device_id == device_id, owner, c.sensor_type_id == sensor_type_id, c.timestamp < cutoff_ts
+    ).limit(batch_size)
+
+    deleted = 0
+    while should_continue is None or should_continue():
+        with db.engine.begin() as conn:
+            count = conn.execute(table.delete().where(c.id.in_(doomed))).rowcount
+        deleted += count
+        if count < batch_size:
+            break
+        # Okno dla writera MQTT między transakcjami (w SQLite zapisuje jedno połączenie naraz)
+        time.sleep(pause)
+    return deleted
+
+def drop_expired_partitions(cutoffs, dry_run=False):
+    """
+    Usuwa w całości partycje, w których wszystkie wiersze są już wygasłe:
+    każdy typ czujnika w partycji ma granicę retencji za jej końcem.
+    """
+    if not cutoffs or not partitions.enabled():
+        return []
+
+    dropped = []
+    for name in partitions.list_partitions(refresh=True):
+        part_end = partitions.partition_range(name)[1]
+        expired_types = [type_id for type_id, cutoff in cutoffs.items() if part_end <= cutoff]
+        if not expired_types:
+            continue
+        table = partitions.partition_table(name)
+        kept = db.session.execute(
+            select(table.c.id).where(table.c.sensor_type_id.notin_(expired_types)).limit(1)
+        ).first()
+        db.session.commit()
+        if kept is None:
+            if not dry_run:
+                partitions.drop_partition(name)
+            dropped.append(name)
+    return dropped
+
+def count_expired(cutoffs):
+    """Liczba wierszy do usunięcia (dla --dry-run)."""
+    total = 0
+    for type_id, cutoff in cutoffs.items():
+        for table in partitions.tables_for_range(None, cutoff - 1):
+            total += db.session.execute(
+                select(func.count()).select_from(table).where(
+                    table.c.sensor_type_id == type_id, table.c.timestamp < cutoff
+                )
+            ).scalar()
+    db.session.commit()
+    return total
+
+def sqlite_free_bytes(conn):
+    page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+    return conn.exec_driver_sql("PRAGMA freelist_count").scalar() * page_size
+
+def incremental_vacuum(max_pages, pause=0.0, should_continue=None):
+    """
+    Oddaje wolne strony pliku SQLite systemowi, po max_pages naraz.
+    Zwraca odzyskane bajty albo None, gdy baza nie jest SQLite z auto_vacuum=INCREMENTAL.
+    """
+    if db.engine.dialect.name != "sqlite":
+        return None
+
+    with db.engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            return None
+        before = free = sqlite_free_bytes(conn)
+        raw = conn.connection.dbapi_connection
+        while free and (should_continue is None or should_continue()):
+            # executescript wykonuje PRAGMA do końca; zwykłe execute() w sqlite3 zwalnia tylko jedną stronę
+            raw.executescript(f"PRAGMA incremental_vacuum({max_pages})")
+            remaining = sqlite_free_bytes(conn)
+            if remaining >= free:
+                break
+            free = remaining
+            time.sleep(pause)
+        return before - free
+
+def enable_incremental_vacuum():
+    """Jednorazowe przełączenie istniejącej bazy SQLite na auto_vacuum=INCREMENTAL (pełny VACUUM)."""
+    with db.engine.connect() as conn:
+        raw = conn.connection.dbapi_connection
+        raw.executescript("PRAGMA auto_vacuum=INCREMENTAL; VACUUM;")
+        return conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+
+
+def run_retention(app, should_continue=None, dry_run=False):
+    """Jeden przebieg retencji; zwraca raport (słownik). Wymaga app_context."""
+    config = app.config
+    started = time.monotonic()
+    cutoffs = retention_cutoffs(config['RETENTION_POLICIES'])
+    report = {"deleted_rows": {}, "dropped_partitions": [], "archive_chunks_removed": 0, "reclaimed_bytes": 0}
+
+    if dry_run:
+        report["dropped_partitions"] = drop_expired_partitions(cutoffs, dry_run=True)
+        report["expired_rows"] = count_expired(cutoffs)
+        return report
+
+    report["dropped_partitions"] = drop_expired_partitions(cutoffs)
+
+    for type_id, cutoff in cutoffs.items():
+        deleted = 0
+        tables = partitions.tables_for_range(None, cutoff - 1)
+        for device_id, user_id in rollups.series_before(type_id, cutoff):
+            for table in tables:
+                deleted += delete_expired(
+                    table, device_id, user_id, type_id, cutoff,
+                    config['RETENTION_BATCH_SIZE'], config['RETENTION_BATCH_PAUSE'], should_continue,
+                )
+        # Pliki archiwum kolumnowego w całości sprzed granicy
+        report["archive_chunks_removed"] += archive.drop_chunks_before(type_id, cutoff)
+        name = sensor_types.get_name(type_id)
+        report["deleted_rows"][name] = deleted
+        metrics.RETENTION_DELETED_ROWS.inc(name, amount=deleted)
+
+    reclaimed = incremental_vacuum(config['RETENTION_VACUUM_PAGES'], config['RETENTION_BATCH_PAUSE'], should_continue)
+    report["reclaimed_bytes"] = reclaimed or 0
+    report["vacuum"] = "incremental" if reclaimed is not None else "brak (auto_vacuum NONE lub nie SQLite)"
+    report["duration"] = round(time.monotonic() - started, 2)
+    metrics.RETENTION_RECLAIMED_BYTES.inc(amount=report["reclaimed_bytes"])
+    return report
+
+
+class RetentionJob(threading.Thread):
+    """Wątek uruchamiający run_archive i run_retention co RETENTION_INTERVAL sekund."""
+
+    def __init__(self, app):
+        super().__init__(name="retention", daemon=True)
+        self.app = app
+        self.interval = app.config['RETENTION_INTERVAL']
+        self.running = True
+        self._wake = threading.Event()
+        self.last_report = None
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+
+    def run(self):
+        print(f"🧹 Retencja: {self.app.config['RETENTION_POLICIES']}, "
+              f"archiwum po {self.app.config['ARCHIVE_AFTER_DAYS']} dniach, co {self.interval:.0f}s")
+        while self.running:
+            try:
+                with self.app.app_context():
+                    if archive.enabled():
+                        archived = archive.run_archive(self.app, should_continue=lambda: self.running)
+                        print(f"📦 Archiwum: {archived['archived_rows']} wierszy w {archived['chunks']} plikach "
+                              f"({archived['archive_bytes'] / 1e6:.1f} MB, {archived['duration']}s)")
+                    report = run_retention(self.app, should_continue=lambda: self.running)
+                self.last_report = report
+                deleted = sum(report["deleted_rows"].values())
+                print(f"🧹 Retencja: usunięto {deleted} wierszy {report['deleted_rows']}, "
+                      f"partycje: {report['dropped_partitions'] or '-'}, "
+                      f"odzyskano {report['reclaimed_bytes'] / 1e6:.1f} MB w {report['duration']}s")
+            except Exception as e:
+                print(f"❌ Retencja: {e}")
+            self._wake.wait(self.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retencja surowych pomiarów (RETENTION_POLICIES)")
+    parser.add_argument("--dry-run", action="store_true", help="tylko policz wiersze do usunięcia")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="przełącz istniejącą bazę SQLite na auto_vacuum=INCREMENTAL (pełny VACUUM, offline)")
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        if args.enable_incremental_vacuum:
+            print("🛠️ VACUUM całej bazy - może potrwać i wymaga wolnego miejsca na kopię pliku ...")
+            ok = enable_incremental_vacuum()
+            print("✅ auto_vacuum=INCREMENTAL" if ok else "❌ Nie udało się włączyć auto_vacuum=INCREMENTAL")
+            return
+
+        if not app.config['RETENTION_POLICIES']:
+            print("⚠️ Brak RETENTION_POLICIES - nic do usunięcia")
+            return
+
+        report = run_retention(app, dry_run=args.dry_run)
+        for key, value in report.items():
+            print(f"{key}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""
+Agregaty pomiarów w kubełkach minutowych, godzinowych i dziennych (tabela measurement_rollups).
+
+Writer w tej samej transakcji co INSERT surowych wierszy dopisuje ich
+agregaty (UPSERT: count/sum dodawane, min/max porównywane), więc tabela
+jest zawsze zgodna z measurements. Statystyki (aggregate_window) biorą
+pełne kubełki z measurement_rollups - od największych - a surowe wiersze
+czytają tylko na brzegach okna, krótszych niż minuta.
+
+Sumy są dokładne: UPSERT dodaje value_sum z poprawką (two-sum) w value_sum_err,
+a kubełki i surowe wartości są sumowane w SeriesAggregate, nie przez SUM() w SQL -
+wynik nie zależy od tego, które odczyty trafiły do kubełków, a które na brzegi.
+
+Kubełki są liczone od epoch (dzień = doba UTC). Wiersze bez właściciela
+(user_id NULL) nie mają agregatów - API i tak pyta zawsze o konkretnego użytkownika.
+
+Narzędzie (z katalogu backend):
+  python -m app.utils.rollups --rebuild
+"""
+import argparse
+
+from sqlalchemy import case, func, or_, select, true, union_all
+
+from app import db
+from app.models.device import Device
+from app.models.measurement_rollup import MeasurementRollup
+from app.utils import archive
+from app.utils import measurement_store
+from app.utils import partitions
+from app.utils.series_aggregate import SeriesAggregate, HARSH_MIN, CRASH_MIN
+
+# Od największej - plan_window bierze najpierw pełne dni, potem godziny, minuty
+ROLLUP_RESOLUTIONS = (86400, 3600, 60)
+
+# Ile surowych wierszy rebuild() agreguje w pamięci przed UPSERT-em
+REBUILD_BATCH = 50_000
+
+_KEY_COLUMNS = ("device_id", "user_id", "sensor_type_id", "bucket_seconds", "bucket_start")
+
+
+def bucket_start(ts, bucket_seconds):
+    return ts - ts % bucket_seconds
+
+def aggregate_rows(rows):
+    """Wiersze writera -> {(device_id, user_id, sensor_type_id, bucket_seconds, bucket_start): SeriesAggregate}."""
+    buckets = {}
+    for row in rows:
+        if row["user_id"] is None:
+            continue
+        for seconds in ROLLUP_RESOLUTIONS:
+            key = (row["device_id"], row["user_id"], row["sensor_type_id"],
+                   seconds, bucket_start(row["timestamp"], seconds))
+            aggregate = buckets.get(key)
+            if aggregate is None:
+                aggregate = buckets[key] = SeriesAggregate()
+            aggregate.add(row["value"])
+    return buckets
+
+def _upsert_statement(dialect):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    table = MeasurementRollup.__table__
+    stmt = insert(table)
+    new = stmt.excluded
+    # Two-sum (Knuth): błąd zaokrąglenia value_sum + nowa suma trafia do value_sum_err
+    total = table.c.value_sum + new.value_sum
+    new_part = total - table.c.value_sum
+    rounding = (table.c.value_sum - (total - new_part)) + (new.value_sum - new_part)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c[name] for name in _KEY_COLUMNS],
+        set_={
+            "value_count": table.c.value_count + new.value_count,
+            "value_sum": total,
+            "value_sum_err": table.c.value_sum_err + new.value_sum_err + rounding,
+            "value_min": case((new.value_min < table.c.value_min, new.value_min), else_=table.c.value_min),
+            "value_max": case((new.value_max > table.c.value_max, new.value_max), else_=table.c.value_max),
+            "harsh_count": table.c.harsh_count + new.harsh_count,
+            "crash_count": table.c.crash_count + new.crash_count,
+        },
+    )
+
+def apply_rows(session, rows):
+    """Dopisuje agregaty wierszy do measurement_rollups (w transakcji wołającego)."""
+    return upsert_buckets(session, session.get_bind().dialect.name, aggregate_rows(rows))
+
+def upsert_buckets(executor, dialect, buckets):
+    """executor: sesja albo połączenie; buckets: wynik aggregate_rows."""
+    if not buckets:
+        return 0
+
+    # Stała kolejność kluczy - równolegli writerzy (PostgreSQL) nie zakleszczą się na blokadach wierszy
+    values = [
+        dict(zip(_KEY_COLUMNS, key),
+             value_count=a.count, value_sum=a.total, value_sum_err=a.total_err,
+             value_min=a.minimum, value_max=a.maximum,
+             harsh_count=a.harsh, crash_count=a.crash)
+        for key, a in sorted(buckets.items())
+    ]
+    executor.execute(_upsert_statement(dialect), values)
+    return len(values)
+
+
+def plan_window(start_ts, end_ts, resolutions=ROLLUP_RESOLUTIONS):
+    """
+    Dzieli zamknięty zakres [start_ts, end_ts] na pełne kubełki (od największych)
+    i brzegi, które trzeba policzyć z surowych wierszy.
+    Zwraca (kubełki [(bucket_seconds, od, do_wyłącznie)], brzegi [(od, do) włącznie]).
+    """
+    buckets, raw = [], []
+
+    def cover(lo, hi, level):  # [lo, hi)
+        if lo >= hi:
+            return
+        if level == len(resolutions):
+            raw.append((lo, hi - 1))
+            return
+        seconds = resolutions[level]
+        first = -(-lo // seconds) * seconds
+        last = hi // seconds * seconds
+        if first < last:
+            buckets.append((seconds, first, last))
+            cover(lo, first, level + 1)
+            cover(last, hi, level + 1)
+        else:
+            cover(lo, hi, level + 1)
+
+    cover(start_ts, end_ts + 1, 0)
+    return buckets, raw
+
+def rollup_query(device_ids, user_id, sensor_type_ids, buckets):
+    """
+    Kubełki z planu (device_id, sensor_type_id i kolumny agregatu) - UNION ALL zakresów,
+    każdy po kluczu głównym. Wiersz na kubełek: sumy łączy SeriesAggregate, nie SUM() w SQL.
+    """
+    c = MeasurementRollup.__table__.c
+    selects = [
+        select(c.device_id, c.sensor_type_id, c.value_count, c.value_sum, c.value_sum_err,
+               c.value_min, c.value_max, c.harsh_count, c.crash_count).where(
+            c.device_id.in_(device_ids), c.user_id == user_id, c.sensor_type_id.in_(sensor_type_ids),
+            c.bucket_seconds == seconds, c.bucket_start >= first, c.bucket_start < last,
+        )
+        for seconds, first, last in buckets
+    ]
+    return selects[0] if len(selects) == 1 else union_all(*selects)
+
+def raw_query(device_id, user_id, sensor_type_id, start_ts, end_ts):
+    """Surowe wartości serii w zakresie (measurements + partycje) - do SeriesAggregate.from_values."""
+    series = measurement_store.series_subquery(
+        device_id, user_id, start_ts, end_ts, sensor_type_id=sensor_type_id
+    )
+    return select(series.c.value)
+
+def raw_grouped_query(device_ids, user_id, sensor_type_ids, start_ts, end_ts, min_value=None):
+    """
+    Surowe wartości wielu urządzeń i typów naraz - (device_id, sensor_type_id, value),
+    opcjonalnie tylko value > min_value.
+    """
+    selects = []
+    for table in partitions.tables_for_range(start_ts, end_ts):
+        c = table.c
+        filters = [c.device_id.in_(device_ids), c.user_id == user_id, c.sensor_type_id.in_(sensor_type_ids),
+                   c.timestamp >= start_ts, c.timestamp <= end_ts]
+        if min_value is not None:
+            filters.append(c.value > min_value)
+        selects.append(select(c.device_id, c.sensor_type_id, c.value).where(*filters))
+    return selects[0] if len(selects) == 1 else union_all(*selects)
+
+def aggregate_window_grouped(device_ids, user_id, sensor_type_ids, start_ts, end_ts, min_values=None):
+    """
+    {(device_id, sensor_type_id): SeriesAggregate} - to samo co aggregate_window dla wielu
+    serii naraz: jedno zapytanie GROUP BY po kubełkach i po jednym na każdy surowy brzeg,
+    zamiast osobnych zapytań na urządzenie i typ.
+
+    min_values: {sensor_type_id: próg} - te typy liczone tylko z odczytów > próg, jednym
+    skanem surowych wierszy i archiwum (kubełki progów nie znają).
+    """
+    result = {}
+    if not device_ids:
+        return result
+    min_values = {t: v for t, v in (min_values or {}).items() if t in sensor_type_ids}
+    sensor_type_ids = [t for t in sensor_type_ids if t not in min_values]
+
+    def merge(key, aggregate):
+        current = result.get(key)
+        if current is None:
+            current = result[key] = SeriesAggregate()
+        current.merge(aggregate)
+
+    def add_raw(build):
+        rows = partitions.retry_missing(lambda: db.session.execute(build()).all())
+        for device_id, sensor_type_id, value in rows:
+            current = result.get((device_id, sensor_type_id))
+            if current is None:
+                current = result[(device_id, sensor_type_id)] = SeriesAggregate()
+            current.add(value)
+
+    for type_id, min_value in min_values.items():
+        add_raw(lambda: raw_grouped_query(device_ids, user_id, [type_id], start_ts, end_ts, min_value))
+        for key, aggregate in archive.aggregate_grouped(
+            device_ids, user_id, [type_id], start_ts, end_ts, min_value
+        ).items():
+            merge(key, aggregate)
+    if not sensor_type_ids:
+        return result
+
+    buckets, raw = plan_window(start_ts, end_ts)
+    if buckets:
+        for row in db.session.execute(rollup_query(device_ids, user_id, sensor_type_ids, buckets)):
+            merge((row.device_id, row.sensor_type_id), SeriesAggregate.from_row(row))
+
+    for lo, hi in raw:
+        add_raw(lambda: raw_grouped_query(device_ids, user_id, sensor_type_ids, lo, hi))
+        for key, aggregate in archive.aggregate_grouped(device_ids, user_id, sensor_type_ids, lo, hi).items():
+            merge(key, aggregate)
+    return result
+
+def aggregate_window(device_id, user_id, sensor_type_id, start_ts, end_ts):
+    """
+    SeriesAggregate dla [start_ts, end_ts]: kubełki z measurement_rollups
+    + surowe brzegi (z bazy i z archiwum kolumnowego).
+    """
+    buckets, raw = plan_window(start_ts, end_ts)
+    result = SeriesAggregate()
+    if buckets:
+        for row in db.session.execute(rollup_query([device_id], user_id, [sensor_type_id], buckets)):
+            result.merge(SeriesAggregate.from_row(row))
+    for lo, hi in raw:
+        result.merge(SeriesAggregate.from_values(partitions.retry_missing(
+            lambda: db.session.execute(raw_query(device_id, user_id, sensor_type_id, lo, hi)).scalars().all()
+        )))
+        result.merge(archive.aggregate(device_id, user_id, sensor_type_id, lo, hi))
+    return result
+
+def bucket_rows(device_id, user_id, sensor_type_id, start_ts, end_ts, max_seconds):
+    """
+    Pojedyncze kubełki (nie ich suma) pokrywające [start_ts, end_ts], nie większe
+    niż max_seconds - np. punkty wykresu. Zwraca (wiersze bucket_seconds, bucket_start,
+    value_count, value_sum, value_sum_err, value_min, value_max posortowane po czasie, surowe brzegi [(od, do)]).
+    """
+    buckets, raw = plan_window(start_ts, end_ts, tuple(s for s in ROLLUP_RESOLUTIONS if s <= max_seconds))
+    if not buckets:
+        return [], raw
+
+    c = MeasurementRollup.__table__.c
+    selects = [
+        select(c.bucket_seconds, c.bucket_start, c.value_count, c.value_sum, c.value_sum_err,
+               c.value_min, c.value_max).where(
+            c.device_id == device_id, c.user_id == user_id, c.sensor_type_id == sensor_type_id,
+            c.bucket_seconds == seconds, c.bucket_start >= first, c.bucket_start < last,
+        )
+        for seconds, first, last in buckets
+    ]
+    rows = db.session.execute(selects[0] if len(selects) == 1 else union_all(*selects)).all()
+    rows.sort(key=lambda row: row.bucket_start)
+    return rows, raw
+
+def series_types(device_id, user_id, start_ts=None, end_ts=None):
+    """
+    {sensor_type_id: (pierwsza, ostatnia sekunda)} serii urządzenia z danymi
+    w zakresie - z dziennych kubełków, z dokładnością do doby.
+    """
+    c = MeasurementRollup.__table__.c
+    filters = [c.device_id == device_id, c.user_id == user_id, c.bucket_seconds == 86400]
+    if start_ts is not None:
+        filters.append(c.bucket_start >= bucket_start(start_ts, 86400))
+    if end_ts is not None:
+        filters.append(c.bucket_start <= end_ts)
+    rows = db.session.execute(
+        select(c.sensor_type_id, func.min(c.bucket_start), func.max(c.bucket_start))
+        .where(*filters).group_by(c.sensor_type_id)
+    ).all()
+    return {type_id: (first, last + 86400 - 1) for type_id, first, last in rows}
+
+
+def series_before(sensor_type_id, cutoff_ts):
+    """
+    Serie (device_id, user_id) z danymi sprzed cutoff_ts. Bierzemy je z dziennych
+    kubełków measurement_rollups zamiast skanować pomiary. Wiersze bez właściciela
+    nie mają kubełków - dla nich sprawdzamy pary (device_id, NULL) każdego urządzenia.
+    """
+    rows = db.session.execute(
+        select(MeasurementRollup.device_id, MeasurementRollup.user_id).distinct().where(
+            MeasurementRollup.sensor_type_id == sensor_type_id,
+            MeasurementRollup.bucket_seconds == 86400,
+            MeasurementRollup.bucket_start < cutoff_ts,
+        )
+    ).all()
+    series = [(device_id, user_id) for device_id, user_id in rows]
+    series += [(device_id, None) for (device_id,) in db.session.query(Device.id)]
+    db.session.commit()
+    return series
+
+def rebuild():
+    """
+    Przelicza measurement_rollups z surowych wierszy (czytanych paczkami po REBUILD_BATCH
+    i sumowanych dokładnie w SeriesAggregate) i z plików archiwum kolumnowego. Kubełki sprzed granicy retencji (RETENTION_POLICIES)
+    zostają - ich surowych wierszy już nie ma; granica jest wyrównana do doby,
+    więc żaden kubełek jej nie przecina.
+    """
+    from flask import current_app
+    from app.utils.retention import retention_cutoffs
+
+    table = MeasurementRollup.__table__
+    cutoffs = retention_cutoffs(current_app.config['RETENTION_POLICIES'])
+
+    def recomputed(type_column, time_column):
+        """Warunek: wiersz/kubełek jest w okresie, który przeliczamy."""
+        conditions = [type_column.notin_(list(cutoffs))] if cutoffs else [true()]
+        conditions += [(type_column == type_id) & (time_column >= cutoff) for type_id, cutoff in cutoffs.items()]
+        return or_(*conditions)
+
+    sources = [
+        select(t.c.device_id, t.c.user_id, t.c.sensor_type_id, t.c.timestamp, t.c.value)
+        .where(t.c.user_id.isnot(None), recomputed(t.c.sensor_type_id, t.c.timestamp))
+        for t in partitions.tables_for_range()
+    ]
+
+    # Lista plików archiwum przed transakcją - sesja to osobne połączenie, a nowe
+    # połączenie SQLite nie ustawi PRAGMA, gdy ta transakcja trzyma blokadę zapisu
+    chunks = archive.all_chunks()
+
+    with db.engine.begin() as conn:
+        conn.execute(table.delete().where(recomputed(table.c.sensor_type_id, table.c.bucket_start)))
+        # Paczkami przez UPSERT (jak writer) - kubełek z kilku paczek ma tę samą dokładną sumę
+        for source in sources:
+            result = conn.execution_options(stream_results=True).execute(source)
+            for rows in result.mappings().partitions(REBUILD_BATCH):
+                upsert_buckets(conn, conn.dialect.name, aggregate_rows(rows))
+
+        # Wiersze przeniesione do archiwum - plik po pliku, UPSERT na kubełki z bazy
+        for path, device_id, user_id, type_id in chunks:
+            if user_id is None:
+                continue
+            cutoff = cutoffs.get(type_id)
+            rows = [
+                {"device_id": device_id, "user_id": user_id, "sensor_type_id": type_id,
+                 "timestamp": row.timestamp, "value": row.value}
+                for row in archive.read_chunk(path)
+                if cutoff is None or row.timestamp >= cutoff
+            ]
+            upsert_buckets(conn, conn.dialect.name, aggregate_rows(rows))
+
+        return conn.execute(select(func.count()).select_from(table)).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agregaty measurement_rollups")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="przelicz kubełki z surowych pomiarów (poza okresem usuniętym przez retencję)")
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        if args.rebuild:
+            print(f"✅ Przeliczono {rebuild()} kubełków")
+        for seconds in ROLLUP_RESOLUTIONS:
+            count = db.session.query(func.count()).filter(MeasurementRollup.bucket_seconds == seconds).scalar()
+            print(f"{seconds:>6}s: {count} kubełków")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import threading
+import time
+
+from app import db
+from app.models.sensor_type import SensorType
+
+# Znane typy czujników (z tematów user/<mac>/sensor/<typ>)
+ADXL345 = 'ADXL345'
+MAX6675_NORMAL = 'MAX6675_NORMAL'
+MAX6675_PROFILE = 'MAX6675_PROFILE'
+
+# Stałe id - zakładane przez migrację, dzięki czemu są takie same w każdej bazie
+BUILTIN_SENSOR_TYPES = {ADXL345: 1, MAX6675_NORMAL: 2, MAX6675_PROFILE: 3}
+
+# Długość kolumny sensor_types.name - dłuższej nazwy PostgreSQL nie przyjmie
+MAX_NAME_LENGTH = SensorType.__table__.c.name.type.length
+
+
+def _insert_statement(dialect):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(SensorType).on_conflict_do_nothing(index_elements=[SensorType.name])
+
+
+class SensorTypeCache:
+    """
+    Słownik nazwa typu czujnika <-> małe id całkowite, trzymany w pamięci.
+
+    Używany przy zapisie (writer zamienia nazwę z tematu MQTT na id) i przy
+    odczycie (kontrolery filtrują po id i zamieniają id z powrotem na nazwę).
+    Ingest przyjmuje tylko typy wbudowane, typy z tabeli sensor_types i typy
+    z SENSOR_TYPES_EXTRA - te ostatnie są dopisywane do tabeli przy pierwszym zapisie.
+    Typ dopisany przez inny proces jest doczytywany przy chybieniu
+    (najczęściej co RELOAD_INTERVAL s, żeby nieznane id nie odpytywały bazy za każdym razem).
+    """
+
+    RELOAD_INTERVAL = 5.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = dict(BUILTIN_SENSOR_TYPES)
+        self._names = {v: k for k, v in BUILTIN_SENSOR_TYPES.items()}
+        self._extra = frozenset()
+        self._loaded_at = None
+
+    def configure(self, app):
+        """Typy dopuszczone konfiguracją i słownik z bazy (wymaga app_context)."""
+        self._extra = frozenset(
+            name for name in app.config['SENSOR_TYPES_EXTRA'] if self.valid_name(name)
+        )
+        self._load()
+
+    def _load(self):
+        rows = db.session.query(SensorType.id, SensorType.name).all()
+        with self._lock:
+            for type_id, name in rows:
+                self._ids[name] = type_id
+                self._names[type_id] = name
+            self._loaded_at = time.monotonic()
+
+    def _reload_on_miss(self):
+        """Doczytuje słownik z bazy, jeśli ostatnie ładowanie było dawniej niż RELOAD_INTERVAL s."""
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < self.RELOAD_INTERVAL:
+            return False
+        self._load()
+        return True
+
+    @staticmethod
+    def valid_name(name):
+        return bool(name) and len(name) <= MAX_NAME_LENGTH
+
+    def accepts(self, name):
+        """Czy ingest przyjmuje typ z tematu MQTT - tylko z pamięci, bez zapytania do bazy."""
+        return self.valid_name(name) and (name in self._ids or name in self._extra)
+
+    def get_id(self, name, create=False):
+        """Id typu czujnika (None, gdy nie istnieje, a create=False). Wymaga app_context."""
+        type_id = self._ids.get(name)
+        if type_id is not None:
+            return type_id
+
+        if self._reload_on_miss():
+            type_id = self._ids.get(name)
+            if type_id is not None:
+                return type_id
+
+        if not create:
+            return None
+        if not self.valid_name(name):
+            raise ValueError(f"Nieprawidłowa nazwa typu czujnika: {name[:64]!r}")
+
+        # Nowy typ czujnika - osobna transakcja, żeby nie mieszać z paczką pomiarów.
+        # Równoległy ingest może dopisać ten sam typ: konflikt pomijamy i czytamy id ponownie.
+        with db.engine.begin() as conn:
+            conn.execute(_insert_statement(conn.dialect.name).values(name=name))
+            type_id = conn.execute(
+                db.select(SensorType.id).where(SensorType.name == name)
+            ).scalar_one()
+
+        with self._lock:
+            self._ids[name] = type_id
+            self._names[type_id] = name
+        return type_id
+
+    def get_name(self, type_id):
+        name = self._names.get(type_id)
+        if name is None and type_id is not None and self._reload_on_miss():
+            name = self._names.get(type_id)
+        return name
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+sensor_types = SensorTypeCache()
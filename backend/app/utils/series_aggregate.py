@@ -0,0 +1,138 @@
+"""
+Agregat serii pomiarów z możliwością łączenia (liczba, suma, min, max, progi ADXL345).
+
+Wspólny dla measurement_rollups (kubełki), surowych wierszy i archiwum
+(archive.py) - wyniki z różnych źródeł łączy się przez merge().
+
+Suma jest dokładna (części jak w math.fsum), więc nie zależy od tego, w jakiej
+kolejności i w jakich grupach (kubełki, brzegi okna, archiwum) dodano odczyty.
+"""
+import math
+
+import numpy as np
+
+# Progi analyze_acceleration [m/s^2]: ostry manewr (1.25g - 2.5g], zderzenie > 2.5g
+HARSH_MIN = 12.26
+CRASH_MIN = 24.52
+
+
+def _grow(partials, x):
+    """Dokłada x do nienakładających się części sumy (algorytm Shewchuka, jak math.fsum) bez zaokrąglania."""
+    i = 0
+    for y in partials:
+        if abs(x) < abs(y):
+            x, y = y, x
+        hi = x + y
+        lo = y - (hi - x)
+        if lo:
+            partials[i] = lo
+            i += 1
+        x = hi
+    partials[i:] = [x]
+
+
+def _exact_parts(values):
+    """
+    Dokładna suma odczytów jako kilka floatów: kolejne math.fsum z odjętymi już
+    częściami (każda łapie resztę poprzedniej) - pętla w C zamiast _grow na odczyt.
+    """
+    values = list(values)
+    parts = []
+    while True:
+        part = math.fsum(values + [-p for p in parts])
+        if not part:
+            return parts
+        parts.append(part)
+        if not math.isfinite(part):
+            return parts
+
+
+class SeriesAggregate:
+    """
+    Agregat serii pomiarów, który da się łączyć (merge) - kubełek z kubełkiem,
+    kubełki z brzegami okna, urządzenie z urządzeniem.
+
+    total_err: poprawka sumy z measurement_rollups.value_sum_err (suma = total + total_err).
+    """
+
+    def __init__(self, count=0, total=0.0, minimum=None, maximum=None, harsh=0, crash=0, total_err=0.0):
+        self.count = count
+        self.partials = []
+        for part in (total, total_err):
+            if part:
+                _grow(self.partials, part)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.harsh = harsh
+        self.crash = crash
+
+    @classmethod
+    def from_row(cls, row):
+        """Wiersz kubełka z kolumnami value_count, value_sum, value_sum_err, ... (None -> pusty agregat)."""
+        if row is None or not row.value_count:
+            return cls()
+        return cls(
+            int(row.value_count), float(row.value_sum or 0),
+            row.value_min, row.value_max,
+            int(row.harsh_count or 0), int(row.crash_count or 0),
+            float(row.value_sum_err or 0),
+        )
+
+    @classmethod
+    def from_values(cls, values):
+        result = cls()
+        for value in values:
+            result.add(value)
+        return result
+
+    @property
+    def total(self):
+        return math.fsum(self.partials)
+
+    @property
+    def total_err(self):
+        """Reszta sumy, której nie mieści float total - do kolumny value_sum_err."""
+        return math.fsum(self.partials + [-self.total])
+
+    @property
+    def avg(self):
+        return self.total / self.count if self.count else None
+
+    def add(self, value):
+        self.count += 1
+        _grow(self.partials, value)
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+        if HARSH_MIN < value <= CRASH_MIN:
+            self.harsh += 1
+        elif value > CRASH_MIN:
+            self.crash += 1
+
+    def add_array(self, values):
+        """Cała tablica odczytów naraz (np. blok archiwum) - min/max i progi liczone w numpy."""
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size:
+            return
+        self.count += int(values.size)
+        for part in _exact_parts(values.tolist()):
+            _grow(self.partials, part)
+        low, high = float(values.min()), float(values.max())
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+        self.harsh += int(np.count_nonzero((values > HARSH_MIN) & (values <= CRASH_MIN)))
+        self.crash += int(np.count_nonzero(values > CRASH_MIN))
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        if not self.count:
+            self.minimum, self.maximum = other.minimum, other.maximum
+        else:
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+        self.count += other.count
+        for part in other.partials:
+            _grow(self.partials, part)
+        self.harsh += other.harsh
+        self.crash += other.crash
+        return self
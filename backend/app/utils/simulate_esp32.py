@@ -1,4 +1,6 @@
 import paho.mqtt.client as mqtt
+import argparse
+import struct
 import time
 import random
 import threading
@@ -19,12 +21,37 @@ DEVICES = [
     "CC1122334455"
 ]
 
+# Format wysyłanych pomiarów (patrz app/utils/payload_parser.py):
+#   single - jeden odczyt na wiadomość "timestamp;wartość" (domyślnie, jak obecne ESP32)
+#   text   - paczka odczytów rozdzielonych nową linią
+#   binary - ramka <BBH (0xA5, wersja 1, N) + N x uint32 timestamp + N x float32 wartość
+FRAME_FORMAT = "single"
+
+# Częstotliwość próbkowania ADXL345 w trybie paczek (Hz)
+ADXL_RATE_HZ = 20
+
+BINARY_MAGIC = 0xA5
+BINARY_VERSION = 1
+
+def encode_frame(readings, frame_format):
+    if frame_format == "binary":
+        count = len(readings)
+        return (struct.pack('<BBH', BINARY_MAGIC, BINARY_VERSION, count)
+                + struct.pack(f'<{count}I', *[ts for ts, _ in readings])
+                + struct.pack(f'<{count}f', *[value for _, value in readings]))
+    return "\n".join(f"{ts};{value:.2f}" for ts, value in readings)
+
 class SimulatedESP32(threading.Thread):
-    def __init__(self, mac_address, username):
+    def __init__(self, mac_address, username, frame_format=FRAME_FORMAT, adxl_rate=ADXL_RATE_HZ):
         super().__init__()
         self.mac = mac_address
         self.username = username
+        self.frame_format = frame_format
+        self.adxl_rate = adxl_rate
         self.running = True
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.readings_sent = 0
         self.client = mqtt.Client(client_id=f"sim_{mac_address}")
         self.client.on_connect = self.on_connect
         
@@ -52,6 +79,10 @@ class SimulatedESP32(threading.Thread):
             # Czekamy chwilę na nawiązanie połączenia, żeby on_connect zdążył zadziałać
             time.sleep(1) 
             
+            if self.frame_format != "single":
+                self.run_batched()
+                return
+
             while self.running:
                 # 1. Symulacja ADXL
                 val_adxl = random.uniform(0.0, 5.0)
@@ -73,6 +104,28 @@ class SimulatedESP32(threading.Thread):
             self.client.loop_stop()
             self.client.disconnect()
 
+    def run_batched(self):
+        """ADXL próbkowany adxl_rate razy na sekundę, wysyłany paczką co ~2-3 s."""
+        while self.running:
+            window = random.uniform(2, 3)
+            samples = int(window * self.adxl_rate)
+            now = int(time.time())
+
+            adxl = [(now + i // self.adxl_rate, random.uniform(0.0, 5.0)) for i in range(samples)]
+            self.publish_frame("ADXL345", adxl)
+            self.publish_frame("MAX6675_NORMAL", [(now, random.uniform(20.0, 30.0))])
+            self.publish_frame("MAX6675_PROFILE", [(now, random.uniform(100.0, 200.0))])
+
+            time.sleep(window)
+
+    def publish_frame(self, sensor_type, readings):
+        topic = f"{self.username}/{self.mac}/sensor/{sensor_type}"
+        payload = encode_frame(readings, self.frame_format)
+
+        self.client.publish(topic, payload)
+        self.count_sent(payload, len(readings))
+        print(f"[{self.mac}] 📤 {sensor_type.upper()}: {len(readings)} odczytów ({self.frame_format}, {len(payload)} B)")
+
     def publish_measurement(self, sensor_type, value):
         topic = f"{self.username}/{self.mac}/sensor/{sensor_type}"
         timestamp = int(time.time())
@@ -80,21 +133,33 @@ class SimulatedESP32(threading.Thread):
         payload = f"{timestamp};{value:.2f}"
         
         self.client.publish(topic, payload)
+        self.count_sent(payload, 1)
         print(f"[{self.mac}] 📤 {sensor_type.upper()}: {payload}")
 
+    def count_sent(self, payload, readings):
+        self.messages_sent += 1
+        self.bytes_sent += len(payload)
+        self.readings_sent += readings
+
     def stop(self):
         self.running = False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Symulator urządzeń ESP32")
+    parser.add_argument("--format", choices=["single", "text", "binary"], default=FRAME_FORMAT)
+    parser.add_argument("--adxl-rate", type=int, default=ADXL_RATE_HZ)
+    args = parser.parse_args()
+
     print("🚀 Start symulatora urządzeń ESP32")
     print(f"📡 Broker: {BROKER_HOST}:{BROKER_PORT}")
     print(f"topic root: {USERNAME}/...")
+    print(f"format: {args.format}")
     print("-" * 40)
 
     threads = []
     
     for mac in DEVICES:
-        device = SimulatedESP32(mac, USERNAME)
+        device = SimulatedESP32(mac, USERNAME, args.format, args.adxl_rate)
         device.start()
         threads.append(device)
 
@@ -107,4 +172,11 @@ if __name__ == "__main__":
             device.stop()
         for device in threads:
             device.join()
+
+        messages = sum(d.messages_sent for d in threads)
+        sent_bytes = sum(d.bytes_sent for d in threads)
+        readings = sum(d.readings_sent for d in threads)
+        if readings:
+            print(f"📊 {readings} odczytów w {messages} wiadomościach, {sent_bytes} B "
+                  f"({sent_bytes / readings:.1f} B/odczyt, {readings / messages:.1f} odczytów/wiadomość)")
         print("✅ Zakończono.")
\ No newline at end of file
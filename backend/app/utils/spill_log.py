@@ -0,0 +1,221 @@
+import json
+import math
+import os
+import threading
+from datetime import datetime
+
+
+class SpillLog:
+    """
+    Plik append-only na wiadomości, które nie zmieściły się w kolejce writera
+    (albo których nie udało się zapisać do bazy).
+
+    Każda wiadomość to jedna linia JSON. Pozycja odczytu (offset) jest
+    trzymana w pliku obok (<plik>.offset), więc po restarcie odtwarzanie
+    zaczyna się tam, gdzie skończyło. Po odtworzeniu całości oba pliki są
+    czyszczone.
+
+    Gdy odtworzona paczka zapisze się tylko w części, niezapisana reszta
+    (head) trafia do pliku offsetu, w kolejnych liniach za samym offsetem -
+    jednym atomowym zapisem, razem z przesunięciem offsetu. read() zwraca ją
+    przed dalszą częścią WAL, więc kolejność odtwarzania się nie zmienia.
+
+    fsync=True: append() wraca dopiero po os.fsync, więc wiadomość zgłoszona jako
+    wylana na dysk przetrwa awarię zasilania (kosztem fsync na każdą wylaną
+    wiadomość). fsync=False: zapis tylko do cache systemu - szybciej przy długiej
+    awarii bazy, ale po utracie zasilania może zniknąć końcówka WAL.
+    """
+
+    RECOVER_CHUNK = 64 * 1024
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self.offset_path = path + ".offset"
+        self._lock = threading.Lock()
+        self.head = []  # zakodowane linie do odtworzenia przed offsetem
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._recover()
+        self._file = open(self.path, "ab")
+
+        self.spilled_messages = 0
+        self.spilled_bytes = 0
+        self.replayed_messages = 0
+
+    def _recover(self):
+        """Odcina niedokończoną ostatnią linię (np. po awarii w trakcie zapisu)."""
+        self.offset = 0
+        if not os.path.exists(self.path):
+            return
+
+        # Od końca pliku, kawałkami - po długiej awarii WAL może mieć gigabajty
+        with open(self.path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                start = max(end - self.RECOVER_CHUNK, 0)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end != size:
+                f.truncate(end)
+
+        if os.path.exists(self.offset_path):
+            with open(self.offset_path, "rb") as f:
+                lines = f.read().splitlines(keepends=True)
+            if lines:
+                self.offset = min(int(lines[0].strip() or 0), end)
+                self.head = lines[1:]
+
+    @property
+    def pending_bytes(self):
+        with self._lock:
+            return self._file.tell() - self.offset + sum(len(line) for line in self.head)
+
+    def has_pending(self):
+        return self.pending_bytes > 0
+
+    def append(self, items, only_if_pending=False):
+        """
+        Dopisuje wiadomości na koniec pliku.
+        only_if_pending=True: dopisuje tylko, gdy w pliku są jeszcze nieodtworzone
+        dane (żeby zachować kolejność względem tego, co już wylało się na dysk).
+        """
+        with self._lock:
+            if only_if_pending and self._file.tell() == self.offset and not self.head:
+                return False
+
+            data = b"".join(self._encode(item) for item in items)
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.spilled_messages += len(items)
+            self.spilled_bytes += len(data)
+            return True
+
+    def read(self, max_rows):
+        """
+        Zwraca (wiadomości, pozycja) - co najmniej jedną wiadomość, jeśli są dane.
+        Pozycję (linie z head, offset w pliku) przekazuje się do commit().
+        """
+        with self._lock:
+            end = self._file.tell()
+            offset = self.offset
+            head = list(self.head)
+
+        items = []
+        rows = 0
+        for line in head:
+            if rows >= max_rows:
+                return items, (len(items), offset)
+            item = self._decode(line)
+            items.append(item)
+            rows += len(item[3])
+        used = len(items)
+
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while offset < end and rows < max_rows:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                item = self._decode(line)
+                items.append(item)
+                rows += len(item[3])
+
+        return items, (used, offset)
+
+    def commit(self, position, messages, remainder=()):
+        """
+        Potwierdza odtworzenie danych do pozycji z read(); po całości czyści plik.
+        remainder: niezapisane wiadomości z odtworzonej paczki - zostają na początku
+        kolejki odtwarzania (przed resztą WAL), a nie na jej końcu.
+        """
+        used, offset = position
+        with self._lock:
+            self.replayed_messages += messages
+            self.head = [self._encode(item) for item in remainder] + self.head[used:]
+            self.offset = offset
+            self._save_offset()
+            if offset >= self._file.tell():
+                # Offset na końcu pliku jest już zapisany, więc awaria przed truncate
+                # nie odtworzy całości drugi raz
+                self._file.truncate(0)
+                self._file.seek(0)
+                self.offset = 0
+                self._save_offset()
+
+    def _save_offset(self):
+        tmp_path = self.offset_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(str(self.offset).encode("ascii") + b"\n" + b"".join(self.head))
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.offset_path)
+
+    def stats(self):
+        return {
+            "spill_pending_bytes": self.pending_bytes,
+            "spilled_messages": self.spilled_messages,
+            "spilled_bytes": self.spilled_bytes,
+            "replayed_messages": self.replayed_messages,
+        }
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    @staticmethod
+    def _encode(item):
+        device_id, user_id, sensor_type, readings, _, received_at = item
+        record = [device_id, user_id, sensor_type, readings, received_at.isoformat()]
+        return json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+
+    @staticmethod
+    def _decode(line):
+        device_id, user_id, sensor_type, readings, received_at = json.loads(line)
+        return (device_id, user_id, sensor_type, [tuple(r) for r in readings],
+                None, datetime.fromisoformat(received_at))
+
+
+class DeadLetterLog:
+    """
+    Odczyty, których baza nie przyjmie przy żadnej próbie (błąd danych, np. NOT NULL
+    albo liczba poza zakresem kolumny) - jedna linia JSON na odczyt, razem z błędem.
+    Plik tylko do dopisywania i ręcznego przejrzenia; writer go nie odtwarza.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.rows = 0
+
+    def append(self, item, error):
+        device_id, user_id, sensor_type, readings, _, received_at = item
+        reason = str(error).splitlines()[0][:500]
+        data = "".join(json.dumps({
+            "device_id": device_id,
+            "user_id": user_id,
+            "sensor_type": sensor_type,
+            "timestamp": timestamp if isinstance(timestamp, int) else repr(timestamp),
+            # NaN/inf nie mają zapisu w JSON
+            "value": value if isinstance(value, (int, float)) and math.isfinite(value) else repr(value),
+            "received_at": received_at.isoformat(),
+            "error": reason,
+        }, separators=(",", ":")) + "\n" for timestamp, value in readings)
+
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(data)
+            self.rows += len(readings)
+
+    def stats(self):
+        return {"dead_letter_rows": self.rows}
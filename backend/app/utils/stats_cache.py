@@ -0,0 +1,140 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class StatsCache:
+    """
+    Wyniki analyze_acceleration / analyze_engine_temperature / analyze_distribution trzymane w pamięci
+    procesu API: LRU na STATS_CACHE_SIZE wpisów, każdy najwyżej STATS_CACHE_TTL sekund.
+
+    Klucz: (rodzaj, device_id, user_id, start_ts, end_ts, parametry np. min_temp albo bins).
+    Writer po każdej zapisanej paczce woła invalidate_rows(rows) - znikają wpisy
+    urządzenia i typu czujnika, których okno obejmuje nowe odczyty. TTL zabezpiecza
+    przypadek, gdy ingest działa w innym procesie (ingest_workers.py).
+
+    Liczenie wyniku trwa, a writer może w tym czasie zapisać i unieważnić nowe
+    odczyty - wtedy put() zapamiętałby wynik sprzed zapisu na cały TTL. Dlatego
+    invalidate_rows() podbija licznik generacji urządzenia, żądanie odczytuje go
+    przez generation() przed liczeniem, a put() pomija wpis, jeśli licznik się zmienił.
+
+    Każdy wpis ma ETag (skrót wyniku), więc przeglądarka z If-None-Match
+    dostaje 304 bez ponownego liczenia wyniku.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # klucz -> (wynik, etag, wygasa, sensor_type_id)
+        self._by_device = {}  # device_id -> klucze wpisów
+        self._generations = {}  # device_id -> liczba unieważnień
+        self.max_size = 1024
+        self.ttl = 300.0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    def configure(self, app):
+        self.max_size = app.config['STATS_CACHE_SIZE']
+        self.ttl = app.config['STATS_CACHE_TTL']
+
+    @staticmethod
+    def make_etag(value):
+        payload = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha1(payload).hexdigest()[:24]
+
+    def get(self, key):
+        """(wynik, etag) albo None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] <= time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def generation(self, device_id):
+        """Licznik unieważnień urządzenia - odczytać przed liczeniem wyniku i przekazać do put()."""
+        with self._lock:
+            return self._generations.get(device_id, 0)
+
+    def put(self, key, sensor_type_id, value, generation=None):
+        """
+        Zapamiętuje wynik; zwraca jego ETag. Z podaną generacją wynik nie trafia
+        do pamięci, jeśli writer unieważnił urządzenie w trakcie jego liczenia.
+        """
+        etag = self.make_etag(value)
+        if self.max_size <= 0:
+            return etag
+        with self._lock:
+            if generation is not None and self._generations.get(key[1], 0) != generation:
+                self.stale_puts += 1
+                return etag
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, etag, time.monotonic() + self.ttl, sensor_type_id)
+            self._by_device.setdefault(key[1], set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+        return etag
+
+    def invalidate_rows(self, rows):
+        """Usuwa wpisy, których okno obejmuje któryś z nowo zapisanych wierszy (słowniki writera)."""
+        spans = {}
+        for row in rows:
+            key = (row["device_id"], row["sensor_type_id"])
+            span = spans.get(key)
+            if span is None:
+                spans[key] = [row["timestamp"], row["timestamp"]]
+            else:
+                span[0] = min(span[0], row["timestamp"])
+                span[1] = max(span[1], row["timestamp"])
+
+        with self._lock:
+            for device_id, _ in spans:
+                self._generations[device_id] = self._generations.get(device_id, 0) + 1
+            if not self._entries:
+                return 0
+            removed = 0
+            for (device_id, sensor_type_id), (first, last) in spans.items():
+                for key in list(self._by_device.get(device_id, ())):
+                    _, _, start_ts, end_ts = key[1:5]
+                    if self._entries[key][3] == sensor_type_id and start_ts <= last and end_ts >= first:
+                        self._remove(key)
+                        removed += 1
+            self.invalidations += removed
+            return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_device.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._by_device.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_device[key[1]]
+
+
+stats_cache = StatsCache()
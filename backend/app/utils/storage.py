@@ -0,0 +1,19 @@
+from sqlalchemy import event
+
+def init_app(app, engine):
+    """
+    Ustawia PRAGMA z profilu STORAGE_PROFILE na każdym nowym połączeniu SQLite.
+    Dla innych baz (PostgreSQL) profil działa tylko przez SQLALCHEMY_ENGINE_OPTIONS.
+    """
+    pragmas = app.config['SQLITE_PRAGMAS']
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    print(f"🗄️ Profil bazy: {app.config['STORAGE_PROFILE']} ({', '.join(f'{k}={v}' for k, v in pragmas.items())})")
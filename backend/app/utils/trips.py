@@ -0,0 +1,409 @@
+"""
+Podział odczytów urządzenia na jazdy (tabela trips) i ich podsumowania.
+
+Jazda kończy się, gdy:
+  - między kolejnymi odczytami jest przerwa dłuższa niż TRIP_GAP_SECONDS
+    (ESP32 zasilany z auta przestaje nadawać po zgaszeniu silnika),
+  - silnik stygnie: temperatura MAX6675_NORMAL spada poniżej TRIP_ENGINE_OFF_TEMP
+    po tym, jak w tej jeździe osiągnęła TRIP_ENGINE_ON_TEMP. Urządzenie może
+    nadawać dalej - odczyty z postoju nie należą do żadnej jazdy, a nowa jazda
+    zaczyna się, gdy temperatura wzrośnie o TRIP_RESTART_RISE ponad minimum
+    z postoju (ponowny rozruch) albo po przerwie.
+Jazdy krótsze niż TRIP_MIN_SECONDS są pomijane.
+
+Writer w tej samej transakcji co INSERT surowych wierszy przepuszcza je przez
+TripSegmenter (apply_rows). Stan między paczkami (ostatni odczyt, otwarta jazda,
+postój) leży w trip_states, więc nic nie jest skanowane wstecz. Odczyt stanu
+i zapis nowego to read-modify-write, więc kilka procesów ingestu (ingest_workers.py
+w trybie shared dostaje odczyty jednego urządzenia w różnych procesach) musi
+zapisywać serię po kolei: na PostgreSQL apply_rows bierze blokadę serii do końca
+transakcji (_lock_series), na SQLite writer trzyma już blokadę zapisu bazy po
+INSERT pomiarów. Odczyty spóźnione sprzed otwartej jazdy są doliczane do
+zamkniętej jazdy, w której zakresie leżą (granice jazd się nie zmieniają).
+
+Przeliczenie od nowa (np. po zmianie progów) to jeden przebieg po posortowanych
+odczytach każdej serii (measurement_store.iter_rows: tabele, partycje, archiwum)
+ze stałą pamięcią - jazdy są zapisywane paczkami:
+  python -m app.utils.trips --rebuild
+"""
+import argparse
+from bisect import bisect_right
+
+from flask import current_app
+from sqlalchemy import and_, bindparam, select, text
+
+from app import db
+from app.models.measurement_rollup import MeasurementRollup
+from app.models.trip import Trip, TripState
+from app.utils import measurement_store
+from app.utils.sensor_types import sensor_types, ADXL345, MAX6675_NORMAL
+from app.utils.series_aggregate import HARSH_MIN, CRASH_MIN
+
+_TRIP_KEY = ("device_id", "user_id", "start_ts")
+_STATE_KEY = ("device_id", "user_id")
+
+
+class TripSummary:
+    """Podsumowanie jednej jazdy - liczone odczyt po odczycie."""
+
+    def __init__(self, start_ts, end_ts=None, closed=False, accel_count=0, accel_max=None,
+                 harsh_count=0, crash_count=0, temp_count=0, temp_sum=0.0, temp_max=None):
+        self.start_ts = start_ts
+        self.end_ts = start_ts if end_ts is None else end_ts
+        self.closed = closed
+        self.accel_count = accel_count
+        self.accel_max = accel_max
+        self.harsh_count = harsh_count
+        self.crash_count = crash_count
+        self.temp_count = temp_count
+        self.temp_sum = temp_sum
+        self.temp_max = temp_max
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row.start_ts, row.end_ts, row.closed, row.accel_count, row.accel_max,
+                   row.harsh_count, row.crash_count, row.temp_count, row.temp_sum, row.temp_max)
+
+    @property
+    def duration(self):
+        return self.end_ts - self.start_ts
+
+    def add(self, ts, is_accel, value):
+        self.end_ts = max(self.end_ts, ts)
+        if is_accel:
+            self.accel_count += 1
+            self.accel_max = value if self.accel_max is None else max(self.accel_max, value)
+            if HARSH_MIN < value <= CRASH_MIN:
+                self.harsh_count += 1
+            elif value > CRASH_MIN:
+                self.crash_count += 1
+        else:
+            self.temp_count += 1
+            self.temp_sum += value
+            self.temp_max = value if self.temp_max is None else max(self.temp_max, value)
+
+    def values(self, device_id, user_id):
+        """Wiersz tabeli trips."""
+        return {
+            "device_id": device_id, "user_id": user_id, "start_ts": self.start_ts,
+            "end_ts": self.end_ts, "closed": self.closed,
+            "accel_count": self.accel_count, "accel_max": self.accel_max,
+            "harsh_count": self.harsh_count, "crash_count": self.crash_count,
+            "temp_count": self.temp_count, "temp_sum": self.temp_sum, "temp_max": self.temp_max,
+        }
+
+
+class TripSegmenter:
+    """
+    Automat dzielący posortowane po czasie odczyty jednej serii na jazdy.
+    feed() zwraca jazdę zakończoną przez dany odczyt (albo None); stan da się
+    zapisać (state) i odtworzyć (restore) między paczkami writera.
+    """
+
+    def __init__(self, accel_type_id, temp_type_id, gap_seconds, engine_on_temp, engine_off_temp, restart_rise):
+        self.accel_type_id = accel_type_id
+        self.temp_type_id = temp_type_id
+        self.gap_seconds = gap_seconds
+        self.engine_on_temp = engine_on_temp
+        self.engine_off_temp = engine_off_temp
+        self.restart_rise = restart_rise
+
+        self.last_ts = None
+        self.trip = None
+        self.engine_hot = False
+        self.parked_min_temp = None  # postój ze zgaszonym silnikiem (urządzenie nadaje dalej)
+        self.late = []  # spóźnione odczyty sprzed otwartej jazdy: (ts, czy ADXL345, wartość)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            sensor_types.get_id(ADXL345), sensor_types.get_id(MAX6675_NORMAL),
+            config['TRIP_GAP_SECONDS'], config['TRIP_ENGINE_ON_TEMP'],
+            config['TRIP_ENGINE_OFF_TEMP'], config['TRIP_RESTART_RISE'],
+        )
+
+    def restore(self, last_ts, trip, engine_hot, parked_min_temp):
+        self.last_ts, self.trip = last_ts, trip
+        self.engine_hot, self.parked_min_temp = engine_hot, parked_min_temp
+        return self
+
+    def state(self, device_id, user_id):
+        """Wiersz tabeli trip_states."""
+        return {
+            "device_id": device_id, "user_id": user_id, "last_ts": self.last_ts,
+            "trip_start_ts": self.trip.start_ts if self.trip is not None else None,
+            "engine_hot": self.engine_hot, "parked_min_temp": self.parked_min_temp,
+        }
+
+    def _close(self):
+        trip, self.trip, self.engine_hot = self.trip, None, False
+        if trip is not None:
+            trip.closed = True
+        return trip
+
+    def feed(self, ts, sensor_type_id, value):
+        is_accel = sensor_type_id == self.accel_type_id
+        if not is_accel and sensor_type_id != self.temp_type_id:
+            return None
+
+        if self.last_ts is not None and ts < self.last_ts:
+            # Odczyt spóźniony (bufor ESP32) - nie przesuwa granic jazd
+            if self.trip is not None and ts >= self.trip.start_ts:
+                self.trip.add(ts, is_accel, value)
+            else:
+                self.late.append((ts, is_accel, value))
+            return None
+
+        finished = None
+        if self.last_ts is not None and ts - self.last_ts > self.gap_seconds:
+            finished = self._close()
+            self.parked_min_temp = None
+        self.last_ts = ts
+
+        if self.parked_min_temp is not None:
+            if is_accel:
+                return finished
+            if value < self.parked_min_temp + self.restart_rise:
+                self.parked_min_temp = min(self.parked_min_temp, value)
+                return finished
+            self.parked_min_temp = None  # ponowny rozruch - nowa jazda od tego odczytu
+
+        if not is_accel:
+            if self.engine_hot and value < self.engine_off_temp and self.trip is not None:
+                self.parked_min_temp = value
+                return self._close()
+            if value >= self.engine_on_temp:
+                self.engine_hot = True
+
+        if self.trip is None:
+            self.trip = TripSummary(ts)
+        self.trip.add(ts, is_accel, value)
+        return finished
+
+
+def _upsert(session, table, key_columns, rows):
+    if not rows:
+        return
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    stmt = insert(table)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c[name] for name in key_columns],
+        set_={name: stmt.excluded[name] for name in rows[0] if name not in key_columns},
+    ), rows)
+
+def _delete_trips(session, keys):
+    """
+    keys: [(device_id, user_id, start_ts)]. Jedno zapytanie z parametrami wykonane dla
+    każdego klucza (executemany) - OR po tysiącach jazd z jednej paczki przekracza
+    w SQLite limit głębokości wyrażenia.
+    """
+    if not keys:
+        return
+    c = Trip.__table__.c
+    session.execute(Trip.__table__.delete().where(
+        c.device_id == bindparam("b_device_id"), c.user_id == bindparam("b_user_id"),
+        c.start_ts == bindparam("b_start_ts"),
+    ), [
+        {"b_device_id": device_id, "b_user_id": user_id, "b_start_ts": start_ts}
+        for device_id, user_id, start_ts in keys
+    ])
+
+def _lock_series(session, series_keys):
+    """
+    Blokuje serie (device_id, user_id) do końca transakcji wołającego, zanim ich stan
+    zostanie odczytany. PostgreSQL: pg_advisory_xact_lock w stałej kolejności (bez
+    zakleszczeń między workerami) - obejmuje też serie, które nie mają jeszcze wiersza
+    w trip_states, czego SELECT ... FOR UPDATE by nie zablokował. SQLite zapisuje
+    transakcje po kolei, więc tu nie ma czego blokować.
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    for device_id, user_id in sorted(series_keys):
+        session.execute(text("SELECT pg_advisory_xact_lock(:device_id, :user_id)"),
+                        {"device_id": device_id, "user_id": user_id})
+
+def _load_segmenters(session, series_keys, config):
+    """{(device_id, user_id): TripSegmenter} - stan i otwarte jazdy serii jednym zapytaniem."""
+    s, t = TripState.__table__.c, Trip.__table__.c
+    query = (
+        select(s.device_id, s.user_id, s.last_ts, s.engine_hot, s.parked_min_temp, s.trip_start_ts.label("start_ts"),
+               t.end_ts, t.closed, t.accel_count, t.accel_max, t.harsh_count, t.crash_count,
+               t.temp_count, t.temp_sum, t.temp_max)
+        .select_from(TripState.__table__.outerjoin(Trip.__table__, and_(
+            t.device_id == s.device_id, t.user_id == s.user_id, t.start_ts == s.trip_start_ts,
+        )))
+        .where(s.device_id.in_({device_id for device_id, _ in series_keys}))
+    )
+    segmenters = {}
+    for row in session.execute(query):
+        key = (row.device_id, row.user_id)
+        if key in series_keys:
+            trip = TripSummary.from_row(row) if row.end_ts is not None else None
+            segmenters[key] = TripSegmenter.from_config(config).restore(
+                row.last_ts, trip, row.engine_hot, row.parked_min_temp
+            )
+    return segmenters
+
+def _apply_late(session, device_id, user_id, late):
+    """Spóźnione odczyty -> zamknięte jazdy, w których zakresie leżą (odczyty z przerw są pomijane)."""
+    c = Trip.__table__.c
+    rows = session.execute(
+        select(Trip.__table__).where(
+            c.device_id == device_id, c.user_id == user_id,
+            c.start_ts <= max(ts for ts, _, _ in late), c.end_ts >= min(ts for ts, _, _ in late),
+        ).order_by(c.start_ts)
+    ).all()
+    trips = [TripSummary.from_row(row) for row in rows]
+    starts = [trip.start_ts for trip in trips]
+    touched = {}
+    for ts, is_accel, value in late:
+        index = bisect_right(starts, ts) - 1
+        if index >= 0 and ts <= trips[index].end_ts:
+            trips[index].add(ts, is_accel, value)
+            touched[index] = trips[index]
+    return [trip.values(device_id, user_id) for trip in touched.values()]
+
+def apply_rows(session, rows):
+    """
+    Przepuszcza wiersze paczki writera przez wykrywanie jazd i zapisuje zmienione
+    jazdy oraz stan serii (w transakcji wołającego). Zwraca liczbę zakończonych jazd.
+    """
+    config = current_app.config
+    type_ids = (sensor_types.get_id(ADXL345), sensor_types.get_id(MAX6675_NORMAL))
+    series = {}
+    for row in rows:
+        if row["user_id"] is not None and row["sensor_type_id"] in type_ids:
+            series.setdefault((row["device_id"], row["user_id"]), []).append(row)
+    if not series:
+        return 0
+
+    # Drugi proces ingestu z odczytami tej samej serii czeka tu na nasz commit
+    _lock_series(session, series.keys())
+    segmenters = _load_segmenters(session, series.keys(), config)
+    min_seconds = config['TRIP_MIN_SECONDS']
+    trips, too_short, states = [], [], []
+    finished = 0
+    for (device_id, user_id), series_rows in series.items():
+        segmenter = segmenters.get((device_id, user_id)) or TripSegmenter.from_config(config)
+        series_rows.sort(key=lambda row: (row["timestamp"], row["sensor_type_id"]))
+        for row in series_rows:
+            trip = segmenter.feed(row["timestamp"], row["sensor_type_id"], row["value"])
+            if trip is None:
+                continue
+            if trip.duration < min_seconds:
+                too_short.append((device_id, user_id, trip.start_ts))
+            else:
+                trips.append(trip.values(device_id, user_id))
+                finished += 1
+
+        if segmenter.trip is not None:
+            trips.append(segmenter.trip.values(device_id, user_id))
+        if segmenter.late:
+            trips.extend(_apply_late(session, device_id, user_id, segmenter.late))
+        states.append(segmenter.state(device_id, user_id))
+
+    _delete_trips(session, too_short)
+    _upsert(session, Trip.__table__, _TRIP_KEY, trips)
+    _upsert(session, TripState.__table__, _STATE_KEY, states)
+    return finished
+
+
+def _series(device_id=None):
+    """Serie (device_id, user_id) z danymi - z dziennych kubełków measurement_rollups."""
+    c = MeasurementRollup.__table__.c
+    query = select(c.device_id, c.user_id).distinct().where(c.bucket_seconds == 86400)
+    if device_id is not None:
+        query = query.where(c.device_id == device_id)
+    return db.session.execute(query).all()
+
+def rebuild_series(device_id, user_id, since_ts=None, batch_size=1000):
+    """
+    Jazdy jednej serii od nowa: jeden przebieg po odczytach posortowanych po czasie,
+    zakończone jazdy zapisywane paczkami po batch_size. Jazdy kończące się przed
+    since_ts zostają. Zwraca liczbę zapisanych jazd (bez otwartej).
+    """
+    config = current_app.config
+    min_seconds = config['TRIP_MIN_SECONDS']
+    t = Trip.__table__
+    _lock_series(db.session, [(device_id, user_id)])
+    stale = [t.c.device_id == device_id, t.c.user_id == user_id]
+    if since_ts is not None:
+        stale.append(t.c.end_ts >= since_ts)
+    db.session.execute(t.delete().where(*stale))
+    db.session.execute(TripState.__table__.delete().where(
+        TripState.device_id == device_id, TripState.user_id == user_id
+    ))
+
+    segmenter = TripSegmenter.from_config(config)
+    pending, written = [], 0
+    rows = measurement_store.iter_rows(
+        device_id, user_id, since_ts, None, columns=("timestamp", "value", "sensor_type_id"),
+        batch_size=batch_size,
+    )
+    for row in rows:
+        trip = segmenter.feed(row.timestamp, row.sensor_type_id, row.value)
+        if trip is not None and trip.duration >= min_seconds:
+            pending.append(trip.values(device_id, user_id))
+            if len(pending) >= batch_size:
+                db.session.execute(t.insert(), pending)
+                written += len(pending)
+                pending = []
+
+    written += len(pending)
+    if segmenter.trip is not None:
+        # Ostatnia jazda zostaje otwarta - writer będzie ją przedłużał
+        pending.append(segmenter.trip.values(device_id, user_id))
+    if pending:
+        db.session.execute(t.insert(), pending)
+    if segmenter.last_ts is not None:
+        db.session.execute(TripState.__table__.insert(), [segmenter.state(device_id, user_id)])
+    db.session.commit()
+    return written
+
+def rebuild(device_id=None):
+    """
+    Przelicza jazdy wszystkich serii (albo jednego urządzenia). Przy retencji
+    (RETENTION_POLICIES) zaczyna od najpóźniejszej granicy ADXL345 / MAX6675_NORMAL -
+    wcześniejsze jazdy zostają, bo ich surowych odczytów już nie ma.
+    """
+    from app.utils.retention import retention_cutoffs
+
+    cutoffs = retention_cutoffs(current_app.config['RETENTION_POLICIES'])
+    type_ids = (sensor_types.get_id(ADXL345), sensor_types.get_id(MAX6675_NORMAL))
+    since_ts = max((cutoffs[type_id] for type_id in type_ids if type_id in cutoffs), default=None)
+
+    total = 0
+    for series_device_id, user_id in _series(device_id):
+        total += rebuild_series(series_device_id, user_id, since_ts)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jazdy urządzeń (tabela trips)")
+    parser.add_argument("--rebuild", action="store_true", help="przelicz jazdy z surowych pomiarów")
+    parser.add_argument("--device", help="tylko urządzenie o tym adresie MAC")
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.models.device import Device
+    app = create_app()
+    with app.app_context():
+        device_id = None
+        if args.device:
+            device = Device.query.filter_by(mac_address=args.device).first()
+            if device is None:
+                parser.error(f"Nie znaleziono urządzenia {args.device}")
+            device_id = device.id
+        if args.rebuild:
+            print(f"✅ Przeliczono {rebuild(device_id)} jazd")
+        query = db.session.query(Trip)
+        if device_id is not None:
+            query = query.filter(Trip.device_id == device_id)
+        print(f"🚗 Jazd w bazie: {query.count()} (otwartych: {query.filter(Trip.closed.is_(False)).count()})")
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,194 @@ from datetime import timedelta
 
 load_dotenv()
 
+# Profile bazy danych - wybierane przez STORAGE_PROFILE (domyślnie wg DATABASE_URL)
+STORAGE_PROFILES = {
+    # SQLite w trybie WAL: czytelnicy (API) nie czekają na zapis writera MQTT i odwrotnie,
+    # ale w danej chwili zapisuje tylko jedno połączenie - kolejne czekają do busy_timeout.
+    # synchronous=NORMAL: fsync tylko przy checkpoincie WAL (awaria zasilania może
+    # cofnąć ostatnie transakcje, ale nie uszkodzi bazy).
+    'sqlite': {
+        'engine_options': {
+            'connect_args': {'timeout': 30, 'check_same_thread': False},
+        },
+        'pragmas': {
+            # Tylko dla nowych plików bazy - istniejące przełącza jednorazowo
+            # python -m app.utils.retention --enable-incremental-vacuum
+            'auto_vacuum': 'INCREMENTAL',
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 30000,
+            'cache_size': -65536,        # 64 MB na połączenie
+            'mmap_size': 268435456,      # 256 MB czytane przez mmap
+            'temp_store': 'MEMORY',
+        },
+    },
+    # Domyślne ustawienia SQLite (journal_mode=DELETE): zapis blokuje cały plik także
+    # dla czytelników, każdy commit to fsync. Zostawione do porównań (bench_storage_profiles).
+    'sqlite_default': {
+        'engine_options': {},
+        'pragmas': {},
+    },
+    # PostgreSQL: prawdziwa współbieżność (MVCC, blokady wierszy) - wiele workerów
+    # ingestu i zapytań API równolegle. Pula połączeń na proces: pool_size stałych
+    # + max_overflow tymczasowych; pool_pre_ping odrzuca połączenia zerwane przez serwer.
+    'postgresql': {
+        'engine_options': {
+            'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+            'pool_timeout': 30,
+            'pool_recycle': 1800,
+            'pool_pre_ping': True,
+        },
+        'pragmas': {},
+    },
+}
+
+def _default_storage_profile(database_url):
+    return 'postgresql' if database_url.startswith('postgresql') else 'sqlite'
+
+def _parse_retention_policies(spec):
+    """"ADXL345=14,MAX6675_NORMAL=90" -> {'ADXL345': 14, 'MAX6675_NORMAL': 90} (dni)."""
+    policies = {}
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        name, _, days = part.partition('=')
+        if not days.strip().isdigit() or int(days) < 1:
+            raise ValueError(f"Błędna polityka RETENTION_POLICIES: {part!r} (oczekiwano TYP=DNI)")
+        policies[name.strip()] = int(days)
+    return policies
+
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev_key')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///iot_data.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    STORAGE_PROFILE = os.getenv('STORAGE_PROFILE') or _default_storage_profile(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_ENGINE_OPTIONS = STORAGE_PROFILES[STORAGE_PROFILE]['engine_options']
+    SQLITE_PRAGMAS = STORAGE_PROFILES[STORAGE_PROFILE]['pragmas']
     
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'jwt_dev_key')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
+    # Token tylko w nagłówku Authorization; wyjątek ?jwt=<token> ma tylko /live (EventSource
+    # nie wysyła nagłówków) - w adresie token trafia do logów serwera i proxy
+    JWT_TOKEN_LOCATION = ['headers']
     
+    # Odpowiedzi JSON z wcięciami (wolniej, bez orjson) - niezależnie od trybu debug
+    JSON_PRETTY = os.getenv('JSON_PRETTY', 'false').lower() in ('1', 'true', 'yes')
+
     MQTT_BROKER_HOST = os.getenv('MQTT_BROKER_HOST', 'localhost')
-    MQTT_BROKER_PORT = int(os.getenv('MQTT_BROKER_PORT', 1883))
\ No newline at end of file
+    MQTT_BROKER_PORT = int(os.getenv('MQTT_BROKER_PORT', 1883))
+
+    # Zapis pomiarów z MQTT paczkami (mqtt_worker -> MeasurementWriter)
+    INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 500))
+    INGEST_FLUSH_INTERVAL = float(os.getenv('INGEST_FLUSH_INTERVAL', 1.0))
+    INGEST_STATS_INTERVAL = float(os.getenv('INGEST_STATS_INTERVAL', 60))
+
+    # Pamięć podręczna urządzeń w workerze MQTT: wpisy czytane z bazy ponownie po REGISTRY_TTL s
+    # (procesy ingestu nie dostają invalidate z API), nieznane MAC-i: max wpisów i TTL w s
+    REGISTRY_TTL = float(os.getenv('REGISTRY_TTL', 30))
+    REGISTRY_NEGATIVE_CACHE_SIZE = int(os.getenv('REGISTRY_NEGATIVE_CACHE_SIZE', 10000))
+    REGISTRY_NEGATIVE_TTL = float(os.getenv('REGISTRY_NEGATIVE_TTL', 60))
+
+    # Co ile sekund worker zapisuje zbiorczo devices.last_seen
+    HEARTBEAT_FLUSH_INTERVAL = float(os.getenv('HEARTBEAT_FLUSH_INTERVAL', 10))
+
+    # Ograniczona kolejka writera i zachowanie przy przepełnieniu / awarii bazy
+    # INGEST_OVERFLOW_POLICY: spill | drop_oldest | drop_newest | block
+    INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 10000))
+    INGEST_OVERFLOW_POLICY = os.getenv('INGEST_OVERFLOW_POLICY', 'spill')
+    INGEST_BLOCK_TIMEOUT = float(os.getenv('INGEST_BLOCK_TIMEOUT', 1.0))
+    INGEST_RETRY_INTERVAL = float(os.getenv('INGEST_RETRY_INTERVAL', 5.0))
+    INGEST_SPILL_DIR = os.getenv('INGEST_SPILL_DIR')  # domyślnie folder instance/
+    # fsync po każdym dopisaniu do WAL: wylane wiadomości przetrwają awarię zasilania
+    # (false = szybszy spill, ale po utracie zasilania może zniknąć końcówka WAL)
+    INGEST_SPILL_FSYNC = os.getenv('INGEST_SPILL_FSYNC', 'true').lower() in ('1', 'true', 'yes')
+
+    # Zapytania SQL dłuższe niż ten próg (s) liczone jako wolne w /metrics
+    METRICS_SLOW_QUERY_SECONDS = float(os.getenv('METRICS_SLOW_QUERY_SECONDS', 0.1))
+    # ingest_workers.py: worker n wystawia /metrics na porcie METRICS_WORKER_PORT + n (0 = wyłączone)
+    METRICS_WORKER_PORT = int(os.getenv('METRICS_WORKER_PORT', 0))
+    METRICS_WORKER_HOST = os.getenv('METRICS_WORKER_HOST', '127.0.0.1')
+
+    # Partycjonowanie pomiarów: none | monthly (tabela measurements_pRRRRMM na miesiąc)
+    MEASUREMENT_PARTITIONING = os.getenv('MEASUREMENT_PARTITIONING', 'none')
+    PARTITION_CACHE_TTL = float(os.getenv('PARTITION_CACHE_TTL', 30))
+
+    # Retencja surowych pomiarów (app/utils/retention.py): TYP=DNI po przecinku,
+    # np. "ADXL345=14,MAX6675_NORMAL=90". Typy bez polityki są trzymane bez końca.
+    RETENTION_POLICIES = _parse_retention_policies(os.getenv('RETENTION_POLICIES', ''))
+    RETENTION_INTERVAL = float(os.getenv('RETENTION_INTERVAL', 3600))
+    # Kasowanie małymi transakcjami z przerwą, żeby writer MQTT nie czekał na blokadę zapisu
+    RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', 2000))
+    RETENTION_BATCH_PAUSE = float(os.getenv('RETENTION_BATCH_PAUSE', 0.05))
+    # Ile stron SQLite zwalniać jednym PRAGMA incremental_vacuum
+    RETENTION_VACUUM_PAGES = int(os.getenv('RETENTION_VACUUM_PAGES', 1000))
+
+    # Archiwum kolumnowe (app/utils/archive.py): pomiary starsze niż tyle dni
+    # trafiają do skompresowanych plików w ARCHIVE_DIR (domyślnie instance/archive); 0 = wyłączone
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 0))
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR')
+    ARCHIVE_CHUNK_ROWS = int(os.getenv('ARCHIVE_CHUNK_ROWS', 50000))
+    ARCHIVE_BLOCK_ROWS = int(os.getenv('ARCHIVE_BLOCK_ROWS', 4096))
+    # Kodek bloków nowych plików: zlib albo gorilla (delta-of-delta + XOR - mniejsze pliki
+    # dla wolno zmiennej temperatury, większe dla zaszumionego ADXL345, wolniejsze dekodowanie;
+    # porównanie: python -m app.utils.bench_gorilla)
+    ARCHIVE_CODEC = os.getenv('ARCHIVE_CODEC', 'zlib')
+
+    # Eksport pomiarów (/api/devices/<mac>/measurements/export): wiersze na paczkę
+    # pobieraną z kursora i wysyłaną klientowi
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 5000))
+
+    # Górna granica max_points (punkty na typ czujnika) w /api/devices/<mac>/measurements
+    DOWNSAMPLE_MAX_POINTS = int(os.getenv('DOWNSAMPLE_MAX_POINTS', 5000))
+
+    # Pamięć podręczna wyników /api/stats (app/utils/stats_cache.py): liczba wpisów (LRU)
+    # i maksymalny czas życia - unieważniana przez writer, TTL dla ingestu w innym procesie
+    STATS_CACHE_SIZE = int(os.getenv('STATS_CACHE_SIZE', 1024))
+    STATS_CACHE_TTL = float(os.getenv('STATS_CACHE_TTL', 300))
+
+    # Typy czujników przyjmowane z MQTT oprócz wbudowanych i zapisanych w sensor_types
+    # (lista po przecinku) - dopisywane do sensor_types przy pierwszym zapisie
+    SENSOR_TYPES_EXTRA = [name.strip() for name in os.getenv('SENSOR_TYPES_EXTRA', '').split(',') if name.strip()]
+
+    # Wykrywanie jazd (app/utils/trips.py): przerwa w odczytach [s] kończąca jazdę,
+    # temperatury silnika [°C] - nagrzany / zgaszony (histereza) - wzrost temperatury
+    # na postoju oznaczający ponowny rozruch, minimalny czas jazdy [s]
+    TRIP_GAP_SECONDS = int(os.getenv('TRIP_GAP_SECONDS', 300))
+    TRIP_ENGINE_ON_TEMP = float(os.getenv('TRIP_ENGINE_ON_TEMP', 60))
+    TRIP_ENGINE_OFF_TEMP = float(os.getenv('TRIP_ENGINE_OFF_TEMP', 45))
+    TRIP_RESTART_RISE = float(os.getenv('TRIP_RESTART_RISE', 3))
+    TRIP_MIN_SECONDS = int(os.getenv('TRIP_MIN_SECONDS', 60))
+
+    # Alerty przy ingeście (app/utils/alerts.py): zderzenie (> 24.52 m/s^2), próg
+    # Device.config_threshold i temperatura silnika powyżej ALERT_ENGINE_TEMP_MAX [°C];
+    # ta sama reguła urządzenia najwyżej raz na ALERT_COOLDOWN_SECONDS
+    ALERTS_ENABLED = os.getenv('ALERTS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    ALERT_ENGINE_TEMP_MAX = float(os.getenv('ALERT_ENGINE_TEMP_MAX', 110))
+    ALERT_COOLDOWN_SECONDS = float(os.getenv('ALERT_COOLDOWN_SECONDS', 60))
+    ALERT_QUEUE_SIZE = int(os.getenv('ALERT_QUEUE_SIZE', 1000))
+    ALERT_FLUSH_INTERVAL = float(os.getenv('ALERT_FLUSH_INTERVAL', 1.0))
+
+    # Pomiary na żywo przez SSE (/api/devices/<mac>/live, app/utils/live_hub.py):
+    # bufor odczytów na połączenie, minimalny odstęp zdarzeń (s), keepalive (s)
+    # i limit równoczesnych połączeń w procesie API
+    LIVE_BUFFER_SIZE = int(os.getenv('LIVE_BUFFER_SIZE', 1000))
+    LIVE_COALESCE_INTERVAL = float(os.getenv('LIVE_COALESCE_INTERVAL', 0.25))
+    LIVE_KEEPALIVE_SECONDS = float(os.getenv('LIVE_KEEPALIVE_SECONDS', 15))
+    LIVE_MAX_SUBSCRIBERS = int(os.getenv('LIVE_MAX_SUBSCRIBERS', 1000))
+
+    # Raport floty (app/utils/fleet_report.py, /api/stats/fleet): liczba procesów
+    # (0 = liczba rdzeni), urządzeń i dni na część raportu. Dostęp do /api/stats/fleet
+    # daje users.is_admin (python -m app.utils.admins --grant <użytkownik>)
+    FLEET_REPORT_WORKERS = int(os.getenv('FLEET_REPORT_WORKERS', 0))
+    FLEET_DEVICE_CHUNK = int(os.getenv('FLEET_DEVICE_CHUNK', 50))
+    FLEET_TIME_CHUNK_DAYS = int(os.getenv('FLEET_TIME_CHUNK_DAYS', 7))
+
+    # Rozkłady odczytów (/api/stats/<mac>/distribution): domyślna i maksymalna liczba
+    # przedziałów histogramu, domyślne kwantyle oraz największa przerwa (s) między
+    # odczytami, dla której liczone jest tempo zmian (jerk)
+    DISTRIBUTION_BINS = int(os.getenv('DISTRIBUTION_BINS', 50))
+    DISTRIBUTION_MAX_BINS = int(os.getenv('DISTRIBUTION_MAX_BINS', 1000))
+    DISTRIBUTION_QUANTILES = [float(q) for q in os.getenv('DISTRIBUTION_QUANTILES', '0.5,0.9,0.95,0.99').split(',')]
+    DISTRIBUTION_MAX_GAP = float(os.getenv('DISTRIBUTION_MAX_GAP', 5))
@@ -0,0 +1,91 @@
+"""
+Samodzielny tryb ingestu MQTT w wielu procesach (bez serwera API).
+
+Każdy proces ma własne połączenie z brokerem, własną sesję bazy i własny
+MeasurementWriter, więc ingest nie jest ograniczony do jednego rdzenia.
+
+Tryby:
+  shared - wszystkie procesy subskrybują "$share/<grupa>/user/+/sensor/#",
+           broker (np. Mosquitto >= 1.6, EMQX) rozdziela wiadomości między nie
+  hash   - dla brokerów bez shared subscriptions: każdy proces subskrybuje
+           "user/+/sensor/#" i zapisuje tylko MAC-i, dla których
+           crc32(mac) % N == numer procesu
+
+Użycie:
+  python backend/ingest_workers.py --workers 4
+  python backend/ingest_workers.py --workers 4 --mode hash
+
+Metryki ingestu (/metrics w procesie API) są liczone w procesie, który je
+zlicza - przy METRICS_WORKER_PORT > 0 worker n wystawia własne /metrics
+na porcie METRICS_WORKER_PORT + n.
+
+Przy wielu procesach zapisujących do SQLite zapisy i tak serializują się na
+blokadzie pliku - pełny zysk daje dopiero PostgreSQL (DATABASE_URL).
+"""
+import argparse
+import multiprocessing
+import signal
+
+from mqtt_worker import SENSOR_TOPIC
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def run_worker(index, count, mode, group, qos):
+    # Import w procesie potomnym - każdy proces tworzy własną aplikację i pulę połączeń
+    from app import create_app
+    from app.utils import metrics
+    from mqtt_worker import start_worker
+
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+
+    app = create_app()
+    if app.config['METRICS_WORKER_PORT']:
+        host, port = app.config['METRICS_WORKER_HOST'], app.config['METRICS_WORKER_PORT'] + index
+        metrics.serve(app, port, host)
+        print(f"📈 Worker {index}: metryki na http://{host}:{port}/metrics")
+    try:
+        if mode == "shared":
+            start_worker(app, topic=f"$share/{group}/{SENSOR_TOPIC}", shard_index=index, qos=qos)
+        else:
+            start_worker(app, shard_index=index, shard_count=count, qos=qos)
+    except KeyboardInterrupt:
+        pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Wieloprocesowy ingest MQTT")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--mode", choices=["shared", "hash"], default="shared")
+    parser.add_argument("--group", default="ingest")
+    parser.add_argument("--qos", type=int, choices=[0, 1], default=0)
+    args = parser.parse_args(argv)
+
+    # Tworzymy tabele raz, w procesie nadrzędnym, zanim wystartują workery
+    from app import create_app
+    create_app()
+
+    print(f"🚀 Start {args.workers} workerów MQTT (tryb: {args.mode})")
+
+    processes = []
+    for index in range(args.workers):
+        process = multiprocessing.Process(
+            target=run_worker,
+            args=(index, args.workers, args.mode, args.group, args.qos),
+            name=f"ingest-{index}",
+        )
+        process.start()
+        processes.append(process)
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("\n🛑 Zatrzymywanie workerów...")
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        print("✅ Zakończono.")
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,42 @@
+import struct
+import time
+import zlib
 import paho.mqtt.client as mqtt
-from app import db
-from app.models.device import Device
-from app.models.measurement import Measurement
+from app.utils.measurement_writer import MeasurementWriter
+from app.utils.alerts import AlertDispatcher
+from app.utils.retention import RetentionJob
+from app.utils.device_registry import device_registry
+from app.utils.last_seen import last_seen_tracker
+from app.utils.payload_parser import parse_payload
+from app.utils.sensor_types import sensor_types
+from app.utils import metrics
+
+SENSOR_TOPIC = "user/+/sensor/#"
+
+def shard_of(mac_address, shard_count):
+    """Stabilny (między procesami) numer sharda dla adresu MAC."""
+    return zlib.crc32(mac_address.encode('utf-8')) % shard_count
 
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         print(f"📡 MQTT: Połączono z brokerem (Kod: {rc})")
-        client.subscribe("user/+/sensor/#")
+        client.subscribe(userdata["topic"], qos=userdata["qos"])
     else:
         print(f"❌ MQTT: Błąd połączenia, kod: {rc}")
 
 def on_message(client, userdata, msg):
     """
-    userdata: To jest nasza instancja aplikacji Flask (app), 
-    którą przekazaliśmy w start_worker.
+    userdata: słownik z MeasurementWriter-em i ustawieniami sharda z start_worker.
+    Tutaj tylko parsujemy wiadomość - zapis do bazy robi wątek writera paczkami.
     """
-    app = userdata  # Odbieramy obiekt app
+    # Początek pomiaru opóźnienia alertów
+    received = time.monotonic()
+    writer = userdata["writer"]
+    shard_count = userdata["shard_count"]
     
     try:
         topic = msg.topic
-        payload = msg.payload.decode('utf-8')
+        payload = msg.payload
         
         parts = topic.split('/')
         if len(parts) < 4: return
@@ -27,62 +44,112 @@ def on_message(client, userdata, msg):
         mac_address = parts[1]
         sensor_type = parts[3]
         
-        if payload == "hello": return
-
-        print(f"📨 MQTT Data: {mac_address} [{sensor_type}] -> {payload}")
-
-        with app.app_context():
-            # 1. Urządzenie
-            device = Device.query.filter_by(mac_address=mac_address).first()
-            if not device:
-                print(f"MQTT: Nieznane urządzenie: {mac_address}")
-                return
-            
-            # 2. Aktualizacja czasu
-            device.last_seen = db.func.now()
-            
-            # 3. Pomiary
-            if ";" in payload:
-                try:
-                    ts_str, val_str = payload.split(';', 1)
-
-                    current_owner_id = device.user_id 
-                    
-                    meas = Measurement(
-                        device_id=device.id,
-                        user_id=current_owner_id,
-                        sensor_type=sensor_type,
-                        timestamp=int(ts_str),
-                        value=float(val_str)
-                    )
-                    db.session.add(meas)
-                    db.session.commit()
-                except ValueError:
-                    print(f"❌ MQTT: Błąd formatu: {payload}")
+        if payload == b"hello": return
+
+        # Tryb bez shared subscriptions: każdy worker obsługuje tylko swoje MAC-i
+        if shard_count > 1 and shard_of(mac_address, shard_count) != userdata["shard_index"]:
+            return
+
+        # Nieznany typ nie może założyć wiersza w sensor_types ani nowej etykiety metryk
+        if not sensor_types.accepts(sensor_type):
+            metrics.MQTT_PARSE_ERRORS.inc()
+            print(f"❌ MQTT: Nieznany typ czujnika: {sensor_type[:64]!r}")
+            return
+
+        # Pojedynczy odczyt, paczka tekstowa albo ramka binarna - patrz payload_parser
+        try:
+            readings = parse_payload(payload)
+        except (ValueError, UnicodeDecodeError, struct.error):
+            metrics.MQTT_PARSE_ERRORS.inc()
+            print(f"❌ MQTT: Błąd formatu: {payload[:64]!r}")
+            return
+
+        if not readings: return
+
+        # Urządzenie z pamięci podręcznej - bez zapytania do bazy
+        device = device_registry.lookup(mac_address)
+        if not device:
+            metrics.MQTT_UNKNOWN_DEVICES.inc()
+            return
+
+        metrics.MQTT_MESSAGES.inc(sensor_type)
+        metrics.MQTT_READINGS.inc(sensor_type, amount=len(readings))
+
+        # last_seen tylko w pamięci - do bazy trafia zbiorczo z wątku writera
+        last_seen_tracker.touch(device.device_id)
+
+        # Reguły alertów przed kolejką writera - alert nie czeka na zapis paczki
+        alerts = userdata["alerts"]
+        if alerts is not None:
+            alerts.check(mac_address, device, sensor_type, readings, received)
+
+        writer.submit(device.device_id, device.user_id, sensor_type, readings)
 
     except Exception as e:
         print(f"❌ MQTT Error: {e}")
 
-def start_worker(app):
+def start_worker(app, topic=SENSOR_TOPIC, shard_index=0, shard_count=1, qos=0):
     """
     Funkcja startująca klienta MQTT.
     Przyjmuje instancję 'app' z run.py.
+
+    ingest_workers.py uruchamia ją w wielu procesach: z tematem
+    "$share/<grupa>/user/+/sensor/#" (broker rozdziela wiadomości) albo
+    z shard_count > 1 (każdy proces filtruje MAC-i po hashu).
     """
     broker = app.config['MQTT_BROKER_HOST']
     port = app.config['MQTT_BROKER_PORT']
     
+    # Rejestr MAC -> urządzenie, żeby nie pytać bazy przy każdej wiadomości
+    device_registry.load(app)
+    last_seen_tracker.configure(app)
+    
+    # Osobny wątek zapisujący pomiary do bazy paczkami
+    writer = MeasurementWriter(app, spill_name=f"ingest_spill_{shard_index}.wal")
+    app.extensions['measurement_writer'] = writer
+    writer.start()
+
+    # Archiwizacja i retencja surowych pomiarów - jeden wątek na całą bazę (shard 0)
+    retention = None
+    maintenance = app.config['RETENTION_POLICIES'] or app.config['ARCHIVE_AFTER_DAYS'] > 0
+    if maintenance and shard_index == 0:
+        retention = RetentionJob(app)
+        retention.start()
+    
     client = mqtt.Client()
+
+    # Alerty publikowane przez tego samego klienta MQTT z osobnego wątku
+    alerts = None
+    if app.config['ALERTS_ENABLED']:
+        alerts = AlertDispatcher(app, client)
+        app.extensions['alert_dispatcher'] = alerts
+        alerts.start()
     
-    # Przekazujemy 'app' do klienta, aby był dostępny w on_message
-    client.user_data_set(app) 
+    # Przekazujemy writera i ustawienia do klienta, aby były dostępne w callbackach
+    client.user_data_set({
+        "writer": writer,
+        "alerts": alerts,
+        "topic": topic,
+        "qos": qos,
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+    })
     
     client.on_connect = on_connect
     client.on_message = on_message
     
     try:
-        print(f"🚀 Uruchamianie MQTT Worker ({broker}:{port})...")
+        print(f"🚀 Uruchamianie MQTT Worker ({broker}:{port}, {topic}, shard {shard_index + 1}/{shard_count})...")
         client.connect(broker, port, 60)
         # Uruchamiamy pętlę w nieskończoność (blokuje wątek, w którym jest uruchomiona)
         client.loop_forever()
     except Exception as e:
-        print(f"❌ Nie można połączyć z MQTT: {e}")
\ No newline at end of file
+        print(f"❌ Nie można połączyć z MQTT: {e}")
+    finally:
+        if retention is not None:
+            retention.stop()
+        if alerts is not None:
+            alerts.stop()
+            alerts.join()
+        writer.stop()
+        writer.join()